@@ -1,58 +1,151 @@
-import aiohttp
+import asyncio
 import json
 import logging
-from typing import Dict, List, Optional
-from config import OPENROUTER_API_KEY, OPENROUTER_BASE_URL, OPENROUTER_MODEL, TRAINER_PERSONALITY
+import re
+import time
+from typing import TYPE_CHECKING, Dict, Hashable, List, NamedTuple, Optional, Tuple
+from config import OPENROUTER_API_KEY, OPENROUTER_BASE_URL, PROMPT_CACHE_CONTROL_MODELS
+from metrics import metrics
+from settings import settings
+from prompts import (
+    render_roster, system_prompt, WORKOUT_PLAN, GROUP_WORKOUT, STRUCTURED_PLAN, STRUCTURED_GROUP_PLAN,
+    MOTIVATION, PROGRESS_EMPTY, PROGRESS_ANALYSIS, POOL_MOTIVATION, POOL_SUGGESTION, POOL_RULES,
+    BATCH_SINGLE, BATCH_PACKED, MOTIVATION_TASK
+)
+from usage import SlidingWindowLimiter
+
+# aiohttp, numpy (analytics) и pydantic (workout_plans) импортируются при первом
+# использовании, чтобы не замедлять запуск бота; после старта их прогревает preload_modules
+if TYPE_CHECKING:
+    from workout_plans import WorkoutPlan
 
 logger = logging.getLogger(__name__)
 
+class BatchRequest(NamedTuple):
+    """Элемент пакетной генерации"""
+    key: Hashable  # Идентификатор элемента в результатах (например, user_id)
+    brief: str  # Данные получателя для промпта: имя, уровень, контекст
+    usage_key: Optional[Tuple[int, int]] = None  # (user_id, chat_id) для учета расхода токенов
+
+class BatchResult(NamedTuple):
+    """Результат генерации для одного элемента пакета"""
+    key: Hashable
+    text: Optional[str]
+    error: Optional[str] = None  # Причина неудачи, если text is None
+
+PACKED_ITEM_RE = re.compile(r"^\s*\[(\d+)\]\s*", re.MULTILINE)
+
+def split_packed_response(response: str, count: int) -> Dict[int, str]:
+    """
+    Разбор ответа с несколькими текстами, помеченными [1], [2], ...
+    
+    Returns:
+        Номер элемента (с 0) -> текст; пропущенные и пустые элементы отсутствуют
+    """
+    items = {}
+    matches = list(PACKED_ITEM_RE.finditer(response or ""))
+    for match, next_match in zip(matches, matches[1:] + [None]):
+        index = int(match.group(1)) - 1
+        text = response[match.end():next_match.start() if next_match else len(response)].strip()
+        if 0 <= index < count and text and index not in items:
+            items[index] = text
+    return items
+
 class OpenRouterClient:
-    def __init__(self, api_key: str, base_url: str = OPENROUTER_BASE_URL, model: str = OPENROUTER_MODEL):
+    def __init__(self, api_key: str, base_url: str = OPENROUTER_BASE_URL, model: str = None,
+                 usage_tracker=None):
         self.api_key = api_key
         self.base_url = base_url
-        self.model = model
+        self._model = model  # None - settings.openrouter_model
+        self.usage_tracker = usage_tracker
+        self.in_flight = 0  # Запросов к API в процессе
+        # Общий лимит частоты запросов пакетной генерации (settings.batch_rate_limit)
+        self.batch_limiter = SlidingWindowLimiter(*settings.batch_rate_limit)
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
     
-    async def get_response(self, messages: List[Dict], chat_context: Dict = None) -> Optional[str]:
+    @property
+    def model(self) -> str:
+        return self._model or settings.openrouter_model
+    
+    @property
+    def supports_cache_control(self) -> bool:
+        """Принимает ли модель точки кеширования промпта (cache_control)"""
+        return settings.prompt_cache and self.model.startswith(PROMPT_CACHE_CONTROL_MODELS)
+    
+    @staticmethod
+    def _with_cache_control(message: Dict) -> Dict:
+        """Сообщение с точкой кеширования: префикс промпта до него включительно кешируется"""
+        return {
+            **message,
+            "content": [{"type": "text", "text": message["content"], "cache_control": {"type": "ephemeral"}}]
+        }
+    
+    def _arrange_messages(self, system_message: str, messages: List[Dict]) -> List[Dict]:
+        """
+        Полный список сообщений: системный промпт, история, новый ход
+        
+        Системный промпт и история идут в неизменном порядке и виде, поэтому
+        от хода к ходу префикс запроса совпадает побайтно. Моделям с явным
+        кешированием отмечаются конец системного промпта и конец истории.
+        """
+        full_messages = [{"role": "system", "content": system_message}] + messages
+        if not self.supports_cache_control:
+            return full_messages
+        
+        full_messages[0] = self._with_cache_control(full_messages[0])
+        if len(full_messages) > 2 and isinstance(full_messages[-2]["content"], str):
+            full_messages[-2] = self._with_cache_control(full_messages[-2])
+        return full_messages
+    
+    async def get_response(self, messages: List[Dict], chat_context: Dict = None,
+                           usage_key: Tuple[int, int] = None,
+                           response_format: Dict = None,
+                           usage_keys: List[Tuple[int, int]] = None) -> Optional[str]:
         """
         Получение ответа от ИИ через OpenRouter API
         
         Args:
             messages: Список сообщений в формате OpenAI
-            chat_context: Контекст чата (пользователи, их уровень подготовки и т.д.)
+            chat_context: Контекст чата: готовый блок участников 'roster' (prompts.RosterCache)
+                или список 'users', по которому блок собирается заново
+            usage_key: (user_id, chat_id), на которые записывается расход токенов
+            response_format: Формат ответа (например, {"type": "json_object"})
+            usage_keys: Несколько (user_id, chat_id), между которыми расход делится поровну
+                (упакованные запросы пакетной генерации)
         
         Returns:
             Ответ от ИИ или None в случае ошибки
         """
+        self.in_flight += 1
         try:
-            # Формируем системное сообщение с контекстом
-            system_message = TRAINER_PERSONALITY
-            
+            # Системное сообщение: неизменный префикс и блок участников чата
+            roster = None
             if chat_context:
-                users_info = chat_context.get('users', [])
-                if users_info:
-                    system_message += "\n\nИнформация о пользователях в чате:\n"
-                    for user in users_info:
-                        name = user.get('first_name', 'Пользователь')
-                        level = user.get('fitness_level', 'неизвестен')
-                        system_message += f"- {name}: уровень подготовки - {level}\n"
-                
-                system_message += "\nПомни контекст разговора и используй имена пользователей!"
+                roster = chat_context.get('roster')
+                if roster is None:
+                    roster = render_roster(chat_context.get('users', []))
+            system_message = system_prompt(roster)
             
             # Формируем полный список сообщений
-            full_messages = [{"role": "system", "content": system_message}] + messages
+            full_messages = self._arrange_messages(system_message, messages)
             
             payload = {
                 "model": self.model,
                 "messages": full_messages,
                 "max_tokens": 1000,
                 "temperature": 0.7,
-                "top_p": 0.9
+                "top_p": 0.9,
+                "usage": {"include": True}
             }
+            if response_format:
+                payload["response_format"] = response_format
+            
+            import aiohttp
             
+            started = time.perf_counter()
             async with aiohttp.ClientSession() as session:
                 async with session.post(
                     f"{self.base_url}/chat/completions",
@@ -63,16 +156,41 @@ class OpenRouterClient:
                     if response.status == 200:
                         data = await response.json()
                         content = data['choices'][0]['message']['content']
+                        self._record_metrics(started, "ok", data.get('usage'))
+                        if self.usage_tracker and usage_key:
+                            self.usage_tracker.record(*usage_key, data.get('usage'))
+                        if self.usage_tracker and usage_keys:
+                            share = self._split_usage(data.get('usage'), len(usage_keys))
+                            for key in usage_keys:
+                                self.usage_tracker.record(*key, share)
                         logger.info("Ответ от ИИ получен успешно")
                         return content
                     else:
                         error_text = await response.text()
+                        self._record_metrics(started, str(response.status))
                         logger.error(f"Ошибка API: {response.status} - {error_text}")
                         return None
                         
         except Exception as e:
+            metrics.inc('ai_requests_total', model=self.model, status="exception")
             logger.error(f"Ошибка получения ответа от ИИ: {e}")
             return None
+        finally:
+            self.in_flight -= 1
+    
+    def _record_metrics(self, started: float, status: str, usage: Dict = None):
+        """Запись длительности запроса, статуса и расхода токенов"""
+        if not metrics.enabled:
+            return
+        metrics.observe('ai_request_seconds', time.perf_counter() - started, model=self.model)
+        metrics.inc('ai_requests_total', model=self.model, status=status)
+        if usage:
+            # Провайдер может вернуть null вместо числа - это не повод терять ответ
+            metrics.inc('ai_tokens_total', usage.get('prompt_tokens') or 0, model=self.model, kind="prompt")
+            metrics.inc('ai_tokens_total', usage.get('completion_tokens') or 0, model=self.model, kind="completion")
+            # Токены промпта, прочитанные из кеша провайдера (входят в prompt)
+            cached_tokens = (usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0
+            metrics.inc('ai_tokens_total', cached_tokens, model=self.model, kind="cached")
     
     def format_chat_history(self, history: List[Dict]) -> List[Dict]:
         """
@@ -97,100 +215,146 @@ class OpenRouterClient:
         
         return formatted_messages
     
-    async def generate_workout_plan(self, user_info: Dict, workout_type: str = "individual") -> Optional[str]:
+    async def generate_workout_plan(self, user_info: Dict, workout_type: str = "individual",
+                                    usage_key: Tuple[int, int] = None,
+                                    facts: Dict[str, str] = None) -> Optional[str]:
         """
         Генерация плана тренировок для пользователя
         
         Args:
             user_info: Информация о пользователе
             workout_type: Тип тренировки (individual/group)
+            usage_key: (user_id, chat_id) для учета расхода токенов
+            facts: Факты о пользователе из переписки (facts.py)
         
         Returns:
             План тренировки или None в случае ошибки
         """
         try:
+            from facts import profile_line
+            
             name = user_info.get('first_name', 'Пользователь')
             level = user_info.get('fitness_level', 'beginner')
             goals = user_info.get('goals', 'general_fitness')
             
-            prompt = f"""
-            Составь детальный план тренировки для {name}.
-            
-            Уровень подготовки: {level}
-            Цели: {goals}
-            Тип тренировки: {workout_type}
-            
-            Включи:
-            - Разминку (5-10 минут)
-            - Основную часть тренировки
-            - Заминку (5-10 минут)
-            - Рекомендации по технике
-            - Продолжительность каждого упражнения
-            - Количество подходов и повторений
-            
-            Будь мотивирующим и учитывай уровень подготовки!
-            """
+            prompt = WORKOUT_PLAN.render(name=name, level=level, goals=goals, profile=profile_line(facts),
+                                         workout_type=workout_type)
             
             messages = [{"role": "user", "content": prompt}]
-            return await self.get_response(messages)
+            return await self.get_response(messages, usage_key=usage_key)
             
         except Exception as e:
             logger.error(f"Ошибка генерации плана тренировки: {e}")
             return None
     
-    async def generate_group_workout(self, users: List[Dict], workout_type: str = "group") -> Optional[str]:
+    async def generate_group_workout(self, users: List[Dict], workout_type: str = "group",
+                                     usage_key: Tuple[int, int] = None) -> Optional[str]:
         """
         Генерация групповой тренировки для нескольких пользователей
         
         Args:
             users: Список пользователей
             workout_type: Тип групповой тренировки
+            usage_key: (user_id, chat_id) для учета расхода токенов
         
         Returns:
             План групповой тренировки или None в случае ошибки
         """
         try:
-            users_info = "\n".join([
-                f"- {user.get('first_name', 'Пользователь')} (уровень: {user.get('fitness_level', 'неизвестен')})"
-                for user in users
-            ])
+            from group_planner import cluster_by_level
             
-            prompt = f"""
-            Составь план групповой тренировки для следующих пользователей:
-            {users_info}
+            # Состав по уровням вместо списка всех участников: промпт не растет с размером чата
+            max_names = settings.group_roster_names
+            users_info = "\n".join(
+                f"- {level}: {len(members)} участн. ({', '.join(m.get('first_name') or 'Пользователь' for m in members[:max_names])}"
+                f"{', ...' if len(members) > max_names else ''})"
+                for level, members in cluster_by_level(users).items()
+            )
             
-            Тип тренировки: {workout_type}
+            prompt = GROUP_WORKOUT.render(users_info=users_info, workout_type=workout_type)
             
-            Учти:
-            - Разные уровни подготовки участников
-            - Возможность адаптации упражнений
-            - Взаимную поддержку и мотивацию
-            - Веселую и дружескую атмосферу
+            messages = [{"role": "user", "content": prompt}]
+            return await self.get_response(messages, usage_key=usage_key)
             
-            Включи:
-            - Разминку для всех
-            - Основные упражнения с вариантами сложности
-            - Групповые элементы
-            - Заминку
-            - Рекомендации по взаимодействию
+        except Exception as e:
+            logger.error(f"Ошибка генерации групповой тренировки: {e}")
+            return None
+    
+    async def generate_structured_workout_plan(self, user_info: Dict,
+                                               usage_key: Tuple[int, int] = None,
+                                               facts: Dict[str, str] = None) -> Optional["WorkoutPlan"]:
+        """
+        Генерация плана тренировки в виде компактного JSON
+        
+        Args:
+            user_info: Информация о пользователе
+            usage_key: (user_id, chat_id) для учета расхода токенов
+            facts: Факты о пользователе из переписки (facts.py)
+        
+        Returns:
+            Проверенный план или None, если ответ не получен или не прошел проверку
+        """
+        try:
+            from workout_plans import PLAN_FORMAT_HINT, parse_plan
+            from facts import profile_line
+            
+            name = user_info.get('first_name', 'Пользователь')
+            level = user_info.get('fitness_level', 'beginner')
+            goals = user_info.get('goals', 'general_fitness')
             
-            Сделай тренировку интересной для всех участников!
-            """
+            prompt = STRUCTURED_PLAN.render(name=name, level=level, goals=goals, profile=profile_line(facts),
+                                            format_hint=PLAN_FORMAT_HINT)
             
             messages = [{"role": "user", "content": prompt}]
-            return await self.get_response(messages)
+            response = await self.get_response(messages, usage_key=usage_key,
+                                               response_format={"type": "json_object"})
+            return parse_plan(response)
             
         except Exception as e:
-            logger.error(f"Ошибка генерации групповой тренировки: {e}")
+            logger.error(f"Ошибка генерации JSON-плана тренировки: {e}")
+            return None
+    
+    async def generate_structured_group_workout(self, composition: Dict[str, int],
+                                                usage_key: Tuple[int, int] = None) -> Optional["WorkoutPlan"]:
+        """
+        Генерация общего плана групповой тренировки в виде компактного JSON с вариантами по уровням
+        
+        Args:
+            composition: Число участников каждого уровня (group_planner.composition_counts)
+            usage_key: (user_id, chat_id) для учета расхода токенов
+        
+        Returns:
+            Проверенный план или None, если ответ не получен или не прошел проверку
+        """
+        try:
+            from workout_plans import GROUP_FORMAT_HINT, parse_plan
+            
+            levels = list(composition)
+            group_info = ", ".join(f"{level}: {count}" for level, count in composition.items())
+            
+            prompt = STRUCTURED_GROUP_PLAN.render(
+                group_info=group_info, base_level=levels[0],
+                variant_levels=", ".join(levels[1:]) or "не нужны", format_hint=GROUP_FORMAT_HINT
+            )
+            
+            messages = [{"role": "user", "content": prompt}]
+            response = await self.get_response(messages, usage_key=usage_key,
+                                               response_format={"type": "json_object"})
+            return parse_plan(response)
+            
+        except Exception as e:
+            logger.error(f"Ошибка генерации JSON-плана групповой тренировки: {e}")
             return None
     
-    async def generate_motivational_message(self, user_info: Dict, context: str = "general") -> Optional[str]:
+    async def generate_motivational_message(self, user_info: Dict, context: str = "general",
+                                            usage_key: Tuple[int, int] = None) -> Optional[str]:
         """
         Генерация мотивирующего сообщения
         
         Args:
             user_info: Информация о пользователе
             context: Контекст (после тренировки, утром, вечером и т.д.)
+            usage_key: (user_id, chat_id) для учета расхода токенов
         
         Returns:
             Мотивирующее сообщение или None в случае ошибки
@@ -199,35 +363,26 @@ class OpenRouterClient:
             name = user_info.get('first_name', 'Пользователь')
             level = user_info.get('fitness_level', 'beginner')
             
-            prompt = f"""
-            Напиши мотивирующее сообщение для {name}.
-            
-            Контекст: {context}
-            Уровень подготовки: {level}
-            
-            Сообщение должно быть:
-            - Персонализированным для {name}
-            - Мотивирующим и вдохновляющим
-            - Соответствующим контексту
-            - Дружелюбным и поддерживающим
-            
-            Используй имя пользователя и сделай сообщение личным!
-            """
+            prompt = MOTIVATION.render(name=name, context=context, level=level)
             
             messages = [{"role": "user", "content": prompt}]
-            return await self.get_response(messages)
+            return await self.get_response(messages, usage_key=usage_key)
             
         except Exception as e:
             logger.error(f"Ошибка генерации мотивирующего сообщения: {e}")
             return None
     
-    async def analyze_progress(self, user_info: Dict, progress_data: List[Dict]) -> Optional[str]:
+    async def analyze_progress(self, user_info: Dict, progress_data: List[Dict],
+                               workout_stats: Dict = None,
+                               usage_key: Tuple[int, int] = None) -> Optional[str]:
         """
         Анализ прогресса пользователя
         
         Args:
             user_info: Информация о пользователе
-            progress_data: Данные о прогрессе
+            progress_data: Замеры прогресса, упорядоченные по метрике и дате
+            workout_stats: Статистика тренировок за неделю (get_workout_stats)
+            usage_key: (user_id, chat_id) для учета расхода токенов
         
         Returns:
             Анализ прогресса или None в случае ошибки
@@ -235,36 +390,186 @@ class OpenRouterClient:
         try:
             name = user_info.get('first_name', 'Пользователь')
             
+            workouts_summary = ""
+            if workout_stats and workout_stats.get('total_workouts'):
+                workouts_summary = (
+                    f"Тренировки за неделю: {workout_stats['total_workouts']}, "
+                    f"выполнено {workout_stats['completion_rate']}%"
+                )
+            
             if not progress_data:
-                prompt = f"""
-                {name} еще не начал отслеживать свой прогресс.
-                Напиши мотивирующее сообщение о важности отслеживания прогресса
-                и предложи начать с простых метрик.
-                """
+                prompt = PROGRESS_EMPTY.render(name=name, workouts_summary=workouts_summary)
             else:
-                # Формируем краткую сводку прогресса
-                progress_summary = "\n".join([
-                    f"- {item.get('metric_name', 'Метрика')}: {item.get('metric_value', 'N/A')} ({item.get('date', 'дата')})"
-                    for item in progress_data[-5:]  # Последние 5 записей
-                ])
+                # Компактная числовая сводка вместо сырых записей
+                from analytics import summarize_progress, format_progress_digest
+                progress_summary = format_progress_digest(summarize_progress(progress_data))
                 
-                prompt = f"""
-                Проанализируй прогресс {name}:
-                
-                {progress_summary}
-                
-                Дай:
-                - Оценку прогресса
-                - Рекомендации по улучшению
-                - Мотивирующие слова
-                - Следующие шаги
-                
-                Будь поддерживающим и конструктивным!
-                """
+                prompt = PROGRESS_ANALYSIS.render(
+                    name=name, progress_summary=progress_summary, workouts_summary=workouts_summary
+                )
             
             messages = [{"role": "user", "content": prompt}]
-            return await self.get_response(messages)
+            return await self.get_response(messages, usage_key=usage_key)
             
         except Exception as e:
             logger.error(f"Ошибка анализа прогресса: {e}")
             return None
+    
+    async def generate_pool_items(self, kind: str, level: str, context: str, count: int) -> List[str]:
+        """
+        Пакетная генерация шаблонов для пула сообщений
+        
+        Args:
+            kind: Вид сообщений (motivation/suggestion)
+            level: Уровень подготовки
+            context: Контекст (утро, после кардио и т.д.)
+            count: Количество вариантов
+        
+        Returns:
+            Список шаблонов с плейсхолдером {name} (пустой в случае ошибки)
+        """
+        try:
+            template = POOL_MOTIVATION if kind == "motivation" else POOL_SUGGESTION
+            prompt = f"{template.render(count=count, context=context, level=level)}\n\n{POOL_RULES}"
+            
+            messages = [{"role": "user", "content": prompt}]
+            response = await self.get_response(messages)
+            if not response:
+                return []
+            
+            items = re.split(r"^\s*-{3,}\s*$", response, flags=re.MULTILINE)
+            return [item.strip() for item in items if item.strip()][:count]
+            
+        except Exception as e:
+            logger.error(f"Ошибка генерации пула сообщений: {e}")
+            return []
+    
+    async def _wait_batch_rate(self):
+        """Ожидание места в общем лимите частоты запросов пакетной генерации"""
+        while True:
+            self.batch_limiter.max_requests, self.batch_limiter.window = settings.batch_rate_limit
+            now = time.monotonic()
+            wait = self.batch_limiter.retry_after(0, now)
+            if wait <= 0:
+                self.batch_limiter.hit(0, now)
+                return
+            await asyncio.sleep(wait)
+    
+    @staticmethod
+    def _split_usage(usage: Optional[Dict], parts: int) -> Optional[Dict]:
+        """Доля расхода токенов одного элемента упакованного запроса"""
+        if not usage:
+            return usage
+        return {
+            'prompt_tokens': (usage.get('prompt_tokens') or 0) // parts,
+            'completion_tokens': (usage.get('completion_tokens') or 0) // parts,
+            'cost': (usage.get('cost') or 0.0) / parts,
+        }
+    
+    async def _batch_request(self, prompt: str, usage_keys: List[Optional[Tuple[int, int]]]) -> Optional[str]:
+        """Один запрос пакета с учетом общего лимита частоты"""
+        await self._wait_batch_rate()
+        return await self.get_response(
+            [{"role": "user", "content": prompt}],
+            usage_keys=[usage_key for usage_key in usage_keys if usage_key]
+        )
+    
+    async def _generate_single(self, task: str, request: BatchRequest) -> BatchResult:
+        try:
+            text = await self._batch_request(BATCH_SINGLE.render(task=task, brief=request.brief), [request.usage_key])
+        except Exception as e:
+            logger.error(f"Ошибка генерации элемента пакета {request.key}: {e}")
+            return BatchResult(request.key, None, str(e))
+        if not text:
+            return BatchResult(request.key, None, "нет ответа от ИИ")
+        return BatchResult(request.key, text.strip())
+    
+    async def _generate_pack(self, task: str, pack: List[BatchRequest]) -> List[BatchResult]:
+        """Несколько элементов одним запросом; не разобранные из ответа - по одному"""
+        if len(pack) == 1:
+            return [await self._generate_single(task, pack[0])]
+        
+        briefs = "\n".join(f"[{i + 1}] {request.brief}" for i, request in enumerate(pack))
+        try:
+            response = await self._batch_request(
+                BATCH_PACKED.render(task=task, briefs=briefs), [request.usage_key for request in pack]
+            )
+        except Exception as e:
+            logger.error(f"Ошибка упакованного запроса пакета: {e}")
+            response = None
+        texts = split_packed_response(response, len(pack))
+        
+        results = [BatchResult(request.key, texts[i]) for i, request in enumerate(pack) if i in texts]
+        missing = [request for i, request in enumerate(pack) if i not in texts]
+        if missing:
+            metrics.inc('batch_repacks_total', len(missing))
+            logger.warning(f"В упакованном ответе нет {len(missing)} из {len(pack)} элементов, запрашиваем отдельно")
+            results += await asyncio.gather(*(self._generate_single(task, request) for request in missing))
+        return results
+    
+    async def generate_batch(self, task: str, requests: List[BatchRequest],
+                             pack_size: Optional[int] = None,
+                             concurrency: Optional[int] = None) -> List[BatchResult]:
+        """
+        Пакетная генерация персональных текстов для рассылок
+        
+        Элементы упаковываются по pack_size в один запрос (модель пишет текст
+        для каждого получателя под его номером), запросы выполняются не более
+        concurrency одновременно и подчиняются общему лимиту частоты
+        settings.batch_rate_limit. Элементы, которых не оказалось в
+        упакованном ответе, запрашиваются по одному.
+        
+        Args:
+            task: Задание для модели (одинаковое для всех элементов)
+            requests: Элементы пакета
+            pack_size: Элементов в одном запросе (None - settings.batch_pack_size)
+            concurrency: Одновременных запросов (None - settings.batch_concurrency)
+        
+        Returns:
+            Результаты в порядке requests; у неудачных элементов text = None и указана причина
+        """
+        if not requests:
+            return []
+        pack_size = pack_size or settings.batch_pack_size
+        semaphore = asyncio.Semaphore(concurrency or settings.batch_concurrency)
+        
+        async def run_pack(pack: List[BatchRequest]) -> List[BatchResult]:
+            async with semaphore:
+                return await self._generate_pack(task, pack)
+        
+        packs = [requests[i:i + pack_size] for i in range(0, len(requests), pack_size)]
+        by_key = {}
+        for pack_results in await asyncio.gather(*(run_pack(pack) for pack in packs)):
+            for result in pack_results:
+                by_key[result.key] = result
+        
+        results = [by_key[request.key] for request in requests]
+        ok = sum(1 for result in results if result.text)
+        metrics.inc('batch_items_total', ok, status="ok")
+        metrics.inc('batch_items_total', len(results) - ok, status="failed")
+        logger.info(f"Пакетная генерация: {ok} из {len(results)} элементов, {len(packs)} упакованных запросов")
+        return results
+    
+    async def generate_motivational_batch(self, users: List[Dict], context: str = "general",
+                                          chat_id: Optional[int] = None) -> List[BatchResult]:
+        """
+        Мотивирующие сообщения для многих пользователей (рассылка)
+        
+        Args:
+            users: Профили пользователей (user_id, first_name, fitness_level)
+            context: Контекст рассылки (утро, вечер, после тренировки и т.д.)
+            chat_id: Чат рассылки для учета расхода токенов (None - личные чаты пользователей)
+        
+        Returns:
+            Результаты по user_id в порядке users
+        """
+        requests = [
+            BatchRequest(
+                key=user['user_id'],
+                brief=f"{user.get('first_name') or 'Пользователь'}, уровень подготовки: "
+                      f"{user.get('fitness_level') or 'beginner'}, контекст: {context}",
+                usage_key=(user['user_id'], chat_id if chat_id is not None else user['user_id'])
+            )
+            for user in users
+        ]
+        return await self.generate_batch(MOTIVATION_TASK, requests)
@@ -0,0 +1,147 @@
+"""
+Локальная аналитика прогресса пользователя
+
+Ряды замеров из таблицы progress загружаются в массивы numpy, по каждой
+метрике считаются тренд, скользящее среднее, личный рекорд и плато.
+Компактная числовая сводка уходит в промпт вместо сырых записей.
+"""
+
+import math
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import ANALYTICS_MA_WINDOW, ANALYTICS_PLATEAU_POINTS, ANALYTICS_PLATEAU_TOLERANCE
+
+# Метрики, для которых меньшее значение - лучше
+LOWER_IS_BETTER = ('вес', 'weight', 'время', 'time', 'пульс', 'pulse', 'жир', 'fat', 'талия', 'waist')
+
+
+def lower_is_better(metric_name: str) -> bool:
+    name = metric_name.lower()
+    return any(keyword in name for keyword in LOWER_IS_BETTER)
+
+
+def _to_days(dates: List[str]) -> np.ndarray:
+    """Даты замеров в днях от первого замера (при ошибке разбора - порядковые номера)"""
+    try:
+        parsed = np.array([d[:10] for d in dates], dtype='datetime64[D]')
+        return (parsed - parsed[0]).astype(np.float64)
+    except (TypeError, ValueError):
+        return np.arange(len(dates), dtype=np.float64)
+
+
+def summarize_series(metric_name: str, dates: List[str], values: np.ndarray) -> Dict:
+    """
+    Сводка по одному ряду замеров
+
+    Args:
+        metric_name: Название метрики
+        dates: Даты замеров (по возрастанию)
+        values: Значения замеров
+
+    Returns:
+        Словарь с числовыми характеристиками ряда
+    """
+    days = _to_days(dates)
+    n = len(values)
+    first, last = float(values[0]), float(values[-1])
+    lower = lower_is_better(metric_name)
+
+    # Тренд: наклон линейной регрессии, в единицах метрики за неделю
+    slope = 0.0
+    if n >= 2 and np.ptp(days) > 0:
+        slope = float(np.polyfit(days, values, 1)[0]) * 7
+
+    window = min(ANALYTICS_MA_WINDOW, n)
+    moving_average = np.convolve(values, np.ones(window) / window, mode='valid')
+
+    best_index = int(np.argmin(values) if lower else np.argmax(values))
+    # Рекорд обновлен, если последний замер строго лучше всех предыдущих
+    is_new_record = False
+    if n >= 2:
+        previous = values[:-1]
+        is_new_record = values[-1] < previous.min() if lower else values[-1] > previous.max()
+
+    plateau = False
+    if n >= ANALYTICS_PLATEAU_POINTS:
+        recent = values[-ANALYTICS_PLATEAU_POINTS:]
+        scale = abs(float(recent.mean())) or 1.0
+        plateau = float(np.ptp(recent)) <= ANALYTICS_PLATEAU_TOLERANCE * scale
+
+    return {
+        'metric': metric_name,
+        'count': n,
+        'span_days': int(days[-1]) if n else 0,
+        'first': first,
+        'last': last,
+        'change': last - first,
+        'change_pct': (last - first) / abs(first) * 100 if first else 0.0,
+        'trend_per_week': slope,
+        'moving_average': float(moving_average[-1]),
+        'best': float(values[best_index]),
+        'best_date': dates[best_index],
+        'new_record': bool(is_new_record),
+        'plateau': plateau,
+        'improving': (slope < 0) if lower else (slope > 0),
+    }
+
+
+def summarize_progress(progress_data: List[Dict]) -> List[Dict]:
+    """
+    Сводки по всем метрикам пользователя
+
+    Args:
+        progress_data: Замеры, упорядоченные по метрике и дате (get_user_progress)
+
+    Returns:
+        Список сводок, по одной на метрику
+    """
+    # Пустые (NULL) и бесконечные значения испортили бы тренд, среднее и рекорд
+    progress_data = [item for item in progress_data if _is_finite(item['metric_value'])]
+    if not progress_data:
+        return []
+
+    names = np.array([item['metric_name'] for item in progress_data])
+    values = np.array([item['metric_value'] for item in progress_data], dtype=np.float64)
+    dates = [str(item['date']) for item in progress_data]
+
+    # Границы рядов по метрикам (данные уже упорядочены по metric_name)
+    starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]])
+    ends = np.r_[starts[1:], len(names)]
+
+    return [
+        summarize_series(str(names[start]), dates[start:end], values[start:end])
+        for start, end in zip(starts, ends)
+    ]
+
+
+def _is_finite(value) -> bool:
+    return isinstance(value, (int, float)) and math.isfinite(value)
+
+
+def _fmt(value: float) -> str:
+    return f"{value:.1f}".rstrip('0').rstrip('.')
+
+
+def format_progress_digest(summaries: List[Dict], limit: Optional[int] = None) -> str:
+    """
+    Компактная текстовая сводка для промпта (одна строка на метрику)
+    """
+    lines = []
+    for s in summaries[:limit]:
+        line = (
+            f"- {s['metric']}: {s['count']} замеров за {s['span_days']} дн., "
+            f"сейчас {_fmt(s['last'])} (старт {_fmt(s['first'])}, {s['change']:+.1f} / {s['change_pct']:+.1f}%), "
+            f"тренд {s['trend_per_week']:+.2f}/нед, среднее {_fmt(s['moving_average'])}, "
+            f"рекорд {_fmt(s['best'])} ({s['best_date']})"
+        )
+        flags = []
+        if s['new_record']:
+            flags.append("новый рекорд")
+        if s['plateau']:
+            flags.append("плато")
+        if flags:
+            line += ", " + ", ".join(flags)
+        lines.append(line)
+    return "\n".join(lines)
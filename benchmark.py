@@ -0,0 +1,665 @@
+#!/usr/bin/env python3
+"""
+Офлайн нагрузочный тест бота
+
+Гоняет обработчики FitnessTrainerBot на синтетическом потоке обновлений
+(много чатов, много пользователей, смесь команд) против локального
+фейкового OpenRouter с настраиваемым распределением задержек.
+Не требует ни Telegram-токена, ни API-ключа.
+
+Замеряются две задержки: до возврата обработчика и до ответа - последнего
+сообщения или правки заглушки, которые бот отправил на обновление. Для
+обычных сообщений ответ приходит одним сообщением на весь ход чата, поэтому
+ответом на сообщение считается первый ответ в чате на него или на более
+позднее сообщение. Воркер ждет ответа, прежде чем взять следующее
+обновление. Регрессии проверяются по задержке ответа.
+
+Примеры:
+    python benchmark.py
+    python benchmark.py --chats 50 --users-per-chat 8 --updates 5000 --latency lognormal:0.4:0.5
+    python benchmark.py --save-baseline
+    python benchmark.py --cold-start-runs 10
+    python benchmark.py --debounce 1.5
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+# aiohttp импортируется внутри FakeOpenRouter: дочерний процесс замера холодного
+# старта не должен загружать его раньше бота
+
+BASELINE_PATH = "benchmark_baseline.json"
+
+# Значения параметров прогона, которых нет в старых базовых результатах
+CONFIG_DEFAULTS = {'debounce': 0.0}
+
+# Доли типов обновлений в синтетическом потоке
+DEFAULT_MIX = {
+    'message': 0.55,
+    'workout': 0.10,
+    'motivation': 0.10,
+    'progress': 0.05,
+    'group_workout': 0.05,
+    'help': 0.05,
+    'profile': 0.05,
+    'level': 0.05,
+    'stats': 0.05,
+    'last_plan': 0.05,
+}
+
+
+class LatencyModel:
+    """
+    Распределение задержек фейкового API
+
+    Формат спецификации:
+        const:0.5              - всегда 0.5 с
+        uniform:0.1:0.9        - равномерно от 0.1 до 0.9 с
+        exp:0.5                - экспоненциальное со средним 0.5 с
+        lognormal:0.5:0.4      - логнормальное с медианой 0.5 с и sigma 0.4
+    """
+
+    def __init__(self, spec: str, seed: int = 0):
+        self.spec = spec
+        self.rng = random.Random(seed)
+        kind, *params = spec.split(":")
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        if kind not in ("const", "uniform", "exp", "lognormal"):
+            raise ValueError(f"Неизвестное распределение задержек: {spec}")
+
+    def sample(self) -> float:
+        if self.kind == "const":
+            return self.params[0]
+        if self.kind == "uniform":
+            return self.rng.uniform(self.params[0], self.params[1])
+        if self.kind == "exp":
+            return self.rng.expovariate(1 / self.params[0])
+        median, sigma = self.params
+        return median * self.rng.lognormvariate(0, sigma)
+
+
+FAKE_JSON_PLAN = json.dumps({
+    "title": "Круговая тренировка", "level": "beginner", "duration_min": 30,
+    "warmup": [{"name": "Суставная разминка", "duration_sec": 300}],
+    "blocks": [{"title": "Основная часть", "rounds": 3, "exercises": [
+        {"name": "Приседания", "sets": 1, "reps": "15", "rest_sec": 30},
+        {"name": "Отжимания", "sets": 1, "reps": "10", "rest_sec": 30},
+        {"name": "Планка", "duration_sec": 40}
+    ]}],
+    "cooldown": [{"name": "Растяжка", "duration_sec": 300}],
+    "tips": ["Следи за дыханием"]
+}, ensure_ascii=False, separators=(',', ':'))
+
+
+class FakeOpenRouter:
+    """Локальный сервер, имитирующий /chat/completions OpenRouter"""
+
+    def __init__(self, latency: LatencyModel, reply: str = "Отличная работа! Продолжай в том же духе 💪",
+                 json_reply: str = FAKE_JSON_PLAN):
+        self.latency = latency
+        self.reply = reply
+        self.json_reply = json_reply
+        self.requests = 0
+        self._cached_prefixes = set()
+        self._runner = None
+        self.base_url = None
+
+    async def _handle_completion(self, request):
+        from aiohttp import web
+
+        payload = await request.json()
+        self.requests += 1
+        await asyncio.sleep(self.latency.sample())
+        reply = self.json_reply if payload.get("response_format", {}).get("type") == "json_object" else self.reply
+        prompt_tokens, cached_tokens = self._count_prompt_tokens(payload.get('messages', []))
+        completion_tokens = len(reply) // 4
+        return web.json_response({
+            "id": f"fake-{self.requests}",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        })
+
+    def _count_prompt_tokens(self, messages: List[Dict]):
+        """
+        Токены промпта (4 символа на токен) и из них прочитанные из кеша
+
+        Как у провайдера: кешируется префикс до последней точки cache_control,
+        и повторный запрос с тем же префиксом читает его из кеша.
+        """
+        chars, cached_chars = 0, 0
+        prefix = []
+        for message in messages:
+            content = message.get('content') or ''
+            parts = content if isinstance(content, list) else [{'text': content}]
+            for part in parts:
+                text = part.get('text', '')
+                chars += len(text)
+                prefix.append(text)
+                if 'cache_control' in part:
+                    key = hash("\x00".join(prefix))
+                    if key in self._cached_prefixes:
+                        cached_chars = chars
+                    self._cached_prefixes.add(key)
+        return chars // 4, cached_chars // 4
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_post("/chat/completions", self._handle_completion)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{bound_port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+class FakeMessage:
+    """Сообщение Telegram: записывает ответы бота вместо отправки"""
+
+    def __init__(self, text: str, update: "FakeUpdate"):
+        self.text = text
+        self._update = update
+
+    async def reply_text(self, text: str, **kwargs):
+        self._update.record(text)
+        return FakeMessage(text, self._update)
+
+    async def edit_text(self, text: str, **kwargs):
+        self._update.record(text)
+        return self
+
+
+class FakeCallbackQuery:
+    def __init__(self, data: str, update: "FakeUpdate"):
+        self.data = data
+        self.message = FakeMessage("", update)
+        self._update = update
+
+    async def answer(self, *args, **kwargs):
+        return True
+
+    async def edit_message_text(self, text: str, **kwargs):
+        self._update.record(text)
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.username = f"user{user_id}"
+        self.first_name = f"Участник{user_id}"
+        self.last_name = None
+
+
+class FakeChat:
+    def __init__(self, chat_id: int, chat_type: str):
+        self.id = chat_id
+        self.type = chat_type
+        self.title = None if chat_type == "private" else f"Группа {chat_id}"
+
+
+class FakeUpdate:
+    """Минимальный Update с полями, которые читают обработчики бота"""
+
+    def __init__(self, kind: str, user: FakeUser, chat: FakeChat, text: str = "", callback_data: str = None):
+        self.kind = kind
+        self.sent: List[str] = []
+        # Моменты отправки ответов (time.perf_counter)
+        self.sent_at: List[float] = []
+        self.effective_user = user
+        self.effective_chat = chat
+        if callback_data is not None:
+            self.callback_query = FakeCallbackQuery(callback_data, self)
+            self.message = None
+            self.effective_message = self.callback_query.message
+        else:
+            self.callback_query = None
+            self.message = self.effective_message = FakeMessage(text, self)
+
+    def record(self, text: str):
+        self.sent.append(text)
+        self.sent_at.append(time.perf_counter())
+
+
+class FakeContext:
+    def __init__(self):
+        self.args = []
+        self.user_data = {}
+        self.chat_data = {}
+        self.bot_data = {}
+
+
+def generate_updates(chats: int, users_per_chat: int, count: int, mix: Dict[str, float], seed: int) -> List[FakeUpdate]:
+    """Синтетический поток обновлений: сначала /start каждого участника, затем смесь команд"""
+    rng = random.Random(seed)
+    members = []
+    updates = []
+
+    for chat_index in range(chats):
+        chat_type = "private" if users_per_chat == 1 else "group"
+        chat = FakeChat(-100000 - chat_index if chat_type == "group" else 1000 + chat_index, chat_type)
+        for user_index in range(users_per_chat):
+            user = FakeUser(1000 + chat_index * users_per_chat + user_index)
+            members.append((user, chat))
+            updates.append(FakeUpdate('start', user, chat, "/start"))
+
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    levels = ("beginner", "intermediate", "advanced")
+    phrases = (
+        "Какую тренировку сделать сегодня?",
+        "Болит колено после бега, что делать?",
+        "Сделал 3 подхода по 15 отжиманий",
+        "Как правильно делать планку?",
+        "Хочу похудеть к лету",
+    )
+
+    for _ in range(count):
+        user, chat = rng.choice(members)
+        kind = rng.choices(kinds, weights)[0]
+        if kind == 'message':
+            updates.append(FakeUpdate(kind, user, chat, rng.choice(phrases)))
+        elif kind == 'level':
+            updates.append(FakeUpdate(kind, user, chat, callback_data=f"level_{rng.choice(levels)}"))
+        else:
+            updates.append(FakeUpdate(kind, user, chat, f"/{kind}"))
+
+    return updates
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def reply_latencies(dispatched: List) -> Dict[str, List[float]]:
+    """
+    Задержки до ответа по типам обновлений
+
+    Args:
+        dispatched: (обновление, момент начала обработки, момент возврата обработчика)
+
+    Ответ на команду - последнее отправленное на нее сообщение или правка
+    (заглушка заменяется результатом). Ответ на обычное сообщение - первый
+    ответ в том же чате на него или на более позднее сообщение, начиная с его
+    обработки. Обновления без ответа (например, ход чата вытеснен последним
+    сообщением, а оно не получило ответа) не учитываются.
+    """
+    latencies: Dict[str, List[float]] = {}
+    first_reply: Dict[int, float] = {}
+    # От поздних обновлений к ранним: для сообщения уже известен первый ответ в чате после него
+    for update, started, returned in sorted(dispatched, key=lambda item: item[1], reverse=True):
+        if update.kind == 'message':
+            chat_id = update.effective_chat.id
+            if update.sent_at:
+                first_reply[chat_id] = min(update.sent_at[0], first_reply.get(chat_id, update.sent_at[0]))
+            replied = first_reply.get(chat_id)
+            if replied is None:
+                continue
+        else:
+            replied = max(update.sent_at[-1], returned) if update.sent_at else returned
+        latencies.setdefault(update.kind, []).append(replied - started)
+    return latencies
+
+
+def summarize(latencies: List[float]) -> Dict:
+    return {
+        'count': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def run_benchmark(args) -> Dict:
+    """Прогон нагрузки и сбор статистики"""
+    from ai_client import OpenRouterClient
+    from bot import FitnessTrainerBot
+    from lanes import LaneUpdateProcessor
+    from metrics import metrics
+    from settings import settings
+    from usage import QuotaManager
+
+    fake_api = FakeOpenRouter(LatencyModel(args.latency, seed=args.seed))
+    base_url = await fake_api.start()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="fitness-bench-"), "bench.db")
+    bot = FitnessTrainerBot(db_path=db_path, ai_client=OpenRouterClient(api_key="bench", base_url=base_url))
+    # Квоты отключены: замеряем обработчики, а не отказы лимитера
+    bot.quotas = QuotaManager(bot.usage, user_daily_tokens=0, chat_daily_tokens=0,
+                              user_rate=(0, 0), chat_rate=(0, 0))
+
+    handlers = {
+        'start': bot.start_command,
+        'help': bot.help_command,
+        'profile': bot.profile_command,
+        'workout': bot.workout_command,
+        'group_workout': bot.group_workout_command,
+        'progress': bot.progress_command,
+        'motivation': bot.motivation_command,
+        'stats': bot.stats_command,
+        'last_plan': bot.last_plan_command,
+        'message': bot.handle_message,
+        'level': bot.handle_callback,
+    }
+
+    # Пауза перед ответом на сообщения чата: по умолчанию 0, чтобы задержка ответа
+    # отражала работу бота, а не ожидание следующих сообщений
+    settings.message_debounce = args.debounce
+
+    updates = generate_updates(args.chats, args.users_per_chat, args.updates, DEFAULT_MIX, args.seed)
+    warmup = args.chats * args.users_per_chat
+    latencies: Dict[str, List[float]] = {}
+    dispatched = []
+    context = FakeContext()
+
+    metrics.enabled = True
+    metrics.reset()
+
+    # С --lanes обновления проходят через полосы, как в боте
+    processor = LaneUpdateProcessor(bot.lanes) if args.lanes else None
+
+    async def dispatch(update: FakeUpdate):
+        started = time.perf_counter()
+        if processor:
+            await processor.process_update(update, handlers[update.kind](update, context))
+        else:
+            await handlers[update.kind](update, context)
+        returned = time.perf_counter()
+        latencies.setdefault(update.kind, []).append(returned - started)
+        dispatched.append((update, started, returned))
+
+    # Регистрация участников - последовательно, вне замера
+    for update in updates[:warmup]:
+        await handlers[update.kind](update, context)
+    metrics.reset()
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for update in updates[warmup:]:
+        queue.put_nowait(update)
+
+    # Фоновые задачи, запущенные обработкой текущего обновления воркера
+    started_jobs: contextvars.ContextVar = contextvars.ContextVar('started_jobs')
+    start_job = bot.jobs.start
+
+    def tracking_start(key, *job_args, **job_kwargs):
+        started = start_job(key, *job_args, **job_kwargs)
+        keys = started_jobs.get(None)
+        if started and keys is not None:
+            keys.append(key)
+        return started
+
+    bot.jobs.start = tracking_start
+
+    async def worker():
+        # Воркер - пользователь, который ждет ответа, прежде чем написать снова
+        while True:
+            try:
+                update = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            keys = []
+            started_jobs.set(keys)
+            await dispatch(update)
+            for key in keys:
+                await bot.jobs.wait(key)
+            # В боте каждое обновление - отдельная задача, а отправка ответа ждет сети,
+            # поэтому цикл событий успевает обработать ответы API между обновлениями
+            await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    # Планы и анализ прогресса генерируются в фоне - ждем, пока они будут отправлены
+    await bot.jobs.join()
+    elapsed = time.perf_counter() - started
+    job_count, job_seconds = metrics.histogram_totals('background_job_seconds')
+
+    db_calls, db_seconds = metrics.histogram_totals('db_query_seconds')
+    await fake_api.stop()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    handled = len(all_latencies)
+    replies = reply_latencies(dispatched)
+    all_replies = [value for values in replies.values() for value in values]
+
+    return {
+        'config': {
+            'chats': args.chats,
+            'users_per_chat': args.users_per_chat,
+            'updates': args.updates,
+            'concurrency': args.concurrency,
+            'latency': args.latency,
+            'seed': args.seed,
+            'debounce': args.debounce,
+        },
+        'elapsed_s': round(elapsed, 3),
+        'throughput_ups': round(handled / elapsed, 2) if elapsed else 0.0,
+        'latency': summarize(all_latencies),
+        'per_handler': {kind: summarize(values) for kind, values in sorted(latencies.items())},
+        'reply_latency': summarize(all_replies),
+        'per_handler_reply': {kind: summarize(values) for kind, values in sorted(replies.items())},
+        'unanswered': handled - len(all_replies),
+        'db': {
+            'calls': db_calls,
+            'total_ms': round(db_seconds * 1000, 2),
+            'per_update_ms': round(db_seconds * 1000 / handled, 3) if handled else 0.0,
+        },
+        'tokens': {
+            'prompt': int(metrics.counter_total('ai_tokens_total', kind="prompt")),
+            'cached': int(metrics.counter_total('ai_tokens_total', kind="cached")),
+        },
+        'background_jobs': {
+            'count': job_count,
+            'mean_ms': round(job_seconds * 1000 / job_count, 2) if job_count else 0.0,
+        },
+        'upstream_requests': fake_api.requests,
+    }
+
+
+def cold_start_child(db_path: str):
+    """
+    Дочерний процесс замера холодного старта: импорт бота, инициализация
+    и обработка первого обновления (/start). Печатает замеры в JSON.
+    """
+    logging.disable(logging.INFO)
+    started = time.perf_counter()
+    from bot import FitnessTrainerBot
+    imported = time.perf_counter()
+    bot = FitnessTrainerBot(db_path=db_path)
+    initialized = time.perf_counter()
+    update = FakeUpdate('start', FakeUser(1), FakeChat(1, "private"), "/start")
+    asyncio.run(bot.start_command(update, FakeContext()))
+    handled = time.perf_counter()
+    print(json.dumps({
+        'import_ms': round((imported - started) * 1000, 2),
+        'init_ms': round((initialized - imported) * 1000, 2),
+        'first_update_ms': round((handled - initialized) * 1000, 2),
+    }), flush=True)
+    # Не ждем завершения пулов и фоновых потоков: замер уже сделан
+    os._exit(0)
+
+
+def measure_cold_start(runs: int) -> Dict:
+    """
+    Время от запуска процесса до обработки первого обновления (медиана по runs запускам)
+
+    Первый запуск создает базу и не учитывается: замеряется обычный
+    перезапуск бота с уже существующей базой.
+    """
+    db_path = os.path.join(tempfile.mkdtemp(prefix="fitness-cold-"), "cold.db")
+    samples = []
+    for run in range(runs + 1):
+        started = time.perf_counter()
+        child = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--cold-start-child", db_path],
+            stdout=subprocess.PIPE, text=True
+        )
+        line = child.stdout.readline()
+        total_ms = (time.perf_counter() - started) * 1000
+        child.wait()
+        if run and line:
+            samples.append(dict(json.loads(line), total_ms=total_ms))
+
+    if not samples:
+        return {}
+    return {
+        key: round(statistics.median(sample[key] for sample in samples), 2)
+        for key in ('total_ms', 'import_ms', 'init_ms', 'first_update_ms')
+    }
+
+
+def compare_with_baseline(result: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Список регрессий относительно сохраненного базового прогона"""
+    regressions = []
+
+    if dict(CONFIG_DEFAULTS, **baseline.get('config', {})) != result['config']:
+        regressions.append("⚠️ Конфигурация прогона отличается от базовой, сравнение неточное")
+
+    base_tp = baseline.get('throughput_ups', 0)
+    if base_tp and result['throughput_ups'] < base_tp * (1 - tolerance):
+        regressions.append(f"❌ Пропускная способность: {result['throughput_ups']} < {base_tp} обн/с")
+
+    # До фоновой генерации обработчики отвечали до возврата, поэтому в старых
+    # базовых результатах задержка ответа совпадает с задержкой обработчика
+    base_reply = baseline.get('reply_latency') or baseline.get('latency', {})
+    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+        base_value = base_reply.get(key, 0)
+        value = result['reply_latency'][key]
+        if base_value and value > base_value * (1 + tolerance):
+            regressions.append(f"❌ Задержка ответа {key}: {value} > {base_value}")
+
+    base_db = baseline.get('db', {}).get('per_update_ms', 0)
+    if base_db and result['db']['per_update_ms'] > base_db * (1 + tolerance):
+        regressions.append(f"❌ Время БД на обновление: {result['db']['per_update_ms']} > {base_db} мс")
+
+    base_cold = baseline.get('cold_start', {}).get('total_ms', 0)
+    cold = result.get('cold_start', {}).get('total_ms', 0)
+    if base_cold and cold > base_cold * (1 + tolerance):
+        regressions.append(f"❌ Холодный старт: {cold} > {base_cold} мс")
+
+    return regressions
+
+
+def print_report(result: Dict):
+    print("🏋️‍♂️ Нагрузочный тест бота")
+    print("=" * 40)
+    cfg = result['config']
+    print(f"Чатов: {cfg['chats']}, участников в чате: {cfg['users_per_chat']}, "
+          f"обновлений: {cfg['updates']}, параллельно: {cfg['concurrency']}, задержка API: {cfg['latency']}, "
+          f"пауза хода: {cfg['debounce']} с")
+    print(f"\n⏱ Время: {result['elapsed_s']} с")
+    print(f"🚀 Пропускная способность: {result['throughput_ups']} обн/с")
+    lat = result['latency']
+    print(f"📊 Задержка обработчика: p50={lat['p50_ms']} мс, p95={lat['p95_ms']} мс, p99={lat['p99_ms']} мс")
+    lat = result['reply_latency']
+    print(f"💬 Задержка ответа: p50={lat['p50_ms']} мс, p95={lat['p95_ms']} мс, p99={lat['p99_ms']} мс"
+          f" (без ответа: {result['unanswered']})")
+    db = result['db']
+    print(f"🗄 БД: {db['calls']} запросов, {db['total_ms']} мс всего, {db['per_update_ms']} мс на обновление")
+    print(f"🤖 Запросов к API: {result['upstream_requests']}")
+    tokens = result.get('tokens')
+    if tokens:
+        print(f"🔤 Токенов промпта: {tokens['prompt']}, из кеша провайдера: {tokens['cached']}")
+    jobs = result.get('background_jobs')
+    if jobs:
+        print(f"⏳ Фоновых генераций: {jobs['count']}, в среднем {jobs['mean_ms']} мс")
+    cold = result.get('cold_start')
+    if cold:
+        print(f"🧊 Холодный старт до первого обновления: {cold['total_ms']} мс "
+              f"(импорт {cold['import_ms']}, инициализация {cold['init_ms']}, /start {cold['first_update_ms']})")
+    print("\nПо обработчикам (до возврата / до ответа), мс:")
+    for kind, stats in result['per_handler'].items():
+        reply = result['per_handler_reply'].get(kind, {})
+        print(f"  {kind:<14} n={stats['count']:<6} p50={stats['p50_ms']:<9} p95={stats['p95_ms']:<9} p99={stats['p99_ms']:<9}"
+              f"| p50={reply.get('p50_ms', '-'):<9} p95={reply.get('p95_ms', '-'):<9} p99={reply.get('p99_ms', '-')}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн нагрузочный тест бота")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--users-per-chat", type=int, default=5)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", default="lognormal:0.05:0.5", help="распределение задержек фейкового API")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="сохранить результат как базовый")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение (доля)")
+    parser.add_argument("--json", action="store_true", help="вывести результат в JSON")
+    parser.add_argument("--lanes", action="store_true", help="обрабатывать обновления через полосы (lanes.py)")
+    parser.add_argument("--debounce", type=float, default=CONFIG_DEFAULTS['debounce'],
+                        help="пауза перед ответом на сообщения чата, с (в боте - message_debounce, 1.5)")
+    parser.add_argument("--cold-start-runs", type=int, default=5, help="запусков для замера холодного старта (0 - не замерять)")
+    parser.add_argument("--cold-start-child", metavar="DB_PATH", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.cold_start_child:
+        cold_start_child(args.cold_start_child)
+    logging.disable(logging.INFO)
+
+    result = asyncio.run(run_benchmark(args))
+    if args.cold_start_runs:
+        result['cold_start'] = measure_cold_start(args.cold_start_runs)
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print_report(result)
+
+    # В режиме --json служебные сообщения уходят в stderr, чтобы stdout оставался валидным JSON
+    out = sys.stderr if args.json else sys.stdout
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Базовый результат сохранен в {args.baseline}", file=out)
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(result, baseline, args.tolerance)
+        if any(r.startswith("❌") for r in regressions):
+            print("\n🚨 Обнаружены регрессии:", file=out)
+            for regression in regressions:
+                print(regression, file=out)
+            return 1
+        for regression in regressions:
+            print(f"\n{regression}", file=out)
+        print(f"\n✅ Регрессий относительно {args.baseline} нет", file=out)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
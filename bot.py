@@ -1,13 +1,29 @@
 import asyncio
+import html
+import importlib
+import itertools
 import logging
+import math
+import os
+import signal
+import time
 from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 from telegram.constants import ParseMode
 
-from config import TELEGRAM_TOKEN, BOT_NAME, MAX_MESSAGE_LENGTH
-from database import FitnessDatabase
+from config import TELEGRAM_TOKEN, BOT_NAME, MAX_MESSAGE_LENGTH, DATABASE_PATH, METRICS_ENABLED, METRICS_HOST, METRICS_PORT, PROFILER_ENABLED, STRUCTURED_PLANS, LOCAL_PLAN_FALLBACK, PRELOAD_MODULES, SETTINGS_FILE, WEEKLY_RECAP_ENABLED, FACT_EXTRACTION_ENABLED, SEARCH_RESULTS, LEVEL_INTENSITY, GOAL_NAMES
+from database import FitnessDatabase, SNIPPET_OPEN, SNIPPET_CLOSE
 from ai_client import OpenRouterClient
+from metrics import metrics, profiler, start_metrics_server, ErrorCountingHandler
+from usage import UsageTracker, QuotaManager
+from prompts import RosterCache
+from settings import settings, reload_settings
+from lanes import SLOW, LaneUpdateProcessor, create_lanes
+from jobs import BackgroundJobs
+from memory import render_memory, tokenize
+from utils import suggest_next_workout, workout_context, format_workout_stats
 
 # Настройка логирования
 logging.basicConfig(
@@ -15,12 +31,46 @@ logging.basicConfig(
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
+logging.getLogger().addHandler(ErrorCountingHandler(metrics))
+
+def preload_modules(modules: List[str] = PRELOAD_MODULES):
+    """Импорт лениво загружаемых модулей заранее, чтобы первый запрос их не ждал"""
+    started = time.perf_counter()
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.error(f"Не удалось загрузить модуль {name}: {e}")
+    logger.info(f"Модули прогреты за {(time.perf_counter() - started) * 1000:.0f} мс")
+
+LOCAL_PLAN_NOTE = "⚡ <i>Тренер сейчас занят, поэтому этот план собран из базы упражнений.</i>"
 
 class FitnessTrainerBot:
-    def __init__(self):
-        self.db = FitnessDatabase("fitness_trainer.db")
+    def __init__(self, db_path: str = DATABASE_PATH, ai_client: OpenRouterClient = None):
+        self.db = FitnessDatabase(db_path)
         from config import OPENROUTER_API_KEY
-        self.ai_client = OpenRouterClient(api_key=OPENROUTER_API_KEY)
+        self.ai_client = ai_client or OpenRouterClient(api_key=OPENROUTER_API_KEY)
+        self.metrics_runner = None
+        
+        # Учет токенов и квоты
+        self.usage = UsageTracker(self.db)
+        self.quotas = QuotaManager(self.usage)
+        self.ai_client.usage_tracker = self.usage
+        
+        # Пул сообщений, графики, групповые планы, итоги и факты создаются при первом обращении:
+        # их модули нужны только фоновым задачам и редким командам (PRELOAD_MODULES)
+        self._pool = None
+        self._charts = None
+        self._group_planner = None
+        self._recaps = None
+        self._facts = None
+        self.rosters = RosterCache()
+        # Фоновая генерация занимает места медленной полосы наравне с медленными командами
+        self.lanes = create_lanes()
+        self.jobs = BackgroundJobs(self.lanes[SLOW])
+        # Неотвеченные сообщения чатов: chat_id -> ["Имя: текст", ...]
+        self.pending_turns: Dict[int, List[str]] = {}
+        self.background_tasks = []
         
         # Команды бота
         self.commands = {
@@ -28,12 +78,220 @@ class FitnessTrainerBot:
             'help': 'Показать справку по командам',
             'profile': 'Настроить профиль фитнеса',
             'workout': 'Получить план тренировки',
+            'last_plan': 'Повторить последний план',
             'group_workout': 'Групповая тренировка',
             'progress': 'Отследить прогресс',
             'motivation': 'Получить мотивацию',
-            'stats': 'Статистика тренировок'
+            'stats': 'Статистика тренировок',
+            'log': 'Записать замер, например: /log вес 75.5',
+            'search': 'Поиск по истории чата, например: /search колено'
         }
     
+    @property
+    def pool(self):
+        """Пул заранее сгенерированных сообщений"""
+        if self._pool is None:
+            from pools import ContentPool
+            self._pool = ContentPool(self.db, self.ai_client)
+        return self._pool
+    
+    @property
+    def charts(self):
+        if self._charts is None:
+            from charts import ChartRenderer
+            self._charts = ChartRenderer()
+        return self._charts
+    
+    @property
+    def group_planner(self):
+        if self._group_planner is None:
+            from group_planner import GroupPlanner
+            self._group_planner = GroupPlanner(self.db, self.ai_client)
+        return self._group_planner
+    
+    @property
+    def recaps(self):
+        if self._recaps is None:
+            from recaps import WeeklyRecap
+            self._recaps = WeeklyRecap(self.db, self.ai_client)
+        return self._recaps
+    
+    @property
+    def facts(self):
+        if self._facts is None:
+            from facts import FactExtractor
+            self._facts = FactExtractor(self.db, self.ai_client)
+        return self._facts
+    
+    @staticmethod
+    def _done_markup(label: str, workout_id: int = None, group_id: int = None) -> InlineKeyboardMarkup:
+        """Кнопка отметки выполнения тренировки (или своей записи в групповой тренировке)"""
+        callback_data = f"done_{workout_id}" if group_id is None else f"done_g{group_id}"
+        return InlineKeyboardMarkup([[InlineKeyboardButton(label, callback_data=callback_data)]])
+    
+    @staticmethod
+    def _format_streak(streak) -> str:
+        """Строка с серией и регулярностью тренировок"""
+        return (
+            f"🔥 Серия: {streak['current_streak']} дн. (рекорд {streak['best_streak']})\n"
+            f"✅ Выполнено: {streak['total_completed']} из {streak['total_assigned']} ({streak['adherence']}%)\n"
+        )
+    
+    @staticmethod
+    async def _reply_in_parts(message, text: str, title: str, part_title: str, reply_markup=None, placeholder=None):
+        """
+        Отправка длинного текста частями по MAX_MESSAGE_LENGTH
+        
+        Args:
+            message: Сообщение, на которое отвечаем
+            text: Текст ответа
+            title: Заголовок, если текст помещается в одно сообщение
+            part_title: Заголовок части с плейсхолдерами {i} и {n}
+            reply_markup: Клавиатура под последней частью
+            placeholder: Заглушка, которую заменяет первая часть ответа
+        """
+        if len(text) <= MAX_MESSAGE_LENGTH:
+            parts = [f"{title}\n\n{text}"]
+        else:
+            chunks = [text[i:i+MAX_MESSAGE_LENGTH] for i in range(0, len(text), MAX_MESSAGE_LENGTH)]
+            parts = [f"{part_title.format(i=i + 1, n=len(chunks))}\n\n{chunk}" for i, chunk in enumerate(chunks)]
+        
+        for i, part in enumerate(parts):
+            markup = reply_markup if i == len(parts) - 1 else None
+            if i == 0 and placeholder is not None:
+                await placeholder.edit_text(part, reply_markup=markup, parse_mode=ParseMode.HTML)
+            else:
+                await message.reply_text(part, reply_markup=markup, parse_mode=ParseMode.HTML)
+    
+    @staticmethod
+    def _cancel_markup(job_key: str) -> InlineKeyboardMarkup:
+        """Кнопка отмены фоновой генерации под заглушкой"""
+        return InlineKeyboardMarkup([[InlineKeyboardButton("✖️ Отменить", callback_data=f"cancel_{job_key}")]])
+    
+    @staticmethod
+    def _job_failure(placeholder, error_text: str):
+        """Замена заглушки сообщением об ошибке, если фоновая задача не завершилась"""
+        async def report(status: str):
+            await placeholder.edit_text("✖️ Генерация отменена" if status == "cancelled" else error_text)
+        return report
+    
+    async def _start_job(self, update: Update, kind: str, job_key: str, placeholder_text: str,
+                         job, error_text: str, owner_id: Optional[int], check_quota: bool = True) -> bool:
+        """
+        Проверка квот, заглушка с кнопкой отмены и запуск фоновой генерации
+        
+        Args:
+            job: Функция placeholder -> корутина генерации, которая заменяет заглушку результатом
+            check_quota: False, если генерации не понадобится запрос к ИИ (план уже в кеше)
+        
+        Returns:
+            False, если такая генерация уже идет или квота исчерпана
+        """
+        message = update.effective_message
+        if self.jobs.running(job_key):
+            await message.reply_text("⏳ Уже готовлю, подожди немного")
+            return False
+        if check_quota and not await self._acquire_quota(update):
+            return False
+        
+        placeholder = await message.reply_text(placeholder_text, reply_markup=self._cancel_markup(job_key))
+        return self.jobs.start(
+            job_key, kind, update.effective_chat.id, owner_id,
+            lambda: job(placeholder), self._job_failure(placeholder, error_text)
+        )
+    
+    async def _generate_workout(self, user_info: Dict, usage_key: Tuple[int, int]) -> Tuple[Optional[str], Optional[Dict]]:
+        """
+        План индивидуальной тренировки: JSON с локальным рендерингом или обычный текст
+        
+        Если ИИ не ответил за settings.ai_plan_timeout секунд, план собирается локально из каталога упражнений.
+        
+        Returns:
+            (текст плана, структура плана для workout_data или None)
+        """
+        from workout_plans import render_plan_html, plan_to_data
+        from workout_generator import generate_local_plan
+        
+        workout_plan, plan_data = await self._with_plan_timeout(self._generate_ai_workout(user_info, usage_key), "individual")
+        if workout_plan is None and LOCAL_PLAN_FALLBACK:
+            last_workouts = self.db.get_user_workouts(user_info['user_id'], limit=1)
+            plan = generate_local_plan(user_info, workout_context(last_workouts[0] if last_workouts else None))
+            metrics.inc('local_plans_total', kind="individual")
+            return f"{render_plan_html(plan)}\n\n{LOCAL_PLAN_NOTE}", plan_to_data(plan)
+        return workout_plan, plan_data
+    
+    async def _generate_ai_workout(self, user_info: Dict, usage_key: Tuple[int, int]) -> Tuple[Optional[str], Optional[Dict]]:
+        from workout_plans import render_plan_html, plan_to_data
+        
+        facts = self.db.get_user_facts(user_info['user_id'])
+        if STRUCTURED_PLANS:
+            plan = await self.ai_client.generate_structured_workout_plan(user_info, usage_key=usage_key, facts=facts)
+            if plan:
+                return render_plan_html(plan), plan_to_data(plan)
+            metrics.inc('structured_plan_fallbacks_total', kind="individual")
+        return await self.ai_client.generate_workout_plan(user_info, usage_key=usage_key, facts=facts), None
+    
+    async def _generate_group_workout(self, users: List[Dict], usage_key: Tuple[int, int],
+                                      cached_plan=None, refresh: bool = False) -> Tuple[Optional[str], Optional[Dict]]:
+        """
+        План групповой тренировки: общий JSON-план с вариантами по уровням, обычный текст или локальный план
+        
+        Состав группы по уровням рендерится локально над планом.
+        
+        Args:
+            cached_plan: План из кеша по составу (GroupPlanner.get_cached), если он уже найден
+            refresh: Составить новый план, не глядя в кеш
+        """
+        from workout_plans import render_plan_html, plan_to_data
+        from workout_generator import generate_local_group_plan
+        from group_planner import cluster_by_level, format_roster
+        
+        clusters = cluster_by_level(users)
+        workout_plan, plan_data = await self._with_plan_timeout(
+            self._generate_ai_group_workout(clusters, usage_key, cached_plan, refresh), "group"
+        )
+        if workout_plan is None and LOCAL_PLAN_FALLBACK:
+            plan = generate_local_group_plan(users)
+            metrics.inc('local_plans_total', kind="group")
+            workout_plan, plan_data = f"{render_plan_html(plan)}\n\n{LOCAL_PLAN_NOTE}", plan_to_data(plan)
+        if workout_plan is None:
+            return None, None
+        return f"📊 <b>Участники ({len(users)}):</b>\n{format_roster(clusters)}\n\n{workout_plan}", plan_data
+    
+    async def _generate_ai_group_workout(self, clusters: Dict[str, List[Dict]], usage_key: Tuple[int, int],
+                                         cached_plan=None, refresh: bool = False) -> Tuple[Optional[str], Optional[Dict]]:
+        from workout_plans import render_plan_html, plan_to_data
+        
+        if STRUCTURED_PLANS:
+            plan = await self.group_planner.get_plan(
+                clusters, usage_key=usage_key, cached=cached_plan, refresh=refresh
+            )
+            if plan:
+                return render_plan_html(plan), plan_to_data(plan)
+            metrics.inc('structured_plan_fallbacks_total', kind="group")
+        users = [member for members in clusters.values() for member in members]
+        return await self.ai_client.generate_group_workout(users, usage_key=usage_key), None
+    
+    @staticmethod
+    async def _with_plan_timeout(generation, kind: str) -> Tuple[Optional[str], Optional[Dict]]:
+        """Ожидание плана от ИИ не дольше settings.ai_plan_timeout секунд (0 - без ограничения)"""
+        timeout = settings.ai_plan_timeout
+        try:
+            return await asyncio.wait_for(generation, timeout or None)
+        except asyncio.TimeoutError:
+            metrics.inc('ai_plan_timeouts_total', kind=kind)
+            logger.warning(f"ИИ не ответил за {timeout} с, план соберем локально")
+            return None, None
+    
+    async def _acquire_quota(self, update: Update) -> bool:
+        """Проверка квот перед обращением к ИИ; при отказе сообщает причину"""
+        denial = self.quotas.acquire(update.effective_user.id, update.effective_chat.id)
+        if denial:
+            await update.effective_message.reply_text(denial)
+            return False
+        return True
+    
+    @metrics.timed('handler_latency_seconds', 'handler')
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
         user = update.effective_user
@@ -46,6 +304,8 @@ class FitnessTrainerBot:
             first_name=user.first_name,
             last_name=user.last_name
         )
+        # Имя могло измениться - блоки участников с ним устарели
+        self.rosters.invalidate_user(user.id)
         
         self.db.add_chat(
             chat_id=chat.id,
@@ -86,6 +346,7 @@ class FitnessTrainerBot:
             parse_mode=ParseMode.HTML
         )
     
+    @metrics.timed('handler_latency_seconds', 'handler')
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /help"""
         help_text = f"🤖 <b>{BOT_NAME} - Справка по командам</b>\n\n"
@@ -100,18 +361,20 @@ class FitnessTrainerBot:
         
         await update.message.reply_text(help_text, parse_mode=ParseMode.HTML)
     
+    @metrics.timed('handler_latency_seconds', 'handler')
     async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /profile"""
         user = update.effective_user
         user_info = self.db.get_user_info(user.id)
         
         if user_info:
+            goals = user_info.get('goals') or 'Не указаны'
             profile_text = f"""
 👤 <b>Профиль {user.first_name}</b>
 
 📊 <b>Текущие настройки:</b>
 • Уровень подготовки: {user_info.get('fitness_level', 'Не указан')}
-• Цели: {user_info.get('goals', 'Не указаны')}
+• Цели: {GOAL_NAMES.get(goals, html.escape(goals))}
 
 🔄 <b>Обновить профиль:</b>
 Выбери свой уровень подготовки:
@@ -132,27 +395,29 @@ class FitnessTrainerBot:
         else:
             await update.message.reply_text("❌ Ошибка получения профиля. Попробуй /start")
     
+    @metrics.timed('handler_latency_seconds', 'handler')
     async def workout_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /workout"""
         user = update.effective_user
         user_info = self.db.get_user_info(user.id)
         
         if not user_info:
-            await update.message.reply_text("❌ Сначала настрой профиль командой /profile")
+            await update.effective_message.reply_text("❌ Сначала настрой профиль командой /profile")
             return
         
-        # Генерируем план тренировки через ИИ
-        workout_plan = await self.ai_client.generate_workout_plan(user_info)
+        # План генерируется в фоне, заглушка заменяется готовым планом
+        await self._start_job(
+            update, "workout", f"workout:{update.effective_chat.id}:{user.id}", "⏳ Составляю план тренировки...",
+            lambda placeholder: self._send_workout(update, user_info, placeholder),
+            "❌ Не удалось сгенерировать план тренировки. Попробуй позже.", user.id
+        )
+    
+    async def _send_workout(self, update: Update, user_info: Dict, placeholder):
+        """Генерация индивидуального плана, сохранение и замена заглушки планом"""
+        user = update.effective_user
+        workout_plan, plan_data = await self._generate_workout(user_info, (user.id, update.effective_chat.id))
         
         if workout_plan:
-            # Разбиваем длинное сообщение на части
-            if len(workout_plan) > MAX_MESSAGE_LENGTH:
-                parts = [workout_plan[i:i+MAX_MESSAGE_LENGTH] for i in range(0, len(workout_plan), MAX_MESSAGE_LENGTH)]
-                for i, part in enumerate(parts):
-                    await update.message.reply_text(f"📋 <b>План тренировки (часть {i+1}/{len(parts)})</b>\n\n{part}", parse_mode=ParseMode.HTML)
-            else:
-                await update.message.reply_text(f"📋 <b>Твой план тренировки:</b>\n\n{workout_plan}", parse_mode=ParseMode.HTML)
-            
             # Сохраняем тренировку в базе
             workout_data = {
                 "type": "individual",
@@ -160,37 +425,100 @@ class FitnessTrainerBot:
                 "user_level": user_info.get('fitness_level'),
                 "goals": user_info.get('goals')
             }
-            self.db.save_workout(user.id, "individual", workout_data)
+            if plan_data:
+                workout_data["plan"] = plan_data
+            workout_id = self.db.save_workout(
+                user.id, "individual", workout_data,
+                chat_id=update.effective_chat.id,
+                plan_text=workout_plan
+            )
+            done_markup = self._done_markup("✅ Выполнено", workout_id) if workout_id else None
+            
+            await self._reply_in_parts(
+                update.effective_message, workout_plan,
+                "📋 <b>Твой план тренировки:</b>",
+                "📋 <b>План тренировки (часть {i}/{n})</b>",
+                reply_markup=done_markup, placeholder=placeholder
+            )
             
         else:
-            await update.message.reply_text("❌ Не удалось сгенерировать план тренировки. Попробуй позже.")
+            await placeholder.edit_text("❌ Не удалось сгенерировать план тренировки. Попробуй позже.")
     
-    async def group_workout_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик команды /group_workout"""
+    @metrics.timed('handler_latency_seconds', 'handler')
+    async def last_plan_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /last_plan - повтор последнего плана без обращения к ИИ"""
+        user = update.effective_user
+        last_plan = self.db.get_last_plan(user.id)
+        
+        if not last_plan:
+            await update.effective_message.reply_text("📋 Сохраненных планов пока нет. Получи первый командой /workout!")
+            return
+        
+        done_markup = None
+        if not last_plan['completed']:
+            done_markup = self._done_markup("✅ Выполнено", last_plan['id'])
+        
+        title = "📋 <b>Твой последний план тренировки:</b>"
+        plan_text = last_plan['plan']
+        # Уровень сменился после составления плана - пересчитываем JSON-план под текущий уровень без ИИ
+        plan_data = last_plan['plan_data']
+        level = (self.db.get_user_info(user.id) or {}).get('fitness_level')
+        if (last_plan['type'] == 'individual' and plan_data and level in LEVEL_INTENSITY
+                and plan_data.get('level') in LEVEL_INTENSITY and plan_data['level'] != level):
+            from workout_plans import WorkoutPlan, adapt_plan_level, render_plan_html
+            try:
+                plan_text = render_plan_html(adapt_plan_level(WorkoutPlan.model_validate(plan_data), level))
+                title = "📋 <b>Твой последний план, пересчитанный под новый уровень:</b>"
+            except ValueError as e:
+                logger.warning(f"Сохраненный план {last_plan['id']} не прошел проверку: {e}")
+        
+        await self._reply_in_parts(
+            update.effective_message, plan_text, title,
+            "📋 <b>Последний план (часть {i}/{n})</b>",
+            reply_markup=done_markup
+        )
+    
+    @metrics.timed('handler_latency_seconds', 'handler')
+    async def group_workout_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, refresh: bool = False):
+        """Обработчик команды /group_workout (/group_workout новый - новый план вместо кешированного)"""
         chat = update.effective_chat
         
         if chat.type == "private":
-            await update.message.reply_text("👥 Эта команда работает только в групповых чатах!")
+            await update.effective_message.reply_text("👥 Эта команда работает только в групповых чатах!")
             return
         
         # Получаем список пользователей в чате
         chat_users = self.db.get_chat_users(chat.id)
         
         if len(chat_users) < 2:
-            await update.message.reply_text("👥 Нужно минимум 2 участника для групповой тренировки!")
+            await update.effective_message.reply_text("👥 Нужно минимум 2 участника для групповой тренировки!")
             return
         
-        # Генерируем групповую тренировку
-        group_workout = await self.ai_client.generate_group_workout(chat_users)
+        if context.args and context.args[0].lower() in ("новый", "new"):
+            refresh = True
+        # План из кеша по составу не расходует квоту: к ИИ обращаемся только при промахе
+        cached_plan = None
+        if STRUCTURED_PLANS and not refresh:
+            from group_planner import cluster_by_level
+            cached_plan = self.group_planner.get_cached(cluster_by_level(chat_users))
+        
+        # Один план на чат: пока он готовится, повторная команда не запускает вторую генерацию
+        await self._start_job(
+            update, "group_workout", f"group_workout:{chat.id}", "⏳ Составляю групповую тренировку...",
+            lambda placeholder: self._send_group_workout(update, chat_users, placeholder, cached_plan, refresh),
+            "❌ Не удалось сгенерировать групповую тренировку. Попробуй позже.", update.effective_user.id,
+            check_quota=cached_plan is None
+        )
+    
+    async def _send_group_workout(self, update: Update, chat_users: List[Dict], placeholder,
+                                  cached_plan=None, refresh: bool = False):
+        """Генерация группового плана, сохранение для участников и замена заглушки планом"""
+        chat = update.effective_chat
+        group_workout, plan_data = await self._generate_group_workout(
+            chat_users, (update.effective_user.id, chat.id), cached_plan, refresh
+        )
         
         if group_workout:
-            if len(group_workout) > MAX_MESSAGE_LENGTH:
-                parts = [group_workout[i:i+MAX_MESSAGE_LENGTH] for i in range(0, len(group_workout), MAX_MESSAGE_LENGTH)]
-                for i, part in enumerate(parts):
-                    await update.message.reply_text(f"👥 <b>Групповая тренировка (часть {i+1}/{len(parts)})</b>\n\n{part}", parse_mode=ParseMode.HTML)
-            else:
-                await update.message.reply_text(f"👥 <b>Групповая тренировка для всех:</b>\n\n{group_workout}", parse_mode=ParseMode.HTML)
-            
             # Сохраняем групповую тренировку для каждого участника
             workout_data = {
                 "type": "group",
@@ -198,27 +526,55 @@ class FitnessTrainerBot:
                 "generated_at": datetime.now().isoformat(),
                 "chat_id": chat.id
             }
+            if plan_data:
+                workout_data["plan"] = plan_data
             
-            for user in chat_users:
-                self.db.save_workout(user['user_id'], "group", workout_data)
+            group_id = self.db.save_group_workout(
+                [user['user_id'] for user in chat_users], workout_data, chat.id, plan_text=group_workout
+            )
+            
+            # Одна кнопка на всех: каждый участник отмечает свою запись в группе
+            done_markup = self._done_markup("✅ Я выполнил(а)", group_id=group_id) if group_id else None
+            if plan_data:
+                # План мог прийти из кеша чата - вторая кнопка просит новый
+                keyboard = list(done_markup.inline_keyboard) if done_markup else []
+                keyboard.append([InlineKeyboardButton("🔄 Другой план", callback_data="group_workout_new")])
+                done_markup = InlineKeyboardMarkup(keyboard)
+            
+            await self._reply_in_parts(
+                update.effective_message, group_workout,
+                "👥 <b>Групповая тренировка для всех:</b>",
+                "👥 <b>Групповая тренировка (часть {i}/{n})</b>",
+                reply_markup=done_markup, placeholder=placeholder
+            )
                 
         else:
-            await update.message.reply_text("❌ Не удалось сгенерировать групповую тренировку. Попробуй позже.")
+            await placeholder.edit_text("❌ Не удалось сгенерировать групповую тренировку. Попробуй позже.")
     
+    @metrics.timed('handler_latency_seconds', 'handler')
     async def progress_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /progress"""
         user = update.effective_user
+        chat = update.effective_chat
         user_info = self.db.get_user_info(user.id)
         
         if not user_info:
-            await update.message.reply_text("❌ Сначала настрой профиль командой /profile")
+            await update.effective_message.reply_text("❌ Сначала настрой профиль командой /profile")
             return
         
-        # Получаем тренировки пользователя
+        # Получаем тренировки и замеры пользователя
         workouts = self.db.get_user_workouts(user.id, limit=5)
+        progress_rows = self.db.get_user_progress(user.id)
+        
+        # /progress графики - только графики по метрикам
+        if context.args and context.args[0].lower() in ("графики", "charts"):
+            await self.send_progress_charts(update, progress_rows)
+            return
         
+        job_key = f"progress:{chat.id}:{user.id}"
         if workouts:
             progress_text = f"📊 <b>Прогресс {user.first_name}</b>\n\n"
+            progress_text += self._format_streak(self.db.get_user_streak(user.id)) + "\n"
             progress_text += "Последние тренировки:\n"
             
             for workout in workouts:
@@ -226,17 +582,73 @@ class FitnessTrainerBot:
                 date = workout.get('scheduled_date', 'Не указана')
                 progress_text += f"{status} {workout['type']} - {date}\n"
             
-            # Анализируем прогресс через ИИ
-            progress_analysis = await self.ai_client.analyze_progress(user_info, workouts)
-            if progress_analysis:
-                progress_text += f"\n<b>Анализ тренера:</b>\n{progress_analysis}"
-            
         else:
             progress_text = f"📊 <b>Прогресс {user.first_name}</b>\n\n"
             progress_text += "У тебя пока нет тренировок. Начни с команды /workout!"
         
-        await update.message.reply_text(progress_text, parse_mode=ParseMode.HTML)
+        # Анализ через ИИ - по тренировкам или замерам, в фоне (если не исчерпана квота и он уже не готовится)
+        analyze = (
+            bool(workouts or progress_rows) and not self.jobs.running(job_key)
+            and self.quotas.acquire(user.id, chat.id) is None
+        )
+        
+        # Предложение на сегодня: из пула, иначе из статического списка
+        last_workout = workouts[0] if workouts else None
+        suggestion = self.pool.take('suggestion', user_info, workout_context(last_workout))
+        if suggestion:
+            suggestion_text = f"\n\n💡 <b>Предложение на сегодня:</b>\n{suggestion}"
+        else:
+            suggestion_text = f"\n\n{suggest_next_workout(user_info, last_workout)}"
+        
+        buttons = []
+        if progress_rows:
+            buttons.append([InlineKeyboardButton("📈 Графики", callback_data="charts")])
+        reply_markup = InlineKeyboardMarkup(buttons) if buttons else None
+        
+        if not analyze:
+            await update.effective_message.reply_text(progress_text + suggestion_text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+            return
+        
+        # Прогресс отправляется сразу, анализ тренера дописывается в то же сообщение
+        message = await update.effective_message.reply_text(
+            progress_text + "\n⏳ <i>Тренер анализирует прогресс...</i>" + suggestion_text,
+            reply_markup=InlineKeyboardMarkup(buttons + list(self._cancel_markup(job_key).inline_keyboard)),
+            parse_mode=ParseMode.HTML
+        )
+        
+        async def analyze_progress():
+            progress_analysis = await self.ai_client.analyze_progress(
+                user_info,
+                progress_rows,
+                workout_stats=self.db.get_workout_stats('user', user.id, 'week'),
+                usage_key=(user.id, chat.id)
+            )
+            analysis_text = f"\n<b>Анализ тренера:</b>\n{progress_analysis}" if progress_analysis else ""
+            await message.edit_text(progress_text + analysis_text + suggestion_text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+        
+        async def drop_analysis(status: str):
+            await message.edit_text(progress_text + suggestion_text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+        
+        self.jobs.start(job_key, "progress", chat.id, user.id, analyze_progress, drop_analysis)
+    
+    async def send_progress_charts(self, update: Update, progress_rows):
+        """Отправка графиков по каждой метрике (из кеша, если новых замеров не было)"""
+        if not progress_rows:
+            await update.effective_message.reply_text("📊 Пока нет замеров. Добавь первый: /log вес 75")
+            return
+        
+        user = update.effective_user
+        for metric_name, rows in itertools.groupby(progress_rows, key=lambda row: row['metric_name']):
+            rows = list(rows)
+            key, photo = await self.charts.get_chart(user.id, metric_name, rows)
+            message = await update.effective_message.reply_photo(
+                photo=photo,
+                caption=f"📈 {metric_name}: {rows[-1]['metric_value']} ({rows[-1]['date']})"
+            )
+            if isinstance(photo, bytes) and message.photo:
+                self.charts.remember_file_id(key, message.photo[-1].file_id)
     
+    @metrics.timed('handler_latency_seconds', 'handler')
     async def motivation_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /motivation"""
         user = update.effective_user
@@ -246,33 +658,148 @@ class FitnessTrainerBot:
             await update.message.reply_text("❌ Сначала настрой профиль командой /profile")
             return
         
-        # Генерируем мотивирующее сообщение
-        motivational_message = await self.ai_client.generate_motivational_message(
-            user_info, 
-            context="morning_motivation"
-        )
+        # Сначала берем готовое сообщение из пула, генерируем только если он пуст
+        motivational_message = self.pool.take('motivation', user_info, "morning_motivation")
+        
+        if not motivational_message:
+            if not await self._acquire_quota(update):
+                return
+            
+            motivational_message = await self.ai_client.generate_motivational_message(
+                user_info, 
+                context="morning_motivation",
+                usage_key=(user.id, update.effective_chat.id)
+            )
         
         if motivational_message:
             await update.message.reply_text(f"🔥 <b>Мотивация для {user.first_name}:</b>\n\n{motivational_message}", parse_mode=ParseMode.HTML)
         else:
             await update.message.reply_text("❌ Не удалось сгенерировать мотивацию. Попробуй позже.")
     
+    @metrics.timed('handler_latency_seconds', 'handler')
+    async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /stats"""
+        user = update.effective_user
+        chat = update.effective_chat
+        
+        # Статистика читается из предагрегированной таблицы, без сканирования тренировок
+        stats_text = f"📈 <b>Статистика {user.first_name}</b>\n\n"
+        stats_text += self._format_streak(self.db.get_user_streak(user.id)) + "\n"
+        stats_text += format_workout_stats(self.db.get_workout_stats('user', user.id, 'week'), "За эту неделю:")
+        stats_text += "\n" + format_workout_stats(self.db.get_workout_stats('user', user.id, 'month'), "За этот месяц:")
+        
+        if chat.type != "private":
+            stats_text += "\n👥 <b>Статистика чата</b>\n\n"
+            stats_text += format_workout_stats(self.db.get_workout_stats('chat', chat.id, 'week'), "За эту неделю:")
+            stats_text += "\n" + format_workout_stats(self.db.get_workout_stats('chat', chat.id, 'month'), "За этот месяц:")
+        
+        await update.message.reply_text(stats_text, parse_mode=ParseMode.HTML)
+    
+    @metrics.timed('handler_latency_seconds', 'handler')
+    async def log_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /log <метрика> <значение> [заметка]"""
+        user = update.effective_user
+        args = context.args or []
+        
+        try:
+            metric_name = args[0].lower()
+            metric_value = float(args[1].replace(',', '.'))
+            # nan и inf float() принимает, но в сводку и промпт они попасть не должны
+            if not math.isfinite(metric_value):
+                raise ValueError(args[1])
+        except (IndexError, ValueError):
+            await update.message.reply_text(
+                "📝 Формат: /log <метрика> <значение> [заметка]\n"
+                "Например: /log вес 75.5 или /log отжимания 30"
+            )
+            return
+        
+        notes = " ".join(args[2:]) or None
+        self.db.save_progress(user.id, metric_name, metric_value, datetime.now().date().isoformat(), notes)
+        
+        await update.message.reply_text(
+            f"✅ Записал: <b>{html.escape(metric_name)}</b> = {args[1]}",
+            parse_mode=ParseMode.HTML
+        )
+    
+    @metrics.timed('handler_latency_seconds', 'handler')
+    async def search_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /search <запрос> - поиск по истории текущего чата"""
+        query = " ".join(context.args or [])
+        if not query:
+            await update.message.reply_text(
+                "🔎 Формат: /search <запрос>\n"
+                "Например: /search колено или /search план на неделю"
+            )
+            return
+        
+        results = self.db.search_messages(update.effective_chat.id, query, limit=SEARCH_RESULTS)
+        if not results:
+            await update.message.reply_text(f"🔎 По запросу «{html.escape(query)}» ничего не найдено", parse_mode=ParseMode.HTML)
+            return
+        
+        text = f"🔎 <b>Найдено по запросу «{html.escape(query)}»:</b>\n"
+        for result in results:
+            author = "🤖 Тренер" if result['user_id'] == 0 else html.escape(result['first_name'] or 'Пользователь')
+            snippet = html.escape(result['snippet']).replace(SNIPPET_OPEN, "<b>").replace(SNIPPET_CLOSE, "</b>")
+            day = (result['timestamp'] or '')[:10]
+            text += f"\n📅 {day} {author}:\n{snippet}\n"
+        
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+    
+    @metrics.timed('handler_latency_seconds', 'handler')
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик обычных сообщений"""
+        """
+        Обработчик обычных сообщений
+        
+        Сообщения чата собираются в один ход: ответ генерируется через
+        settings.message_debounce секунд после последнего сообщения, а
+        новое сообщение отменяет начатую генерацию и добавляется к ходу.
+        """
         user = update.effective_user
         chat = update.effective_chat
         message_text = update.message.text
         
         # Сохраняем сообщение в базе
         self.db.save_message(chat.id, user.id, message_text)
+        self.rosters.note_member(chat.id, user.id)
+        
+        self.pending_turns.setdefault(chat.id, []).append(f"{user.first_name}: {message_text}")
+        self.jobs.start(
+            f"chat:{chat.id}", "chat", chat.id, user.id,
+            lambda: self._answer_turn(update), self._turn_failure(update),
+            supersede=True, delay=settings.message_debounce
+        )
+    
+    def _turn_failure(self, update: Update):
+        """Сообщение об ошибке, если ответ на ход не удалось получить"""
+        async def report(status: str):
+            self.pending_turns.pop(update.effective_chat.id, None)
+            if status != "cancelled":
+                await update.message.reply_text("❌ Извини, не могу сейчас ответить. Попробуй позже.")
+        return report
+    
+    async def _answer_turn(self, update: Update):
+        """Ответ на накопленные сообщения чата (отвечаем на последнее из них)"""
+        user = update.effective_user
+        chat = update.effective_chat
+        
+        if not await self._acquire_quota(update):
+            self.pending_turns.pop(chat.id, None)
+            return
+        
+        turn = list(self.pending_turns.get(chat.id, []))
+        if not turn:
+            return
+        if len(turn) > 1:
+            metrics.inc('merged_messages_total', len(turn) - 1)
         
         # Получаем историю чата для контекста
-        chat_history = self.db.get_chat_history(chat.id, limit=20)
-        chat_users = self.db.get_chat_users(chat.id)
+        chat_history = self.db.get_chat_history(chat.id, limit=settings.max_history_messages)
         
-        # Формируем контекст для ИИ
+        # Формируем контекст для ИИ; блок участников берется из кеша
         chat_context = {
-            'users': chat_users,
+            'roster': self.rosters.get(chat.id, lambda: self.db.get_chat_users(chat.id)),
             'chat_type': chat.type,
             'chat_title': chat.title
         }
@@ -280,29 +807,61 @@ class FitnessTrainerBot:
         # Форматируем историю для API
         formatted_messages = self.ai_client.format_chat_history(chat_history)
         
-        # Добавляем текущее сообщение
+        # Добавляем текущий ход; факты о собеседнике и старые сообщения по теме хода - перед ним,
+        # чтобы не менять кешируемый префикс (системный промпт и историю)
+        from facts import render_user_facts
+        facts = render_user_facts(user.first_name or 'Пользователь', self.db.get_user_facts(user.id))
+        content = "\n\n".join(block for block in (facts, self._recall(chat.id, turn), "\n".join(turn)) if block)
         formatted_messages.append({
             "role": "user",
-            "content": f"{user.first_name}: {message_text}"
+            "content": content
         })
         
         # Получаем ответ от ИИ
-        ai_response = await self.ai_client.get_response(formatted_messages, chat_context)
+        ai_response = await self.ai_client.get_response(
+            formatted_messages, chat_context,
+            usage_key=(user.id, chat.id)
+        )
+        
+        # Ход отвечен; сообщения, пришедшие во время генерации, отменили бы ее раньше
+        remaining = self.pending_turns.get(chat.id, [])[len(turn):]
+        if remaining:
+            self.pending_turns[chat.id] = remaining
+        else:
+            self.pending_turns.pop(chat.id, None)
         
         if ai_response:
             # Сохраняем ответ бота в историю
             self.db.save_message(chat.id, 0, ai_response)  # user_id = 0 для бота
             
-            # Отправляем ответ
-            if len(ai_response) > MAX_MESSAGE_LENGTH:
-                parts = [ai_response[i:i+MAX_MESSAGE_LENGTH] for i in range(0, len(ai_response), MAX_MESSAGE_LENGTH)]
-                for i, part in enumerate(parts):
-                    await update.message.reply_text(f"💬 <b>Ответ тренера (часть {i+1}/{len(parts)})</b>\n\n{part}", parse_mode=ParseMode.HTML)
-            else:
-                await update.message.reply_text(f"💬 <b>Ответ тренера:</b>\n\n{ai_response}", parse_mode=ParseMode.HTML)
+            # Ответ уже получен: новое сообщение не должно прервать его отправку
+            await asyncio.shield(self._send_coach_reply(update.message, ai_response))
         else:
             await update.message.reply_text("❌ Извини, не могу сейчас ответить. Попробуй позже.")
     
+    def _recall(self, chat_id: int, turn: List[str]) -> str:
+        """Блок старых сообщений чата, похожих на ход (вне окна истории), в пределах бюджета токенов"""
+        if not settings.memory_top_k or not settings.memory_token_budget:
+            return ""
+        # Сообщения хода имеют вид "Имя: текст"; имена в запрос не входят
+        terms = tokenize(" ".join(line.split(": ", 1)[-1] for line in turn))
+        self.db.update_memory_index(chat_id)
+        snippets = self.db.search_memory(
+            chat_id, terms, limit=settings.memory_top_k, skip_recent=settings.max_history_messages
+        )
+        metrics.inc('memory_recalls_total', status="hit" if snippets else "miss")
+        return render_memory(snippets, settings.memory_token_budget)
+    
+    @staticmethod
+    async def _send_coach_reply(message, ai_response: str):
+        if len(ai_response) > MAX_MESSAGE_LENGTH:
+            parts = [ai_response[i:i+MAX_MESSAGE_LENGTH] for i in range(0, len(ai_response), MAX_MESSAGE_LENGTH)]
+            for i, part in enumerate(parts):
+                await message.reply_text(f"💬 <b>Ответ тренера (часть {i+1}/{len(parts)})</b>\n\n{part}", parse_mode=ParseMode.HTML)
+        else:
+            await message.reply_text(f"💬 <b>Ответ тренера:</b>\n\n{ai_response}", parse_mode=ParseMode.HTML)
+    
+    @metrics.timed('handler_latency_seconds', 'handler')
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик callback кнопок"""
         query = update.callback_query
@@ -316,6 +875,7 @@ class FitnessTrainerBot:
             
             # Обновляем уровень пользователя
             self.db.update_user_fitness_info(user.id, fitness_level=level)
+            self.rosters.invalidate_user(user.id)
             
             level_names = {
                 "beginner": "начинающий",
@@ -329,6 +889,40 @@ class FitnessTrainerBot:
                 parse_mode=ParseMode.HTML
             )
             
+        elif data.startswith("done_"):
+            user = update.effective_user
+            target = data[len("done_"):]
+            
+            if "_" in target:
+                # Кнопка диапазона ID из старых сообщений: ID групп не были непрерывными
+                await query.message.reply_text(
+                    f"ℹ️ {user.first_name}, эта кнопка устарела. Отметь тренировку кнопкой под /last_plan"
+                )
+                return
+            
+            group = target.startswith("g")
+            if group:
+                completed = self.db.complete_workout(user.id, group_id=int(target[1:]))
+            else:
+                completed = self.db.complete_workout(user.id, int(target))
+            
+            if completed:
+                streak = self.db.get_user_streak(user.id)
+                # Индивидуальный план отмечен - кнопка больше не нужна
+                if not group:
+                    await query.edit_message_reply_markup(reply_markup=None)
+                await query.message.reply_text(
+                    f"💪 {user.first_name}, тренировка засчитана!\n" + self._format_streak(streak)
+                )
+            else:
+                await query.message.reply_text(
+                    f"ℹ️ {user.first_name}, эта тренировка уже отмечена или назначена не тебе"
+                )
+            
+        elif data.startswith("cancel_"):
+            # Отменить генерацию может только тот, кто ее запросил
+            self.jobs.cancel(data[len("cancel_"):], update.effective_user.id)
+            
         elif data == "profile":
             await self.profile_command(update, context)
             
@@ -338,25 +932,79 @@ class FitnessTrainerBot:
         elif data == "group_workout":
             await self.group_workout_command(update, context)
             
+        elif data == "group_workout_new":
+            await self.group_workout_command(update, context, refresh=True)
+            
         elif data == "progress":
             await self.progress_command(update, context)
             
         elif data == "motivation":
             await self.motivation_command(update, context)
+            
+        elif data == "charts":
+            await self.send_progress_charts(update, self.db.get_user_progress(update.effective_user.id))
+    
+    async def post_init(self, application: Application):
+        """Запуск фоновых сервисов после инициализации приложения"""
+        if METRICS_ENABLED:
+            metrics.register_gauge('update_queue_depth', application.update_queue.qsize)
+            self.metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        
+        if PROFILER_ENABLED:
+            profiler.start()
+        
+        self.background_tasks.append(asyncio.create_task(self.usage.run_periodic_flush()))
+        self.background_tasks.append(asyncio.create_task(self.pool.run_refill_loop()))
+        if WEEKLY_RECAP_ENABLED:
+            self.background_tasks.append(asyncio.create_task(self.recaps.run_schedule(application.bot)))
+        if FACT_EXTRACTION_ENABLED:
+            self.background_tasks.append(asyncio.create_task(self.facts.run_loop()))
+        # Тяжелые модули импортируются лениво; прогреваем их в потоке, уже принимая обновления
+        self.background_tasks.append(asyncio.create_task(asyncio.to_thread(preload_modules)))
+        
+        # SIGHUP - перечитать файл настроек, не останавливая обработку обновлений
+        if hasattr(signal, 'SIGHUP'):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_settings)
+    
+    async def post_shutdown(self, application: Application):
+        """Остановка фоновых сервисов"""
+        for task in self.background_tasks:
+            task.cancel()
+        self.jobs.cancel_all()
+        self.usage.flush()
+        self.db.close()
+        if self._charts:
+            self._charts.shutdown()
+        profiler.stop()
+        if self.metrics_runner:
+            await self.metrics_runner.cleanup()
     
     def run(self):
         """Запуск бота"""
+        if os.path.exists(SETTINGS_FILE):
+            reload_settings(SETTINGS_FILE)
+        
         # Создаем приложение
-        application = Application.builder().token(TELEGRAM_TOKEN).build()
+        # Обновления обрабатываются параллельно по полосам: быстрые команды не ждут ИИ
+        application = (
+            Application.builder().token(TELEGRAM_TOKEN)
+            .concurrent_updates(LaneUpdateProcessor(self.lanes))
+            .post_init(self.post_init).post_shutdown(self.post_shutdown)
+            .build()
+        )
         
         # Добавляем обработчики команд
         application.add_handler(CommandHandler("start", self.start_command))
         application.add_handler(CommandHandler("help", self.help_command))
         application.add_handler(CommandHandler("profile", self.profile_command))
         application.add_handler(CommandHandler("workout", self.workout_command))
+        application.add_handler(CommandHandler("last_plan", self.last_plan_command))
         application.add_handler(CommandHandler("group_workout", self.group_workout_command))
         application.add_handler(CommandHandler("progress", self.progress_command))
         application.add_handler(CommandHandler("motivation", self.motivation_command))
+        application.add_handler(CommandHandler("stats", self.stats_command))
+        application.add_handler(CommandHandler("log", self.log_command))
+        application.add_handler(CommandHandler("search", self.search_command))
         
         # Добавляем обработчики сообщений и callback
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
@@ -0,0 +1,116 @@
+"""
+Графики прогресса по метрикам
+
+Графики рисуются в пуле процессов, чтобы не блокировать цикл событий,
+и кешируются по ключу (user_id, метрика, id последнего замера):
+пока не появится новый замер, повторный просмотр не стоит ничего.
+После первой отправки вместо PNG в кеше хранится file_id Telegram,
+поэтому картинка не загружается повторно.
+"""
+
+import asyncio
+import io
+import logging
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+from metrics import metrics
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+ChartKey = Tuple[int, str, int]
+
+
+def render_metric_chart(metric_name: str, dates: List[str], values: List[float]) -> bytes:
+    """
+    Отрисовка истории одной метрики в PNG
+
+    Выполняется в рабочем процессе; matplotlib импортируется лениво,
+    чтобы не замедлять запуск бота.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(6, 3.5), dpi=100)
+    axes = figure.add_subplot()
+    axes.plot(range(len(values)), values, marker="o", color="#2e86de", linewidth=2)
+
+    # Подписываем не больше 8 дат, чтобы ось оставалась читаемой
+    step = max(1, len(dates) // 8)
+    axes.set_xticks(range(0, len(dates), step))
+    axes.set_xticklabels([d[5:10] for d in dates[::step]], rotation=45, fontsize=8)
+    axes.set_title(metric_name)
+    axes.grid(alpha=0.3)
+    figure.tight_layout()
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+class ChartRenderer:
+    """Отрисовка и кеширование графиков прогресса"""
+
+    def __init__(self, max_workers: Optional[int] = None, cache_size: Optional[int] = None):
+        # None - значения из settings на момент использования
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[ChartKey, Union[bytes, str]]" = OrderedDict()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers or settings.chart_workers)
+        return self._executor
+
+    def _remember(self, key: ChartKey, photo: Union[bytes, str]):
+        self._cache[key] = photo
+        self._cache.move_to_end(key)
+        cache_size = settings.chart_cache_size if self.cache_size is None else self.cache_size
+        while len(self._cache) > cache_size:
+            self._cache.popitem(last=False)
+
+    async def get_chart(self, user_id: int, metric_name: str, rows: List[Dict]) -> Tuple[ChartKey, Union[bytes, str]]:
+        """
+        График метрики: из кеша или новый
+
+        Args:
+            user_id: ID пользователя
+            metric_name: Название метрики
+            rows: Замеры метрики, упорядоченные по дате (get_user_progress)
+
+        Returns:
+            (ключ кеша, file_id Telegram или PNG)
+        """
+        key = (user_id, metric_name, max(row['id'] for row in rows))
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            metrics.inc('cache_hits_total', cache="chart")
+            return key, cached
+
+        metrics.inc('cache_misses_total', cache="chart")
+        loop = asyncio.get_running_loop()
+        with metrics.timer('chart_render_seconds'):
+            png = await loop.run_in_executor(
+                self._get_executor(),
+                render_metric_chart,
+                metric_name,
+                [str(row['date']) for row in rows],
+                [row['metric_value'] for row in rows],
+            )
+        self._remember(key, png)
+        return key, png
+
+    def remember_file_id(self, key: ChartKey, file_id: str):
+        """Замена PNG в кеше на file_id уже загруженной в Telegram картинки"""
+        self._remember(key, file_id)
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
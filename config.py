@@ -10,6 +10,10 @@ TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
 OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
 OPENROUTER_MODEL = "anthropic/claude-3.5-sonnet"  # Можно изменить на другую модель
+# Кеширование префикса промпта у провайдера: моделям из списка отправляются
+# точки кеширования cache_control, остальные (OpenAI, DeepSeek) кешируют сами
+PROMPT_CACHE = os.getenv('PROMPT_CACHE', 'true').lower() == 'true'
+PROMPT_CACHE_CONTROL_MODELS = ("anthropic/", "google/gemini")
 
 # Database
 DATABASE_PATH = "fitness_trainer.db"
@@ -17,7 +21,108 @@ DATABASE_PATH = "fitness_trainer.db"
 # Bot Settings
 BOT_NAME = "Спортивный Тренер"
 MAX_MESSAGE_LENGTH = 4096
-MAX_HISTORY_MESSAGES = 50
+MAX_HISTORY_MESSAGES = 20  # сообщений истории чата в промпте
+SEARCH_RESULTS = 10  # результатов /search (фрагменты по ~16 слов)
+# Память чата (memory.py): старые сообщения, похожие на новый ход, в пределах бюджета
+MEMORY_TOP_K = 5  # найденных сообщений на ход (0 - без памяти)
+MEMORY_TOKEN_BUDGET = 300  # токенов на блок найденных сообщений
+# Факты о пользователях (facts.py): фоновое извлечение из новых сообщений
+FACT_EXTRACTION_ENABLED = os.getenv('FACT_EXTRACTION_ENABLED', 'true').lower() == 'true'
+FACT_EXTRACTION_INTERVAL = 600  # seconds между запусками
+FACT_EXTRACTION_BATCH = 40  # сообщений в одном запросе к ИИ
+FACT_EXTRACTION_MAX_ATTEMPTS = 3  # неразобранных ответов на одну порцию, после чего она пропускается
+# Файл с настройками производительности (settings.py), перечитывается по SIGHUP
+SETTINGS_FILE = os.getenv('SETTINGS_FILE', 'settings.json')
+
+# Token Quotas (0 - без ограничения)
+USER_DAILY_TOKEN_QUOTA = int(os.getenv('USER_DAILY_TOKEN_QUOTA', '50000'))
+CHAT_DAILY_TOKEN_QUOTA = int(os.getenv('CHAT_DAILY_TOKEN_QUOTA', '200000'))
+USER_RATE_LIMIT = (5, 60)  # не больше 5 запросов к ИИ за 60 секунд
+CHAT_RATE_LIMIT = (20, 60)
+USAGE_FLUSH_INTERVAL = 30  # seconds
+USAGE_FLUSH_THRESHOLD = 100  # записей до принудительного сброса в базу
+
+# Batch Generation (рассылки: напоминания, итоги недели, мотивация)
+BATCH_CONCURRENCY = 4  # одновременных запросов пакета к ИИ
+BATCH_PACK_SIZE = 5  # персональных текстов в одном ответе модели (1 - без упаковки)
+BATCH_RATE_LIMIT = (30, 60)  # не больше 30 запросов пакетов к ИИ за 60 секунд
+
+# Weekly Recap (итоги недели в личные сообщения)
+WEEKLY_RECAP_ENABLED = os.getenv('WEEKLY_RECAP_ENABLED', 'true').lower() == 'true'
+WEEKLY_RECAP_DAY = 6  # день недели отправки (0 - понедельник, 6 - воскресенье)
+WEEKLY_RECAP_HOUR = 19  # час отправки (итоги за текущую неделю)
+RECAP_PAGE_SIZE = 200  # пользователей, читаемых из базы и генерируемых за раз
+RECAP_QUEUE_SIZE = 100  # готовых сообщений в очереди отправки
+RECAP_SEND_RATE = 20  # сообщений в секунду (лимит Telegram - около 30)
+
+# Content Pools (заранее сгенерированные мотивация и предложения)
+POOL_TARGET_SIZE = 10  # сообщений в каждой корзине (kind, level, context)
+POOL_BATCH_SIZE = 5  # сообщений за один запрос к ИИ
+POOL_REFILL_INTERVAL = 120  # seconds между проверками пула
+FITNESS_LEVELS = ["beginner", "intermediate", "advanced"]
+LEVEL_NAMES = {
+    'beginner': '🟢 Начинающий',
+    'intermediate': '🟡 Средний',
+    'advanced': '🔴 Продвинутый'
+}
+# Цели тренировок (users.goals) и их названия
+GOALS = ('general_fitness', 'weight_loss', 'muscle_gain', 'endurance')
+GOAL_NAMES = {
+    'general_fitness': "Общая физическая форма",
+    'weight_loss': "Снижение веса",
+    'muscle_gain': "Набор мышечной массы",
+    'endurance': "Выносливость",
+}
+# Относительная нагрузка уровней (для пересчета плана под другой уровень)
+LEVEL_INTENSITY = {
+    'beginner': 0.7,
+    'intermediate': 1.0,
+    'advanced': 1.3
+}
+POOL_BUCKETS = {
+    "motivation": ["morning_motivation"],
+    "suggestion": ["general", "after_cardio", "after_strength"],
+}
+
+# Workout Plans
+# Планы в виде JSON с локальным рендерингом (при неудачной проверке - обычный текст)
+STRUCTURED_PLANS = os.getenv('STRUCTURED_PLANS', 'true').lower() == 'true'
+# Если ИИ недоступен или не ответил за AI_PLAN_TIMEOUT, план собирается из каталога упражнений
+LOCAL_PLAN_FALLBACK = os.getenv('LOCAL_PLAN_FALLBACK', 'true').lower() == 'true'
+AI_PLAN_TIMEOUT = 30  # seconds (0 - без ограничения)
+GROUP_PLAN_CACHE_TTL = 24 * 3600  # seconds, сколько общий план для состава группы переиспользуется
+GROUP_ROSTER_NAMES = 5  # имен на уровень в составе группы
+ROSTER_CACHE_SIZE = 1024  # чатов в кеше блоков участников для системного промпта
+
+# Progress Analytics
+ANALYTICS_MA_WINDOW = 3  # замеров в скользящем среднем
+ANALYTICS_PLATEAU_POINTS = 4  # последних замеров для поиска плато
+ANALYTICS_PLATEAU_TOLERANCE = 0.02  # разброс не больше 2% от среднего - плато
+
+# Progress Charts
+CHART_WORKERS = 2  # процессов для отрисовки графиков
+CHART_CACHE_SIZE = 256  # графиков в кеше
+
+# Metrics & Profiling
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+METRICS_HOST = "127.0.0.1"  # Эндпоинт доступен только локально
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'false').lower() == 'true'
+PROFILER_INTERVAL = 0.01  # seconds между сэмплами стека
+
+# Update Lanes (параллельная обработка обновлений)
+LANE_FAST_CONCURRENCY = 64  # команд без ИИ одновременно
+LANE_SLOW_CONCURRENCY = 16  # запросов к ИИ и графиков одновременно
+LANE_SLOW_PER_CHAT = 2  # медленных обновлений одного чата одновременно
+BACKGROUND_JOB_DEADLINE = 90  # секунд на фоновую генерацию плана или анализа (0 - без ограничения)
+MESSAGE_DEBOUNCE = 1.5  # секунд ожидания следующих сообщений чата перед ответом (0 - отвечать сразу)
+
+# Startup
+# Модули, которые импортируются лениво и прогреваются в фоне после запуска
+PRELOAD_MODULES = [
+    "aiohttp", "workout_plans", "workout_generator", "analytics",
+    "pools", "charts", "group_planner", "recaps", "facts",
+]
 
 # Training Settings
 DEFAULT_TRAINING_DURATION = 45  # minutes
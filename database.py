@@ -1,22 +1,98 @@
 import sqlite3
 import json
+import math
+import threading
+import hashlib
+import zlib
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 import logging
 
+from config import GOALS
+from metrics import metrics
+from memory import BM25_B, BM25_K1, bm25_rank, term_counts, tokenize
+from records import ChatMemberRecord, MessageRecord, ProgressRecord, UserRecord, WorkoutRecord
+
 logger = logging.getLogger(__name__)
 
+# Версия схемы (PRAGMA user_version): увеличивать при каждом изменении таблиц,
+# индексов или миграций в init_database, иначе на существующих базах они не выполнятся
+SCHEMA_VERSION = 6
+
+# Начало периода агрегации для даты SQLite (неделя начинается с понедельника)
+STATS_PERIODS = {
+    'week': "date({}, 'weekday 0', '-6 days')",
+    'month': "date({}, 'start of month')",
+}
+
+# Ключ чата в полнотекстовом индексе: отдельный токен, по которому поиск ограничивается
+# одним чатом (у групп chat_id отрицательный, а '-' - разделитель токенов)
+FTS_CHAT_KEY = "'c' || REPLACE({}, '-', 'n')"
+# Границы совпадений в фрагментах search_messages (заменяются на HTML после экранирования)
+SNIPPET_OPEN, SNIPPET_CLOSE = '\x02', '\x03'
+# Последних совпадений в чате, среди которых ранжируется поиск по истории
+SEARCH_CANDIDATES = 500
+
+# Длительность тренировки по структурированному плану (workout_plans.WorkoutPlan)
+PLAN_MINUTES = "COALESCE(json_extract(workout_data, '$.plan.duration_min'), 0)"
+
+def pack_plan(plan_text: str) -> Tuple[str, bytes]:
+    """Адрес (sha256 текста) и сжатое содержимое плана тренировки"""
+    data = plan_text.encode('utf-8')
+    return hashlib.sha256(data).hexdigest(), zlib.compress(data, 9)
+
+
+def unpack_plan(blob: bytes) -> str:
+    return zlib.decompress(blob).decode('utf-8')
+
+
 class FitnessDatabase:
     def __init__(self, db_path: str):
         self.db_path = db_path
+        # Соединение на поток: открывается один раз, а не на каждый запрос
+        self._local = threading.local()
         self.init_database()
     
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Соединение текущего потока
+        
+        Открытие соединения и разбор схемы на каждый запрос занимали больше
+        времени, чем сами запросы. synchronous=NORMAL в режиме WAL не ждет
+        fsync при каждом коммите: при сбое питания могут потеряться последние
+        транзакции, но база остается целой.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+    
+    def close(self):
+        """Закрытие соединения текущего потока"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+    
+    @metrics.timed('db_query_seconds', 'method')
     def init_database(self):
         """Инициализация базы данных и создание таблиц"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
+                # WAL: чтение не ждет записи, коммит пишет в журнал без перезаписи базы
+                cursor.execute('PRAGMA journal_mode=WAL')
+                
+                # Схема уже актуальна - DDL и миграции не нужны
+                cursor.execute('PRAGMA user_version')
+                stored_version = cursor.fetchone()[0]
+                if stored_version == SCHEMA_VERSION:
+                    logger.info("Схема базы данных актуальна")
+                    return
+                
                 # Таблица пользователей
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS users (
@@ -83,16 +159,354 @@ class FitnessDatabase:
                     )
                 ''')
                 
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_progress_user_metric ON progress (user_id, metric_name, date)
+                ''')
+                
+                # Таблица расхода токенов (по пользователю, чату и дню)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS token_usage (
+                        user_id INTEGER,
+                        chat_id INTEGER,
+                        day DATE,
+                        requests INTEGER DEFAULT 0,
+                        prompt_tokens INTEGER DEFAULT 0,
+                        completion_tokens INTEGER DEFAULT 0,
+                        cost REAL DEFAULT 0,
+                        PRIMARY KEY (user_id, chat_id, day)
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_token_usage_chat ON token_usage (chat_id, day)
+                ''')
+                
+                # Пул заранее сгенерированных сообщений (мотивация, предложения тренировок)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS content_pool (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        kind TEXT,
+                        level TEXT,
+                        context TEXT,
+                        text TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_content_pool_bucket ON content_pool (kind, level, context)
+                ''')
+                
+                # Общие планы групповых тренировок по составу группы (набору уровней)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS group_plans (
+                        composition TEXT PRIMARY KEY,
+                        plan_data TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                
+                # Миграция: чат, в котором была создана тренировка
+                if self._add_column(cursor, 'workouts', 'chat_id', 'INTEGER'):
+                    cursor.execute('''
+                        UPDATE workouts SET chat_id = json_extract(workout_data, '$.chat_id')
+                        WHERE chat_id IS NULL AND json_valid(workout_data)
+                    ''')
+                
+                # Тексты планов: хранятся один раз по хешу содержимого, в сжатом виде
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS plan_blobs (
+                        hash TEXT PRIMARY KEY,
+                        data BLOB,
+                        size INTEGER,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                self._add_column(cursor, 'workouts', 'plan_hash', 'TEXT')
+                
+                # Миграция: групповая тренировка, общая для всех участников (ID первой записи группы)
+                self._add_column(cursor, 'workouts', 'group_id', 'INTEGER')
+                
+                # Предагрегированная статистика тренировок по неделям и месяцам
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS workout_stats (
+                        scope TEXT,
+                        scope_id INTEGER,
+                        period TEXT,
+                        period_start DATE,
+                        workout_type TEXT,
+                        total INTEGER DEFAULT 0,
+                        completed INTEGER DEFAULT 0,
+                        PRIMARY KEY (scope, scope_id, period, period_start, workout_type)
+                    )
+                ''')
+                # Минуты выполненных тренировок (из структурированных планов)
+                if self._add_column(cursor, 'workout_stats', 'minutes', 'INTEGER DEFAULT 0'):
+                    cursor.execute('DELETE FROM workout_stats')
+                
+                # Серии и регулярность тренировок пользователя
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS user_streaks (
+                        user_id INTEGER PRIMARY KEY,
+                        current_streak INTEGER DEFAULT 0,
+                        best_streak INTEGER DEFAULT 0,
+                        last_completed_day DATE,
+                        total_assigned INTEGER DEFAULT 0,
+                        total_completed INTEGER DEFAULT 0
+                    )
+                ''')
+                
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_workouts_user_created ON workouts (user_id, created_at)
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_message_history_chat ON message_history (chat_id, id)
+                ''')
+                
+                # Индекс памяти чата (memory.py): термы сообщений пользователей для поиска BM25
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS memory_postings (
+                        term TEXT,
+                        chat_id INTEGER,
+                        message_id INTEGER,
+                        tf INTEGER,
+                        PRIMARY KEY (term, chat_id, message_id)
+                    ) WITHOUT ROWID
+                ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS memory_docs (
+                        message_id INTEGER PRIMARY KEY,
+                        chat_id INTEGER,
+                        length INTEGER
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS memory_chats (
+                        chat_id INTEGER PRIMARY KEY,
+                        docs INTEGER DEFAULT 0,
+                        total_length INTEGER DEFAULT 0,
+                        last_message_id INTEGER DEFAULT 0
+                    )
+                ''')
+                
+                # Факты о пользователях из переписки (facts.py) и курсор их извлечения
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS user_facts (
+                        user_id INTEGER,
+                        key TEXT,
+                        value TEXT,
+                        message_id INTEGER,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (user_id, key)
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS fact_extraction_cursor (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        last_message_id INTEGER DEFAULT 0
+                    )
+                ''')
+                cursor.execute('INSERT OR IGNORE INTO fact_extraction_cursor (id, last_message_id) VALUES (1, 0)')
+                
+                # Полнотекстовый индекс истории (FTS5) с внешним содержимым: тексты не дублируются,
+                # индекс обновляется триггерами при любой записи в message_history. Префиксные
+                # индексы ускоряют поиск по основе слова (search_messages ищет 'колен*')
+                cursor.execute(f'''
+                    CREATE VIEW IF NOT EXISTS message_fts_source AS
+                    SELECT id, message_text, {FTS_CHAT_KEY.format('chat_id')} AS chat_key FROM message_history
+                ''')
+                cursor.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5 (
+                        message_text, chat_key,
+                        content = 'message_fts_source', content_rowid = 'id',
+                        tokenize = 'unicode61 remove_diacritics 2',
+                        prefix = '3 4 5 6'
+                    )
+                ''')
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS message_history_fts_insert AFTER INSERT ON message_history BEGIN
+                        INSERT INTO message_fts (rowid, message_text, chat_key)
+                        VALUES (new.id, new.message_text, {FTS_CHAT_KEY.format('new.chat_id')});
+                    END
+                ''')
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS message_history_fts_delete AFTER DELETE ON message_history BEGIN
+                        INSERT INTO message_fts (message_fts, rowid, message_text, chat_key)
+                        VALUES ('delete', old.id, old.message_text, {FTS_CHAT_KEY.format('old.chat_id')});
+                    END
+                ''')
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS message_history_fts_update AFTER UPDATE ON message_history BEGIN
+                        INSERT INTO message_fts (message_fts, rowid, message_text, chat_key)
+                        VALUES ('delete', old.id, old.message_text, {FTS_CHAT_KEY.format('old.chat_id')});
+                        INSERT INTO message_fts (rowid, message_text, chat_key)
+                        VALUES (new.id, new.message_text, {FTS_CHAT_KEY.format('new.chat_id')});
+                    END
+                ''')
+                cursor.execute("INSERT INTO message_fts (message_fts) VALUES ('rebuild')")
+                
+                # Первичное заполнение статистики для уже существующих тренировок
+                cursor.execute('SELECT EXISTS (SELECT 1 FROM workout_stats)')
+                if not cursor.fetchone()[0]:
+                    self._backfill_workout_stats(cursor)
+                # Миграции данных по версиям: выполняются один раз, только на базах старее версии
+                if stored_version < 6:
+                    # Цели из фактов копировались в users.goals текстом модели - в профиле
+                    # возвращается код цели по умолчанию, а сами цели остаются в user_facts
+                    cursor.execute(f'''
+                        UPDATE users SET goals = 'general_fitness'
+                        WHERE goals NOT IN ({', '.join('?' * len(GOALS))})
+                    ''', GOALS)
+                
+                cursor.execute('SELECT EXISTS (SELECT 1 FROM user_streaks)')
+                if not cursor.fetchone()[0]:
+                    self._backfill_user_streaks(cursor)
+                cursor.execute('SELECT EXISTS (SELECT 1 FROM memory_chats)')
+                if not cursor.fetchone()[0]:
+                    self._backfill_memory_index(cursor)
+                
+                cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
                 conn.commit()
                 logger.info("База данных инициализирована успешно")
                 
         except Exception as e:
             logger.error(f"Ошибка инициализации базы данных: {e}")
     
+    @staticmethod
+    def _add_column(cursor, table: str, column: str, definition: str) -> bool:
+        """Добавление колонки в существующую таблицу (True, если колонка была добавлена)"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        if any(row[1] == column for row in cursor.fetchall()):
+            return False
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        return True
+    
+    @staticmethod
+    def _bump_workout_stats(cursor, workout_id: int, total_delta: int, completed_delta: int):
+        """Инкрементальное обновление недельной и месячной статистики по одной тренировке"""
+        for scope, column in (('user', 'user_id'), ('chat', 'chat_id')):
+            for period, start_expr in STATS_PERIODS.items():
+                cursor.execute(f'''
+                    INSERT INTO workout_stats (scope, scope_id, period, period_start, workout_type, total, completed, minutes)
+                    SELECT ?, {column}, ?, {start_expr.format('created_at')}, workout_type, ?, ?,
+                           ? * {PLAN_MINUTES}
+                    FROM workouts
+                    WHERE id = ? AND {column} IS NOT NULL
+                    ON CONFLICT (scope, scope_id, period, period_start, workout_type) DO UPDATE SET
+                        total = total + excluded.total,
+                        completed = completed + excluded.completed,
+                        minutes = minutes + excluded.minutes
+                ''', (scope, period, total_delta, completed_delta, completed_delta, workout_id))
+    
+    @staticmethod
+    def _backfill_workout_stats(cursor):
+        """Пересчет статистики по всем тренировкам одним проходом на период"""
+        cursor.execute('DELETE FROM workout_stats')
+        for scope, column in (('user', 'user_id'), ('chat', 'chat_id')):
+            for period, start_expr in STATS_PERIODS.items():
+                cursor.execute(f'''
+                    INSERT INTO workout_stats (scope, scope_id, period, period_start, workout_type, total, completed, minutes)
+                    SELECT ?, {column}, ?, {start_expr.format('created_at')}, workout_type,
+                           COUNT(*), SUM(CASE WHEN completed THEN 1 ELSE 0 END),
+                           SUM(CASE WHEN completed THEN {PLAN_MINUTES} ELSE 0 END)
+                    FROM workouts
+                    WHERE {column} IS NOT NULL
+                    GROUP BY {column}, {start_expr.format('created_at')}, workout_type
+                ''', (scope, period))
+    
+    @staticmethod
+    def _backfill_user_streaks(cursor):
+        """Пересчет серий и регулярности по всем тренировкам"""
+        cursor.execute('DELETE FROM user_streaks')
+        cursor.execute('''
+            INSERT INTO user_streaks (user_id, total_assigned, total_completed)
+            SELECT user_id, COUNT(*), SUM(CASE WHEN completed THEN 1 ELSE 0 END)
+            FROM workouts
+            GROUP BY user_id
+        ''')
+        
+        cursor.execute('''
+            SELECT DISTINCT user_id, date(completed_date)
+            FROM workouts
+            WHERE completed AND completed_date IS NOT NULL
+            ORDER BY user_id, 2
+        ''')
+        streaks = {}
+        for user_id, day in cursor.fetchall():
+            day = datetime.strptime(day, '%Y-%m-%d').date()
+            current, best, last_day = streaks.get(user_id, (0, 0, None))
+            current = current + 1 if last_day and (day - last_day).days == 1 else 1
+            streaks[user_id] = (current, max(best, current), day)
+        
+        cursor.executemany('''
+            UPDATE user_streaks SET current_streak = ?, best_streak = ?, last_completed_day = ?
+            WHERE user_id = ?
+        ''', [(current, best, day.isoformat(), user_id) for user_id, (current, best, day) in streaks.items()])
+    
+    @staticmethod
+    def _index_messages(cursor, rows: List[Tuple]):
+        """
+        Добавление сообщений в индекс памяти чата
+        
+        Args:
+            rows: (id, chat_id, message_text) сообщений пользователей по возрастанию id
+        """
+        chats = {}
+        for message_id, chat_id, message_text in rows:
+            docs, total_length, _ = chats.get(chat_id, (0, 0, 0))
+            counts = term_counts(message_text or '')
+            if counts:
+                length = sum(counts.values())
+                cursor.executemany('''
+                    INSERT OR IGNORE INTO memory_postings (term, chat_id, message_id, tf) VALUES (?, ?, ?, ?)
+                ''', [(term, chat_id, message_id, tf) for term, tf in counts.items()])
+                cursor.execute('''
+                    INSERT OR IGNORE INTO memory_docs (message_id, chat_id, length) VALUES (?, ?, ?)
+                ''', (message_id, chat_id, length))
+                docs, total_length = docs + 1, total_length + length
+            chats[chat_id] = (docs, total_length, message_id)
+        
+        cursor.executemany('''
+            INSERT INTO memory_chats (chat_id, docs, total_length, last_message_id) VALUES (?, ?, ?, ?)
+            ON CONFLICT (chat_id) DO UPDATE SET
+                docs = docs + excluded.docs,
+                total_length = total_length + excluded.total_length,
+                last_message_id = MAX(last_message_id, excluded.last_message_id)
+        ''', [(chat_id, *totals) for chat_id, totals in chats.items()])
+    
+    @classmethod
+    def _backfill_memory_index(cls, cursor):
+        """Индексация уже сохраненных сообщений пользователей"""
+        last_id = 0
+        while True:
+            rows = cursor.execute('''
+                SELECT id, chat_id, message_text FROM message_history
+                WHERE id > ? AND user_id != 0
+                ORDER BY id
+                LIMIT 1000
+            ''', (last_id,)).fetchall()
+            if not rows:
+                break
+            cls._index_messages(cursor, rows)
+            last_id = rows[-1][0]
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def backfill_workout_stats(self):
+        """Полный пересчет предагрегированной статистики тренировок"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                self._backfill_workout_stats(cursor)
+                self._backfill_user_streaks(cursor)
+                conn.commit()
+                logger.info("Статистика тренировок пересчитана")
+                
+        except Exception as e:
+            logger.error(f"Ошибка пересчета статистики тренировок: {e}")
+    
+    @metrics.timed('db_query_seconds', 'method')
     def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
         """Добавление нового пользователя"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT OR REPLACE INTO users (user_id, username, first_name, last_name)
@@ -103,10 +517,11 @@ class FitnessDatabase:
         except Exception as e:
             logger.error(f"Ошибка добавления пользователя: {e}")
     
+    @metrics.timed('db_query_seconds', 'method')
     def add_chat(self, chat_id: int, chat_type: str, chat_title: str = None):
         """Добавление нового чата"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT OR REPLACE INTO chats (chat_id, chat_type, chat_title)
@@ -117,18 +532,19 @@ class FitnessDatabase:
         except Exception as e:
             logger.error(f"Ошибка добавления чата: {e}")
     
+    @metrics.timed('db_query_seconds', 'method')
     def save_message(self, chat_id: int, user_id: int, message_text: str):
         """Сохранение сообщения в историю"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO message_history (chat_id, user_id, message_text)
                     VALUES (?, ?, ?)
                 ''', (chat_id, user_id, message_text))
-                conn.commit()
                 
-                # Обновляем время последней активности пользователя
+                # Обновляем время последней активности пользователя (в той же транзакции,
+                # что и сообщение с записью в полнотекстовый индекс)
                 cursor.execute('''
                     UPDATE users SET last_activity = CURRENT_TIMESTAMP
                     WHERE user_id = ?
@@ -138,10 +554,11 @@ class FitnessDatabase:
         except Exception as e:
             logger.error(f"Ошибка сохранения сообщения: {e}")
     
-    def get_chat_history(self, chat_id: int, limit: int = 50) -> List[Dict]:
+    @metrics.timed('db_query_seconds', 'method')
+    def get_chat_history(self, chat_id: int, limit: int = 50) -> List[MessageRecord]:
         """Получение истории чата"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT mh.user_id, mh.message_text, mh.timestamp, u.first_name, u.username
@@ -152,15 +569,7 @@ class FitnessDatabase:
                     LIMIT ?
                 ''', (chat_id, limit))
                 
-                history = []
-                for row in cursor.fetchall():
-                    history.append({
-                        'user_id': row[0],
-                        'message': row[1],
-                        'timestamp': row[2],
-                        'first_name': row[3],
-                        'username': row[4]
-                    })
+                history = [MessageRecord(*row) for row in cursor.fetchall()]
                 
                 return history[::-1]  # Возвращаем в хронологическом порядке
                 
@@ -168,10 +577,271 @@ class FitnessDatabase:
             logger.error(f"Ошибка получения истории чата: {e}")
             return []
     
-    def get_user_info(self, user_id: int) -> Optional[Dict]:
+    @metrics.timed('db_query_seconds', 'method')
+    def update_memory_index(self, chat_id: int) -> int:
+        """
+        Индексация новых сообщений чата (после последнего проиндексированного)
+        
+        Индекс догоняет историю перед поиском, а не при каждом save_message,
+        поэтому запись сообщения не замедляется, а сообщения одного хода
+        индексируются одной транзакцией. Ответы бота (user_id = 0) не индексируются.
+        
+        Returns:
+            Число проиндексированных сообщений
+        """
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                row = cursor.execute(
+                    'SELECT last_message_id FROM memory_chats WHERE chat_id = ?', (chat_id,)
+                ).fetchone()
+                cursor.execute('''
+                    SELECT id, chat_id, message_text FROM message_history
+                    WHERE chat_id = ? AND id > ? AND user_id != 0
+                    ORDER BY id
+                ''', (chat_id, row[0] if row else 0))
+                rows = cursor.fetchall()
+                if rows:
+                    self._index_messages(cursor, rows)
+                    conn.commit()
+                return len(rows)
+                
+        except Exception as e:
+            logger.error(f"Ошибка обновления индекса памяти чата: {e}")
+            return 0
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def search_memory(self, chat_id: int, terms: List[str], limit: int = 5, skip_recent: int = 0) -> List[Dict]:
+        """
+        Поиск по индексу памяти чата (BM25)
+        
+        Args:
+            chat_id: ID чата
+            terms: Термы запроса (memory.tokenize)
+            limit: Максимум результатов
+            skip_recent: Не искать среди последних сообщений чата (они уже в окне истории)
+        
+        Returns:
+            Сообщения по убыванию релевантности: id, message, timestamp, first_name, score
+        """
+        terms = sorted(set(terms))
+        if not terms:
+            return []
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                row = cursor.execute(
+                    'SELECT docs, total_length FROM memory_chats WHERE chat_id = ?', (chat_id,)
+                ).fetchone()
+                if not row or not row[0]:
+                    return []
+                docs, avg_length = row[0], row[1] / row[0]
+                
+                # Искать только среди сообщений старше окна истории
+                before_id = 2 ** 62
+                if skip_recent:
+                    before_id = cursor.execute('''
+                        SELECT MIN(id) FROM (
+                            SELECT id FROM message_history WHERE chat_id = ? AND user_id != 0 ORDER BY id DESC LIMIT ?
+                        )
+                    ''', (chat_id, skip_recent)).fetchone()[0] or 0
+                
+                placeholders = ', '.join('?' * len(terms))
+                df = dict(cursor.execute(f'''
+                    SELECT term, COUNT(*) FROM memory_postings
+                    WHERE chat_id = ? AND term IN ({placeholders})
+                    GROUP BY term
+                ''', (chat_id, *terms)).fetchall())
+                # IDF с поправкой +1 под логарифмом: частые термы получают малый, но не отрицательный вес
+                weights = [
+                    (term, math.log(1 + (docs - n + 0.5) / (n + 0.5)))
+                    for term, n in df.items()
+                ]
+                if not weights:
+                    return []
+                
+                values = ', '.join(['(?, ?)'] * len(weights))
+                cursor.execute(f'''
+                    WITH query (term, weight) AS (VALUES {values}),
+                    scores AS (
+                        SELECT p.message_id,
+                               SUM(q.weight * p.tf * ({BM25_K1} + 1)
+                                   / (p.tf + {BM25_K1} * (1 - {BM25_B} + {BM25_B} * d.length / ?))) AS score
+                        FROM query q
+                        JOIN memory_postings p ON p.term = q.term AND p.chat_id = ?
+                        JOIN memory_docs d ON d.message_id = p.message_id
+                        WHERE p.message_id < ?
+                        GROUP BY p.message_id
+                        ORDER BY score DESC
+                        LIMIT ?
+                    )
+                    SELECT mh.id, mh.message_text, mh.timestamp, u.first_name, s.score
+                    FROM scores s
+                    JOIN message_history mh ON mh.id = s.message_id
+                    LEFT JOIN users u ON u.user_id = mh.user_id
+                    ORDER BY s.score DESC
+                ''', (*[value for pair in weights for value in pair], avg_length, chat_id, before_id, limit))
+                
+                return [
+                    {'id': message_id, 'message': text, 'timestamp': timestamp, 'first_name': first_name, 'score': score}
+                    for message_id, text, timestamp, first_name, score in cursor.fetchall()
+                ]
+                
+        except Exception as e:
+            logger.error(f"Ошибка поиска по памяти чата: {e}")
+            return []
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def search_messages(self, chat_id: int, query: str, limit: int = 10) -> List[Dict]:
+        """
+        Полнотекстовый поиск по истории чата (FTS5, ранжирование BM25)
+        
+        Слова запроса ищутся все сразу, по основе слова: 'колено' найдет
+        'колени' и 'коленом'. Ранжируются (BM25) последние SEARCH_CANDIDATES
+        совпадений в чате, поэтому время поиска не зависит от размера истории
+        и частоты слов. Совпадения в фрагментах обрамлены SNIPPET_OPEN / SNIPPET_CLOSE.
+        
+        Args:
+            chat_id: ID чата
+            query: Текст запроса
+            limit: Максимум результатов
+        
+        Returns:
+            Сообщения по убыванию релевантности: id, user_id, first_name, timestamp, snippet
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        # Термы в кавычках (без синтаксиса FTS5 из ввода пользователя), с поиском по префиксу-основе
+        match = 'chat_key : "c{}" AND message_text : ({})'.format(
+            str(chat_id).replace('-', 'n'),
+            " ".join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+        )
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                # Совпадения в чате от новых к старым: FTS5 перебирает их без подсчета
+                # глобальной статистики термов, поэтому частые слова не замедляют поиск
+                cursor.execute('''
+                    SELECT rowid, message_text FROM message_fts
+                    WHERE message_fts MATCH ?
+                    ORDER BY rowid DESC
+                    LIMIT ?
+                ''', (match, SEARCH_CANDIDATES))
+                ranked = bm25_rank(cursor.fetchall(), terms)[:limit]
+                if not ranked:
+                    return []
+                
+                placeholders = ', '.join('?' * len(ranked))
+                cursor.execute(f'''
+                    SELECT mh.id, mh.user_id, u.first_name, mh.timestamp,
+                           snippet(message_fts, 0, ?, ?, '…', 16)
+                    FROM message_fts
+                    JOIN message_history mh ON mh.id = message_fts.rowid
+                    LEFT JOIN users u ON u.user_id = mh.user_id
+                    WHERE message_fts MATCH ? AND message_fts.rowid IN ({placeholders})
+                ''', (SNIPPET_OPEN, SNIPPET_CLOSE, match, *ranked))
+                rows = {row[0]: row for row in cursor.fetchall()}
+                
+                return [
+                    {'id': message_id, 'user_id': user_id, 'first_name': first_name,
+                     'timestamp': timestamp, 'snippet': snippet}
+                    for message_id, user_id, first_name, timestamp, snippet in (rows[i] for i in ranked if i in rows)
+                ]
+                
+        except Exception as e:
+            logger.error(f"Ошибка поиска по истории чата: {e}")
+            return []
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def get_messages_after_cursor(self, limit: int) -> List[Dict]:
+        """Сообщения пользователей после курсора извлечения фактов (по возрастанию id)"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT mh.id, mh.chat_id, mh.user_id, u.first_name, mh.message_text
+                    FROM message_history mh
+                    LEFT JOIN users u ON u.user_id = mh.user_id
+                    WHERE mh.id > (SELECT last_message_id FROM fact_extraction_cursor WHERE id = 1)
+                      AND mh.user_id != 0
+                    ORDER BY mh.id
+                    LIMIT ?
+                ''', (limit,))
+                
+                return [
+                    {'id': message_id, 'chat_id': chat_id, 'user_id': user_id, 'first_name': first_name, 'message': text}
+                    for message_id, chat_id, user_id, first_name, text in cursor.fetchall()
+                ]
+                
+        except Exception as e:
+            logger.error(f"Ошибка получения сообщений для извлечения фактов: {e}")
+            return []
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def save_user_facts(self, facts: List[Tuple], last_message_id: int) -> bool:
+        """
+        Сохранение фактов и сдвиг курсора извлечения одной транзакцией
+        
+        Args:
+            facts: (user_id, key, value, message_id); value = None удаляет факт
+            last_message_id: Последнее обработанное сообщение
+        """
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                for user_id, key, value, message_id in facts:
+                    if value is None:
+                        cursor.execute('DELETE FROM user_facts WHERE user_id = ? AND key = ?', (user_id, key))
+                        continue
+                    cursor.execute('''
+                        INSERT INTO user_facts (user_id, key, value, message_id) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (user_id, key) DO UPDATE SET
+                            value = excluded.value,
+                            message_id = excluded.message_id,
+                            updated_at = CURRENT_TIMESTAMP
+                    ''', (user_id, key, value, message_id))
+                cursor.execute('''
+                    UPDATE fact_extraction_cursor SET last_message_id = MAX(last_message_id, ?) WHERE id = 1
+                ''', (last_message_id,))
+                conn.commit()
+                return True
+                
+        except Exception as e:
+            logger.error(f"Ошибка сохранения фактов о пользователях: {e}")
+            return False
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def get_users_facts(self, user_ids: List[int]) -> Dict[int, Dict[str, str]]:
+        """Факты о пользователях: user_id -> {ключ: значение}"""
+        if not user_ids:
+            return {}
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                placeholders = ', '.join('?' * len(user_ids))
+                cursor.execute(f'''
+                    SELECT user_id, key, value FROM user_facts WHERE user_id IN ({placeholders})
+                ''', list(user_ids))
+                
+                facts: Dict[int, Dict[str, str]] = {}
+                for user_id, key, value in cursor.fetchall():
+                    facts.setdefault(user_id, {})[key] = value
+                return facts
+                
+        except Exception as e:
+            logger.error(f"Ошибка получения фактов о пользователях: {e}")
+            return {}
+    
+    def get_user_facts(self, user_id: int) -> Dict[str, str]:
+        """Факты о пользователе: {ключ: значение}"""
+        return self.get_users_facts([user_id]).get(user_id, {})
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def get_user_info(self, user_id: int) -> Optional[UserRecord]:
         """Получение информации о пользователе"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT user_id, username, first_name, last_name, fitness_level, goals
@@ -180,24 +850,18 @@ class FitnessDatabase:
                 
                 row = cursor.fetchone()
                 if row:
-                    return {
-                        'user_id': row[0],
-                        'username': row[1],
-                        'first_name': row[2],
-                        'last_name': row[3],
-                        'fitness_level': row[4],
-                        'goals': row[5]
-                    }
+                    return UserRecord(*row)
                 return None
                 
         except Exception as e:
             logger.error(f"Ошибка получения информации о пользователе: {e}")
             return None
     
+    @metrics.timed('db_query_seconds', 'method')
     def update_user_fitness_info(self, user_id: int, fitness_level: str = None, goals: str = None):
         """Обновление фитнес-информации пользователя"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 if fitness_level and goals:
                     cursor.execute('''
@@ -221,25 +885,328 @@ class FitnessDatabase:
         except Exception as e:
             logger.error(f"Ошибка обновления информации пользователя: {e}")
     
-    def save_workout(self, user_id: int, workout_type: str, workout_data: Dict, scheduled_date: str = None):
-        """Сохранение тренировки"""
+    @metrics.timed('db_query_seconds', 'method')
+    def save_workout(self, user_id: int, workout_type: str, workout_data: Dict, scheduled_date: str = None,
+                     chat_id: int = None, plan_text: str = None) -> Optional[int]:
+        """
+        Сохранение тренировки
+        
+        Args:
+            plan_text: Текст плана; одинаковые планы хранятся в plan_blobs один раз
+        
+        Returns:
+            ID тренировки или None в случае ошибки
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO workouts (user_id, workout_type, workout_data, scheduled_date)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_id, workout_type, json.dumps(workout_data), scheduled_date))
+                plan_hash = self._save_plan_blob(cursor, plan_text)
+                workout_id = self._insert_workout(
+                    cursor, user_id, workout_type, json.dumps(workout_data), scheduled_date, chat_id, plan_hash
+                )
                 conn.commit()
                 logger.info(f"Тренировка для пользователя {user_id} сохранена")
+                return workout_id
                 
         except Exception as e:
             logger.error(f"Ошибка сохранения тренировки: {e}")
+            return None
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def save_group_workout(self, user_ids: List[int], workout_data: Dict, chat_id: int,
+                           plan_text: str = None) -> Optional[int]:
+        """
+        Сохранение групповой тренировки для всех участников одной транзакцией
+        
+        Записи участников связаны общим group_id, по которому каждый
+        отмечает свою тренировку (complete_workout).
+        
+        Returns:
+            ID группы (ID первой записи) или None в случае ошибки
+        """
+        if not user_ids:
+            return None
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                plan_hash = self._save_plan_blob(cursor, plan_text)
+                data = json.dumps(workout_data)
+                group_id = None
+                for user_id in user_ids:
+                    workout_id = self._insert_workout(cursor, user_id, "group", data, None, chat_id, plan_hash, group_id)
+                    if group_id is None:
+                        group_id = workout_id
+                        cursor.execute('UPDATE workouts SET group_id = ? WHERE id = ?', (group_id, workout_id))
+                conn.commit()
+                logger.info(f"Групповая тренировка {group_id} сохранена для {len(user_ids)} участников")
+                return group_id
+                
+        except Exception as e:
+            logger.error(f"Ошибка сохранения групповой тренировки: {e}")
+            return None
+    
+    @staticmethod
+    def _save_plan_blob(cursor, plan_text: Optional[str]) -> Optional[str]:
+        """Текст плана в plan_blobs (один раз на содержимое); возвращает хеш или None без текста"""
+        if not plan_text:
+            return None
+        plan_hash, blob = pack_plan(plan_text)
+        cursor.execute('''
+            INSERT OR IGNORE INTO plan_blobs (hash, data, size)
+            VALUES (?, ?, ?)
+        ''', (plan_hash, blob, len(plan_text)))
+        return plan_hash
+    
+    def _insert_workout(self, cursor, user_id: int, workout_type: str, workout_data: str,
+                        scheduled_date: Optional[str], chat_id: Optional[int], plan_hash: Optional[str],
+                        group_id: int = None) -> int:
+        """Запись тренировки со статистикой и счетчиком назначенных тренировок"""
+        cursor.execute('''
+            INSERT INTO workouts (user_id, workout_type, workout_data, scheduled_date, chat_id, plan_hash, group_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, workout_type, workout_data, scheduled_date, chat_id, plan_hash, group_id))
+        workout_id = cursor.lastrowid
+        self._bump_workout_stats(cursor, workout_id, 1, 0)
+        cursor.execute('''
+            INSERT INTO user_streaks (user_id, total_assigned) VALUES (?, 1)
+            ON CONFLICT (user_id) DO UPDATE SET total_assigned = total_assigned + 1
+        ''', (user_id,))
+        return workout_id
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def complete_workout(self, user_id: int, workout_id: int = None, group_id: int = None) -> bool:
+        """
+        Отметка тренировки пользователя выполненной
+        
+        Args:
+            user_id: ID пользователя (чужую тренировку отметить нельзя)
+            workout_id: ID тренировки
+            group_id: ID групповой тренировки (save_group_workout) - отмечается запись этого пользователя
+        
+        Returns:
+            True, если статус изменился
+        """
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                # Точечное обновление по первичному ключу или по группе и пользователю
+                column, value = ('group_id', group_id) if group_id is not None else ('id', workout_id)
+                cursor.execute(f'''
+                    UPDATE workouts SET completed = TRUE, completed_date = CURRENT_TIMESTAMP
+                    WHERE {column} = ? AND user_id = ? AND NOT completed
+                    RETURNING id
+                ''', (value, user_id))
+                completed_ids = [row[0] for row in cursor.fetchall()]
+                if not completed_ids:
+                    return False
+                
+                for completed_id in completed_ids:
+                    self._bump_workout_stats(cursor, completed_id, 0, 1)
+                
+                # Серия растет, если вчера тоже была выполненная тренировка
+                cursor.execute('''
+                    INSERT INTO user_streaks (user_id, current_streak, best_streak, last_completed_day, total_completed)
+                    VALUES (?, 1, 1, date('now'), ?)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        current_streak = CASE
+                            WHEN last_completed_day = date('now') THEN current_streak
+                            WHEN last_completed_day = date('now', '-1 day') THEN current_streak + 1
+                            ELSE 1 END,
+                        best_streak = MAX(best_streak, CASE
+                            WHEN last_completed_day = date('now') THEN current_streak
+                            WHEN last_completed_day = date('now', '-1 day') THEN current_streak + 1
+                            ELSE 1 END),
+                        last_completed_day = date('now'),
+                        total_completed = total_completed + excluded.total_completed
+                ''', (user_id, len(completed_ids)))
+                conn.commit()
+                logger.info(f"Тренировка {completed_ids[0]} пользователя {user_id} выполнена")
+                return True
+                
+        except Exception as e:
+            logger.error(f"Ошибка отметки тренировки: {e}")
+            return False
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def get_user_streak(self, user_id: int) -> Dict:
+        """Текущая и лучшая серия, регулярность выполнения тренировок"""
+        streak = {
+            'current_streak': 0,
+            'best_streak': 0,
+            'total_assigned': 0,
+            'total_completed': 0,
+            'adherence': 0
+        }
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                # Серия обнуляется, если последний выполненный день раньше вчерашнего
+                cursor.execute('''
+                    SELECT CASE WHEN last_completed_day >= date('now', '-1 day') THEN current_streak ELSE 0 END,
+                           best_streak, total_assigned, total_completed
+                    FROM user_streaks WHERE user_id = ?
+                ''', (user_id,))
+                row = cursor.fetchone()
+                if row:
+                    streak.update(zip(('current_streak', 'best_streak', 'total_assigned', 'total_completed'), row))
+                    if streak['total_assigned']:
+                        streak['adherence'] = round(streak['total_completed'] / streak['total_assigned'] * 100, 1)
+                return streak
+                
+        except Exception as e:
+            logger.error(f"Ошибка получения серии тренировок: {e}")
+            return streak
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def get_workout_stats(self, scope: str, scope_id: int, period: str = 'week') -> Dict:
+        """
+        Статистика тренировок за текущую неделю или месяц
+        
+        Args:
+            scope: 'user' или 'chat'
+            scope_id: ID пользователя или чата
+            period: 'week' или 'month'
+        
+        Returns:
+            Статистика в формате utils.calculate_weekly_stats
+        """
+        stats = {
+            'total_workouts': 0,
+            'completed_workouts': 0,
+            'completion_rate': 0,
+            'workout_types': {},
+            'minutes': 0
+        }
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT workout_type, total, completed, minutes
+                    FROM workout_stats
+                    WHERE scope = ? AND scope_id = ? AND period = ?
+                      AND period_start = {STATS_PERIODS[period].format("'now'")}
+                ''', (scope, scope_id, period))
+                
+                for workout_type, total, completed, minutes in cursor.fetchall():
+                    stats['total_workouts'] += total
+                    stats['completed_workouts'] += completed
+                    stats['minutes'] += minutes or 0
+                    stats['workout_types'][workout_type] = total
+                
+                if stats['total_workouts']:
+                    stats['completion_rate'] = round(stats['completed_workouts'] / stats['total_workouts'] * 100, 1)
+                return stats
+                
+        except Exception as e:
+            logger.error(f"Ошибка получения статистики тренировок: {e}")
+            return stats
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def get_weekly_recap_page(self, after_user_id: int, limit: int, week_date: str = 'now') -> Optional[List[Dict]]:
+        """
+        Страница пользователей с итогами недели (keyset-пагинация по user_id)
+        
+        Статистика тренировок берется из workout_stats, изменения замеров -
+        одним запросом с оконными функциями по всем пользователям страницы,
+        поэтому на страницу приходится три запроса независимо от ее размера.
+        
+        Args:
+            after_user_id: Последний user_id предыдущей страницы (0 - с начала)
+            limit: Пользователей на странице
+            week_date: Любая дата недели в формате SQLite ('now' - текущая неделя)
+        
+        Returns:
+            Пользователи по возрастанию user_id: user_id, first_name, fitness_level,
+            stats (в формате utils.calculate_weekly_stats, с minutes) и
+            progress - список (metric_name, первое значение, последнее, число замеров).
+            Пустой список - пользователей больше нет, None - ошибка чтения
+        """
+        week_start = STATS_PERIODS['week'].format('?')
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT user_id, first_name, fitness_level
+                    FROM users
+                    WHERE user_id > ?
+                    ORDER BY user_id
+                    LIMIT ?
+                ''', (after_user_id, limit))
+                page = {
+                    user_id: {
+                        'user_id': user_id,
+                        'first_name': first_name,
+                        'fitness_level': fitness_level,
+                        'stats': {
+                            'total_workouts': 0,
+                            'completed_workouts': 0,
+                            'completion_rate': 0,
+                            'workout_types': {},
+                            'minutes': 0
+                        },
+                        'progress': []
+                    }
+                    for user_id, first_name, fitness_level in cursor.fetchall()
+                }
+                if not page:
+                    return []
+                first_id, last_id = min(page), max(page)
+                
+                cursor.execute(f'''
+                    SELECT scope_id, workout_type, total, completed, minutes
+                    FROM workout_stats
+                    WHERE scope = 'user' AND period = 'week'
+                      AND period_start = {week_start}
+                      AND scope_id BETWEEN ? AND ?
+                ''', (week_date, first_id, last_id))
+                for user_id, workout_type, total, completed, minutes in cursor.fetchall():
+                    if user_id not in page:
+                        continue
+                    stats = page[user_id]['stats']
+                    stats['total_workouts'] += total
+                    stats['completed_workouts'] += completed
+                    stats['minutes'] += minutes or 0
+                    stats['workout_types'][workout_type] = total
+                
+                # Первый и последний замер каждой метрики за неделю
+                cursor.execute(f'''
+                    SELECT user_id, metric_name, first_value, last_value, measurements
+                    FROM (
+                        SELECT user_id, metric_name,
+                               FIRST_VALUE(metric_value) OVER w AS first_value,
+                               LAST_VALUE(metric_value) OVER w AS last_value,
+                               COUNT(*) OVER w AS measurements,
+                               ROW_NUMBER() OVER w AS position
+                        FROM progress
+                        WHERE user_id BETWEEN ? AND ?
+                          AND date >= {week_start} AND date < date({week_start}, '+7 days')
+                        WINDOW w AS (
+                            PARTITION BY user_id, metric_name ORDER BY date, id
+                            ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+                        )
+                    )
+                    WHERE position = 1
+                    ORDER BY user_id, metric_name
+                ''', (first_id, last_id, week_date, week_date))
+                for user_id, metric_name, first_value, last_value, measurements in cursor.fetchall():
+                    if user_id in page:
+                        page[user_id]['progress'].append((metric_name, first_value, last_value, measurements))
+                
+                for user in page.values():
+                    stats = user['stats']
+                    if stats['total_workouts']:
+                        stats['completion_rate'] = round(stats['completed_workouts'] / stats['total_workouts'] * 100, 1)
+                return list(page.values())
+        
+        except Exception as e:
+            logger.error(f"Ошибка получения итогов недели: {e}")
+            return None
     
+    @metrics.timed('db_query_seconds', 'method')
     def save_progress(self, user_id: int, metric_name: str, metric_value: float, date: str, notes: str = None):
         """Сохранение прогресса пользователя"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO progress (user_id, metric_name, metric_value, date, notes)
@@ -251,10 +1218,70 @@ class FitnessDatabase:
         except Exception as e:
             logger.error(f"Ошибка сохранения прогресса: {e}")
     
-    def get_user_workouts(self, user_id: int, limit: int = 10) -> List[Dict]:
+    @metrics.timed('db_query_seconds', 'method')
+    def get_last_plan(self, user_id: int) -> Optional[Dict]:
+        """
+        Последний сохраненный план тренировки пользователя
+        
+        Returns:
+            Словарь с ключами id, type, completed, plan (текст) и plan_data
+            (структура JSON-плана или None) или None
+        """
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT w.id, w.workout_type, w.completed, b.data, json_extract(w.workout_data, '$.plan')
+                    FROM workouts w
+                    JOIN plan_blobs b ON b.hash = w.plan_hash
+                    WHERE w.user_id = ?
+                    ORDER BY w.created_at DESC, w.id DESC
+                    LIMIT 1
+                ''', (user_id,))
+                
+                row = cursor.fetchone()
+                if row:
+                    return {
+                        'id': row[0],
+                        'type': row[1],
+                        'completed': bool(row[2]),
+                        'plan': unpack_plan(row[3]),
+                        'plan_data': json.loads(row[4]) if row[4] else None
+                    }
+                return None
+                
+        except Exception as e:
+            logger.error(f"Ошибка получения последнего плана: {e}")
+            return None
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def get_user_progress(self, user_id: int, metric_name: str = None) -> List[ProgressRecord]:
+        """Замеры прогресса пользователя, упорядоченные по метрике и дате"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                query = '''
+                    SELECT id, metric_name, metric_value, date, notes
+                    FROM progress
+                    WHERE user_id = ?
+                '''
+                params = [user_id]
+                if metric_name:
+                    query += ' AND metric_name = ?'
+                    params.append(metric_name)
+                cursor.execute(query + ' ORDER BY metric_name, date, id', params)
+                
+                return [ProgressRecord(*row) for row in cursor.fetchall()]
+                
+        except Exception as e:
+            logger.error(f"Ошибка получения прогресса: {e}")
+            return []
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def get_user_workouts(self, user_id: int, limit: int = 10) -> List[WorkoutRecord]:
         """Получение тренировок пользователя"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT workout_type, workout_data, completed, scheduled_date, completed_date
@@ -264,26 +1291,18 @@ class FitnessDatabase:
                     LIMIT ?
                 ''', (user_id, limit))
                 
-                workouts = []
-                for row in cursor.fetchall():
-                    workouts.append({
-                        'type': row[0],
-                        'data': json.loads(row[1]),
-                        'completed': bool(row[2]),
-                        'scheduled_date': row[3],
-                        'completed_date': row[4]
-                    })
-                
-                return workouts
+                # workout_data декодируется лениво при обращении к 'data'
+                return [WorkoutRecord(*row) for row in cursor.fetchall()]
                 
         except Exception as e:
             logger.error(f"Ошибка получения тренировок: {e}")
             return []
     
-    def get_chat_users(self, chat_id: int) -> List[Dict]:
+    @metrics.timed('db_query_seconds', 'method')
+    def get_chat_users(self, chat_id: int) -> List[ChatMemberRecord]:
         """Получение списка пользователей в чате"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT DISTINCT u.user_id, u.first_name, u.username, u.fitness_level
@@ -292,17 +1311,153 @@ class FitnessDatabase:
                     WHERE mh.chat_id = ?
                 ''', (chat_id,))
                 
-                users = []
-                for row in cursor.fetchall():
-                    users.append({
-                        'user_id': row[0],
-                        'first_name': row[1],
-                        'username': row[2],
-                        'fitness_level': row[3]
-                    })
-                
-                return users
+                return [ChatMemberRecord(*row) for row in cursor.fetchall()]
                 
         except Exception as e:
             logger.error(f"Ошибка получения пользователей чата: {e}")
             return []
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def add_token_usage(self, rows: List[Tuple]) -> bool:
+        """
+        Пакетное добавление расхода токенов
+        
+        Args:
+            rows: Кортежи (user_id, chat_id, day, requests, prompt_tokens, completion_tokens, cost)
+        
+        Returns:
+            True, если записи сохранены
+        """
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT INTO token_usage (user_id, chat_id, day, requests, prompt_tokens, completion_tokens, cost)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id, chat_id, day) DO UPDATE SET
+                        requests = requests + excluded.requests,
+                        prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                        completion_tokens = completion_tokens + excluded.completion_tokens,
+                        cost = cost + excluded.cost
+                ''', rows)
+                conn.commit()
+                return True
+                
+        except Exception as e:
+            logger.error(f"Ошибка сохранения расхода токенов: {e}")
+            return False
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def get_token_usage(self, day: str, user_id: int = None, chat_id: int = None) -> int:
+        """Суммарный расход токенов за день по пользователю или чату"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                column = "user_id" if user_id is not None else "chat_id"
+                cursor.execute(f'''
+                    SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0)
+                    FROM token_usage
+                    WHERE {column} = ? AND day = ?
+                ''', (user_id if user_id is not None else chat_id, day))
+                return cursor.fetchone()[0]
+                
+        except Exception as e:
+            logger.error(f"Ошибка получения расхода токенов: {e}")
+            return 0
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def add_pool_items(self, kind: str, level: str, context: str, texts: List[str]):
+        """Добавление сгенерированных сообщений в пул"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT INTO content_pool (kind, level, context, text)
+                    VALUES (?, ?, ?, ?)
+                ''', [(kind, level, context, text) for text in texts])
+                conn.commit()
+                
+        except Exception as e:
+            logger.error(f"Ошибка добавления в пул сообщений: {e}")
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def take_pool_item(self, kind: str, level: str, context: str) -> Optional[str]:
+        """Извлечение (с удалением) самого старого сообщения из пула"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    DELETE FROM content_pool
+                    WHERE id = (
+                        SELECT id FROM content_pool
+                        WHERE kind = ? AND level = ? AND context = ?
+                        ORDER BY id
+                        LIMIT 1
+                    )
+                    RETURNING text
+                ''', (kind, level, context))
+                row = cursor.fetchone()
+                conn.commit()
+                return row[0] if row else None
+                
+        except Exception as e:
+            logger.error(f"Ошибка получения сообщения из пула: {e}")
+            return None
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def get_pool_sizes(self) -> Dict[Tuple[str, str, str], int]:
+        """Размеры пула по корзинам (kind, level, context)"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT kind, level, context, COUNT(*)
+                    FROM content_pool
+                    GROUP BY kind, level, context
+                ''')
+                return {(row[0], row[1], row[2]): row[3] for row in cursor.fetchall()}
+                
+        except Exception as e:
+            logger.error(f"Ошибка получения размеров пула: {e}")
+            return {}
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def get_group_plan(self, composition: str, max_age: int) -> Optional[Dict]:
+        """
+        Кешированный план групповой тренировки для состава группы
+        
+        Args:
+            composition: Ключ состава (group_planner.composition_key)
+            max_age: Максимальный возраст плана в секундах
+        
+        Returns:
+            Структура плана или None, если плана нет или он устарел
+        """
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT plan_data FROM group_plans
+                    WHERE composition = ? AND created_at >= datetime('now', ?)
+                ''', (composition, f'-{int(max_age)} seconds'))
+                row = cursor.fetchone()
+                return json.loads(row[0]) if row else None
+                
+        except Exception as e:
+            logger.error(f"Ошибка получения группового плана: {e}")
+            return None
+    
+    @metrics.timed('db_query_seconds', 'method')
+    def save_group_plan(self, composition: str, plan_data: Dict):
+        """Сохранение (замена) плана групповой тренировки для состава группы"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT OR REPLACE INTO group_plans (composition, plan_data, created_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                ''', (composition, json.dumps(plan_data, ensure_ascii=False)))
+                conn.commit()
+                
+        except Exception as e:
+            logger.error(f"Ошибка сохранения группового плана: {e}")
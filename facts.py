@@ -0,0 +1,199 @@
+"""
+Факты о пользователях из переписки
+
+Фоновая задача периодически берет новые сообщения пользователей (после
+последнего обработанного id) порциями по settings.fact_extraction_batch,
+отправляет их модели вместе с уже известными фактами и сохраняет ответ в
+таблицу user_facts: травмы и ограничения, инвентарь, время для
+тренировок, вес и цели своими словами (users.goals хранит только код цели). Курсор
+сдвигается в той же транзакции, что и факты, поэтому каждое сообщение
+обрабатывается один раз; если модель не ответила, порция повторяется при
+следующем запуске, а порция, на которую модель раз за разом отвечает
+неразбираемым JSON, после settings.fact_extraction_max_attempts попыток
+пропускается. В промпты попадают компактные факты вместо длинной
+истории: в планы тренировок и в ответ на ход в чате.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from memory import tokenize
+from metrics import metrics
+from prompts import FACT_EXTRACTION, FACTS_LINE
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Ключи фактов и их подписи в промптах
+FACT_KEYS = {
+    'injuries': 'травмы и ограничения',
+    'equipment': 'инвентарь',
+    'availability': 'время для тренировок',
+    'weight': 'вес',
+    'goals': 'цели',
+}
+FACT_VALUE_CHARS = 100
+
+# Сообщения без содержательных слов (приветствия, "ок") модели не отправляются
+MIN_MESSAGE_TERMS = 2
+
+FACTS_FORMAT_HINT = '{"facts":[{"user":1,"key":"injuries","value":"болит левое колено"}]}'
+
+
+def format_facts(facts: Dict[str, str]) -> str:
+    """Факты пользователя одной строкой: 'травмы и ограничения: колено; инвентарь: гантели'"""
+    return "; ".join(f"{label}: {facts[key]}" for key, label in FACT_KEYS.items() if facts.get(key))
+
+
+def profile_line(facts: Optional[Dict[str, str]]) -> str:
+    """Продолжение строки целей в промпте плана: факты с новой строки или пустая строка"""
+    line = format_facts(facts or {})
+    return f"\nИзвестно о пользователе: {line}" if line else ""
+
+
+def render_user_facts(name: str, facts: Dict[str, str]) -> str:
+    """Строка фактов для промпта (пустая строка, если фактов нет)"""
+    line = format_facts(facts)
+    return FACTS_LINE.render(name=name, facts=line) if line else ""
+
+
+def parse_facts(response: Optional[str], users: List[int]) -> Optional[List[Tuple[int, str, Optional[str]]]]:
+    """
+    Разбор ответа модели
+
+    Args:
+        response: Ответ модели (JSON в формате FACTS_FORMAT_HINT)
+        users: user_id по номерам пользователей в промпте (номер 1 - users[0])
+
+    Returns:
+        (user_id, ключ, значение или None - факт больше не верен) или None, если ответ не разобран
+    """
+    if not response:
+        return None
+    start, end = response.find('{'), response.rfind('}')
+    try:
+        items = json.loads(response[start:end + 1])['facts'] if 0 <= start < end else None
+    except (ValueError, KeyError, TypeError):
+        items = None
+    if not isinstance(items, list):
+        logger.warning("Ответ модели с фактами не прошел проверку")
+        return None
+
+    facts = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        number, key, value = item.get('user'), item.get('key'), item.get('value')
+        if not isinstance(number, int) or not 1 <= number <= len(users) or key not in FACT_KEYS:
+            continue
+        if value is not None:
+            value = " ".join(str(value).split())[:FACT_VALUE_CHARS] or None
+        facts.append((users[number - 1], key, value))
+    return facts
+
+
+class FactExtractor:
+    """Инкрементальное извлечение фактов о пользователях по id сообщений"""
+
+    def __init__(self, db, ai_client, batch_size: Optional[int] = None):
+        self.db = db
+        self.ai_client = ai_client
+        self.batch_size = batch_size  # None - settings.fact_extraction_batch
+        # (id первого сообщения порции, неразобранных ответов на нее подряд)
+        self._failures: Tuple[int, int] = (0, 0)
+
+    def _build_prompt(self, messages: List[Dict]) -> Tuple[str, List[int]]:
+        """Промпт для порции сообщений и user_id по номерам пользователей в нем"""
+        users: List[int] = []
+        numbers: Dict[int, int] = {}
+        lines = []
+        for message in messages:
+            user_id = message['user_id']
+            if user_id not in numbers:
+                users.append(user_id)
+                numbers[user_id] = len(users)
+            name = message.get('first_name') or 'Пользователь'
+            lines.append(f"[{numbers[user_id]}] {name}: {' '.join(message['message'].split())}")
+
+        known_facts = self.db.get_users_facts(users)
+        known = "\n".join(
+            f"[{number}] {format_facts(known_facts[user_id])}"
+            for number, user_id in enumerate(users, 1) if known_facts.get(user_id)
+        ) or "нет"
+        keys = ", ".join(f"{key} ({label})" for key, label in FACT_KEYS.items())
+        prompt = FACT_EXTRACTION.render(
+            keys=keys, known=known, messages="\n".join(lines),
+            format_hint=FACTS_FORMAT_HINT, format_empty='{"facts":[]}'
+        )
+        return prompt, users
+
+    async def extract_pending(self) -> int:
+        """
+        Обработка всех новых сообщений порциями
+
+        Returns:
+            Число сохраненных фактов
+        """
+        saved = 0
+        while True:
+            messages = self.db.get_messages_after_cursor(self.batch_size or settings.fact_extraction_batch)
+            if not messages:
+                return saved
+            last_message_id = messages[-1]['id']
+
+            candidates = [m for m in messages if len(tokenize(m['message'] or '')) >= MIN_MESSAGE_TERMS]
+            if not candidates:
+                if not self.db.save_user_facts([], last_message_id):
+                    return saved
+                continue
+
+            prompt, users = self._build_prompt(candidates)
+            usage_keys = list(dict.fromkeys((m['user_id'], m['chat_id']) for m in candidates))
+            response = await self.ai_client.get_response(
+                [{"role": "user", "content": prompt}], usage_keys=usage_keys,
+                response_format={"type": "json_object"}
+            )
+            facts = parse_facts(response, users)
+            if facts is None:
+                # Без ответа ИИ или до исчерпания попыток порция повторится при следующем запуске
+                if response is None or not self._register_failure(messages[0]['id']):
+                    metrics.inc('fact_extraction_runs_total', status="error")
+                    return saved
+                # Иначе порция навсегда заблокировала бы курсор и каждый раз оплачивалась заново
+                logger.warning(
+                    f"Порция сообщений {messages[0]['id']}-{last_message_id} пропущена: "
+                    f"ответ модели не разобран {settings.fact_extraction_max_attempts} раз подряд"
+                )
+                metrics.inc('fact_extraction_runs_total', status="skipped")
+                if not self.db.save_user_facts([], last_message_id):
+                    return saved
+                continue
+
+            if not self.db.save_user_facts(
+                [(user_id, key, value, last_message_id) for user_id, key, value in facts], last_message_id
+            ):
+                metrics.inc('fact_extraction_runs_total', status="error")
+                return saved
+            metrics.inc('fact_extraction_runs_total', status="ok")
+            metrics.inc('facts_extracted_total', len(facts))
+            saved += len(facts)
+
+    def _register_failure(self, first_message_id: int) -> bool:
+        """Учет неразобранного ответа на порцию; True - попытки для нее исчерпаны"""
+        batch, failures = self._failures
+        failures = failures + 1 if batch == first_message_id else 1
+        self._failures = (first_message_id, failures)
+        return failures >= settings.fact_extraction_max_attempts
+
+    async def run_loop(self, interval: Optional[float] = None):
+        """Фоновое извлечение фактов"""
+        while True:
+            await asyncio.sleep(interval or settings.fact_extraction_interval)
+            try:
+                saved = await self.extract_pending()
+                if saved:
+                    logger.info(f"Сохранено фактов о пользователях: {saved}")
+            except Exception as e:
+                logger.error(f"Ошибка извлечения фактов о пользователях: {e}")
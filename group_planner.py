@@ -0,0 +1,113 @@
+"""
+Планировщик групповых тренировок для больших чатов
+
+Участники группируются по уровню подготовки локально; в промпт уходит
+только состав группы (сколько участников каждого уровня), а не список
+всех людей, поэтому размер промпта и ответа не зависит от размера чата.
+Модель составляет один общий план с вариантами упражнений для каждого
+уровня. Планы кешируются по составу (набору уровней) и переиспользуются
+в других чатах с таким же составом; новый план можно запросить явно
+(refresh).
+"""
+
+import html
+import logging
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from config import LEVEL_INTENSITY, LEVEL_NAMES
+from metrics import metrics
+from settings import settings
+
+if TYPE_CHECKING:
+    # Только для аннотаций: workout_plans загружает pydantic
+    from workout_plans import WorkoutPlan
+
+logger = logging.getLogger(__name__)
+
+Clusters = Dict[str, List[Dict]]
+
+
+def cluster_by_level(users: List[Dict]) -> Clusters:
+    """Участники по уровням подготовки, от легкого уровня к сложному"""
+    clusters: Clusters = {}
+    for user in users:
+        clusters.setdefault(user.get('fitness_level') or 'beginner', []).append(user)
+    return dict(sorted(clusters.items(), key=lambda item: LEVEL_INTENSITY.get(item[0], 1.0)))
+
+
+def composition_key(clusters: Clusters) -> str:
+    """Ключ кеша плана: набор уровней в группе (численность не влияет на план)"""
+    return "+".join(clusters)
+
+
+def composition_counts(clusters: Clusters) -> Dict[str, int]:
+    return {level: len(members) for level, members in clusters.items()}
+
+
+def format_roster(clusters: Clusters, max_names: Optional[int] = None) -> str:
+    """Состав группы по уровням: первые max_names имен и число остальных"""
+    if max_names is None:
+        max_names = settings.group_roster_names
+    lines = []
+    for level, members in clusters.items():
+        names = [html.escape(m.get('first_name') or 'Пользователь') for m in members[:max_names]]
+        line = f"{LEVEL_NAMES.get(level, html.escape(level))} ({len(members)}): {', '.join(names)}"
+        if len(members) > max_names:
+            line += f" и еще {len(members) - max_names}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+class GroupPlanner:
+    """Общий план групповой тренировки с вариантами по уровням и кешем по составу"""
+
+    def __init__(self, db, ai_client, cache_ttl: Optional[int] = None):
+        self.db = db
+        self.ai_client = ai_client
+        self.cache_ttl = cache_ttl
+
+    def get_cached(self, clusters: Clusters) -> Optional["WorkoutPlan"]:
+        """Кешированный план для такого состава или None"""
+        from workout_plans import WorkoutPlan
+
+        cache_ttl = settings.group_plan_cache_ttl if self.cache_ttl is None else self.cache_ttl
+        if not cache_ttl:
+            return None
+        key = composition_key(clusters)
+        cached = self.db.get_group_plan(key, cache_ttl)
+        if cached:
+            try:
+                return WorkoutPlan.model_validate(cached)
+            except ValueError as e:
+                logger.warning(f"Кешированный групповой план {key} не прошел проверку: {e}")
+        return None
+
+    async def get_plan(self, clusters: Clusters, usage_key: Tuple[int, int] = None,
+                       cached: Optional["WorkoutPlan"] = None, refresh: bool = False) -> Optional["WorkoutPlan"]:
+        """
+        План для группы: из кеша по составу или новый
+
+        Args:
+            clusters: Участники по уровням (cluster_by_level)
+            usage_key: (user_id, chat_id) для учета расхода токенов
+            cached: План, уже найденный в кеше (get_cached)
+            refresh: Не брать план из кеша, а составить новый (и заменить им кешированный)
+
+        Returns:
+            План или None, если ИИ не вернул корректный план
+        """
+        from workout_plans import plan_to_data
+
+        if cached is None and not refresh:
+            cached = self.get_cached(clusters)
+        if cached is not None:
+            metrics.inc('cache_hits_total', cache="group_plan")
+            return cached
+
+        metrics.inc('cache_misses_total', cache="group_plan")
+        plan = await self.ai_client.generate_structured_group_workout(
+            composition_counts(clusters), usage_key=usage_key
+        )
+        if plan:
+            self.db.save_group_plan(composition_key(clusters), plan_to_data(plan))
+        return plan
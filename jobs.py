@@ -0,0 +1,151 @@
+"""
+Фоновая генерация для медленных команд
+
+Команда сразу отвечает заглушкой и запускает генерацию отдельной задачей,
+поэтому обработчик и его место в полосе освобождаются за миллисекунды,
+а заглушка редактируется, когда результат готов. Задачи учитываются по
+ключу (команда, чат, пользователь): повторная команда не запускает вторую
+генерацию, пока идет первая, либо (supersede) отменяет устаревшую и
+запускается вместо нее. Каждая задача ограничена сроком
+settings.background_job_deadline, ее можно отменить кнопкой под заглушкой,
+а при остановке бота отменяются все задачи. Задачи занимают места в той же
+медленной полосе, что и медленные команды (lanes.py), поэтому общий лимит
+запросов к ИИ не удваивается.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from lanes import Lane
+from metrics import metrics
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Вызывается при неуспехе задачи со статусом "timeout", "cancelled" или "error"
+FailureCallback = Callable[[str], Awaitable[None]]
+
+
+class Job:
+    __slots__ = ('kind', 'owner_id', 'task')
+
+    def __init__(self, kind: str, owner_id: Optional[int], task: asyncio.Task):
+        self.kind = kind
+        self.owner_id = owner_id
+        self.task = task
+
+
+class BackgroundJobs:
+    """Реестр фоновых задач генерации со сроком выполнения и отменой (в полосе lane)"""
+
+    def __init__(self, lane: Lane):
+        self._jobs: Dict[str, Job] = {}
+        self._superseded: Set[asyncio.Task] = set()
+        self._closing = False
+        self.lane = lane
+
+    def running(self, key: str) -> bool:
+        return key in self._jobs
+
+    def start(self, key: str, kind: str, chat_id: int, owner_id: Optional[int],
+              job: Callable[[], Awaitable], on_failure: Optional[FailureCallback] = None,
+              supersede: bool = False, delay: float = 0) -> bool:
+        """
+        Запуск фоновой задачи
+
+        Args:
+            key: Ключ задачи (пока задача идет, вторая с тем же ключом не запускается)
+            kind: Тип задачи для метрик (workout, group_workout, progress)
+            chat_id: Чат - для лимита параллельности на чат
+            owner_id: Пользователь, который может отменить задачу
+            job: Функция, возвращающая корутину генерации и отправки результата
+            on_failure: Сообщение пользователю при истечении срока, отмене или ошибке
+            supersede: Отменить задачу с тем же ключом и запустить новую вместо нее
+            delay: Пауза перед запуском (место в полосе на это время не занимается)
+
+        Returns:
+            False, если задача с таким ключом уже выполняется (и supersede не задан)
+        """
+        if self._closing:
+            return False
+        if key in self._jobs:
+            if not supersede:
+                return False
+            # Вытесненная задача завершается без сообщения пользователю
+            old_task = self._jobs.pop(key).task
+            self._superseded.add(old_task)
+            old_task.cancel()
+        task = asyncio.create_task(self._run(key, kind, chat_id, job, on_failure, delay))
+        self._jobs[key] = Job(kind, owner_id, task)
+        # Задача, отмененная до первого шага, не доходит до finally в _run
+        task.add_done_callback(lambda _: self._forget(key, task))
+        metrics.set_gauge('background_jobs', len(self._jobs))
+        return True
+
+    def _forget(self, key: str, task: asyncio.Task):
+        self._superseded.discard(task)
+        job = self._jobs.get(key)
+        if job is not None and job.task is task:
+            del self._jobs[key]
+        metrics.set_gauge('background_jobs', len(self._jobs))
+
+    async def _run(self, key: str, kind: str, chat_id: int, job: Callable[[], Awaitable],
+                   on_failure: Optional[FailureCallback], delay: float = 0):
+        started = time.perf_counter()
+        deadline = settings.background_job_deadline
+        status = "ok"
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+            async with self.lane.slot(chat_id):
+                await asyncio.wait_for(job(), deadline or None)
+        except asyncio.TimeoutError:
+            status = "timeout"
+            logger.warning(f"Фоновая задача {key} не уложилась в {deadline} с")
+        except asyncio.CancelledError:
+            status = "superseded" if asyncio.current_task() in self._superseded else "cancelled"
+        except Exception as e:
+            status = "error"
+            logger.error(f"Ошибка фоновой задачи {key}: {e}")
+        finally:
+            self._forget(key, asyncio.current_task())
+            metrics.inc('background_jobs_total', kind=kind, status=status)
+            metrics.observe('background_job_seconds', time.perf_counter() - started, kind=kind)
+
+        if status not in ("ok", "superseded") and on_failure and not self._closing:
+            try:
+                await on_failure(status)
+            except Exception as e:
+                logger.error(f"Не удалось сообщить о сбое фоновой задачи {key}: {e}")
+
+    def cancel(self, key: str, user_id: Optional[int] = None) -> bool:
+        """
+        Отмена задачи
+
+        Returns:
+            True, если задача найдена и отменить ее может этот пользователь
+        """
+        job = self._jobs.get(key)
+        if job is None or (user_id is not None and job.owner_id != user_id):
+            return False
+        job.task.cancel()
+        return True
+
+    async def wait(self, key: str):
+        """Ожидание, пока задача с ключом (и вытеснившие ее задачи) не завершится"""
+        while key in self._jobs:
+            await asyncio.gather(self._jobs[key].task, return_exceptions=True)
+
+    async def join(self):
+        """Ожидание завершения всех текущих задач"""
+        while self._jobs or self._superseded:
+            tasks = [job.task for job in self._jobs.values()] + list(self._superseded)
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def cancel_all(self):
+        """Отмена всех задач при остановке бота (без сообщений пользователям)"""
+        self._closing = True
+        for job in self._jobs.values():
+            job.task.cancel()
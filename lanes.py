@@ -0,0 +1,139 @@
+"""
+Полосы обработки обновлений
+
+Обновления делятся на быструю полосу (справка, профиль, статистика,
+смена уровня - ответ из базы за миллисекунды) и медленную (все, что
+ждет ИИ или отрисовки графиков). У каждой полосы свой лимит
+параллельности, а медленная дополнительно ограничена на один чат,
+поэтому загруженный ИИ не задерживает быстрые команды, а один активный
+чат не занимает все медленные слоты. Лимиты читаются из settings при
+каждом входе в полосу и меняются без перезапуска.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional
+
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import metrics
+from settings import settings
+
+FAST, SLOW = "fast", "slow"
+
+# Команды и кнопки меню, которые ждут ИИ или рисуют графики. /workout,
+# /group_workout, /progress и обычные сообщения только сохраняют запрос
+# или отправляют заглушку, а генерация идет в фоне (jobs.py), поэтому
+# они в быстрой полосе. Исключение - /progress графики: графики рисуются
+# в самом обработчике, как по кнопке charts
+SLOW_COMMANDS = {"motivation"}
+SLOW_CALLBACKS = SLOW_COMMANDS | {"charts"}
+# Команды, медленные только с определенным аргументом
+SLOW_COMMAND_ARGS = {"progress": {"графики", "charts"}}
+
+
+def classify_update(update) -> str:
+    """Полоса для обновления: команды, которые ждут ИИ или графики, - медленные"""
+    query = getattr(update, "callback_query", None)
+    if query is not None:
+        return SLOW if query.data in SLOW_CALLBACKS else FAST
+
+    message = getattr(update, "message", None)
+    text = getattr(message, "text", None) or ""
+    if text.startswith("/"):
+        parts = text[1:].split(maxsplit=1)
+        command = parts[0].split("@")[0].lower() if parts else ""
+        if command in SLOW_COMMANDS:
+            return SLOW
+        args = parts[1].split() if len(parts) > 1 else []
+        if args and args[0].lower() in SLOW_COMMAND_ARGS.get(command, ()):
+            return SLOW
+    return FAST
+
+
+class Lane:
+    """Полоса с общим лимитом параллельности и (необязательно) лимитом на чат"""
+
+    def __init__(self, name: str, limit: Callable[[], int], per_chat_limit: Optional[Callable[[], int]] = None):
+        self.name = name
+        self.limit = limit
+        self.per_chat_limit = per_chat_limit
+        self.in_flight = 0
+        self.waiting = 0
+        self._per_chat: Dict[int, int] = {}
+        self._changed = asyncio.Condition()
+
+    def _has_room(self, chat_id: Optional[int]) -> bool:
+        if self.in_flight >= self.limit():
+            return False
+        if self.per_chat_limit and chat_id is not None:
+            return self._per_chat.get(chat_id, 0) < self.per_chat_limit()
+        return True
+
+    def _report(self):
+        metrics.set_gauge('lane_in_flight', self.in_flight, lane=self.name)
+        metrics.set_gauge('lane_waiting', self.waiting, lane=self.name)
+
+    @asynccontextmanager
+    async def slot(self, chat_id: Optional[int] = None):
+        """Занять место в полосе на время обработки обновления"""
+        started = time.perf_counter()
+        async with self._changed:
+            self.waiting += 1
+            self._report()
+            try:
+                await self._changed.wait_for(lambda: self._has_room(chat_id))
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            if chat_id is not None:
+                self._per_chat[chat_id] = self._per_chat.get(chat_id, 0) + 1
+            self._report()
+        metrics.observe('lane_wait_seconds', time.perf_counter() - started, lane=self.name)
+
+        try:
+            yield
+        finally:
+            async with self._changed:
+                self.in_flight -= 1
+                if chat_id is not None:
+                    remaining = self._per_chat.pop(chat_id) - 1
+                    if remaining:
+                        self._per_chat[chat_id] = remaining
+                self._report()
+                self._changed.notify_all()
+
+
+def create_lanes() -> Dict[str, Lane]:
+    """Быстрая и медленная полосы; медленную делят обновления и фоновые задачи (jobs.py)"""
+    return {
+        FAST: Lane(FAST, lambda: settings.lane_fast_concurrency),
+        SLOW: Lane(SLOW, lambda: settings.lane_slow_concurrency, lambda: settings.lane_slow_per_chat),
+    }
+
+
+class LaneUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка обновлений по полосам
+
+    Общий семафор BaseUpdateProcessor рассчитан на сумму лимитов полос
+    (берется при создании), а внутри него обновление ждет места в своей
+    полосе.
+    """
+
+    def __init__(self, lanes: Optional[Dict[str, Lane]] = None):
+        super().__init__(max_concurrent_updates=settings.lane_fast_concurrency + settings.lane_slow_concurrency)
+        self.lanes = lanes or create_lanes()
+
+    async def do_process_update(self, update, coroutine):
+        lane = self.lanes[classify_update(update)]
+        chat = getattr(update, "effective_chat", None)
+        async with lane.slot(chat.id if chat else None):
+            await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
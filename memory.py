@@ -0,0 +1,145 @@
+"""
+Память чата: лексический индекс BM25 по истории сообщений
+
+В промпт попадают только последние settings.max_history_messages
+сообщений, поэтому то, что участники рассказывали раньше (травмы,
+инвентарь, расписание), теряется. Сообщения пользователей индексируются
+инкрементально: перед ответом на ход индекс чата догоняет новые сообщения
+(FitnessDatabase.update_memory_index) - текст разбивается на слова, у слов
+отрезаются типичные окончания, стоп-слова отбрасываются, и в базу пишется
+инвертированный индекс по чату. Затем бот ищет сообщения, похожие на новый
+ход, среди тех, что уже не входят в окно истории, и добавляет лучшие из
+них в промпт в пределах settings.memory_token_budget. Индекс локальный и
+не требует сети.
+"""
+
+import math
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from prompts import MEMORY_HEADER, MEMORY_LINE
+
+# Параметры BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Символов на токен в оценке размера фрагментов (русский текст)
+CHARS_PER_TOKEN = 3
+# Максимальная длина одного фрагмента в промпте, символов
+SNIPPET_CHARS = 300
+
+WORD_RE = re.compile(r"[a-zа-яё0-9]+")
+
+STOP_WORDS = frozenset("""
+    а без более бы был была были было быть в вам вас весь во вот все всего всех вы где да даже для до
+    его ее если есть еще же за здесь и из или им их к как ко когда кто ли либо мне меня мной мы на над
+    надо наш не него нее нет ни них но ну о об однако он она они оно от очень по под после при про с
+    сам себе себя со так также такой там те тебе тебя тем то тоже той только том ты у уже хотя чего
+    чей чем что чтобы чье эта эти это этого этой этот я
+    привет спасибо пожалуйста ок окей какие какой какая можно нужно надо хочу могу будет
+    the a an and or of to in on is are it i you
+""".split())
+
+# Окончания русских слов; проверяются от длинных к коротким
+ENDINGS = tuple(sorted({
+    "ость", "ости", "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ией", "иях",
+    "ая", "яя", "ое", "ее", "ые", "ие", "ый", "ий", "ой", "ом", "ем", "ам", "ям", "ах", "ях", "ов", "ев",
+    "ей", "ую", "юю", "ть", "ся", "сь",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+}, key=len, reverse=True))
+
+
+def stem(word: str) -> str:
+    """Отсечение окончания: 'колено', 'колени', 'коленом' -> 'колен'"""
+    if len(word) <= 4 or not ("а" <= word[0] <= "я" or word[0] == "ё"):
+        return word
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 4:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Термы текста для индекса и запроса (без стоп-слов и слов короче 3 символов)"""
+    return [
+        stem(word) for word in WORD_RE.findall(text.lower().replace("ё", "е"))
+        if len(word) >= 3 and word not in STOP_WORDS
+    ]
+
+
+def term_counts(text: str) -> Dict[str, int]:
+    """Частоты термов сообщения для инвертированного индекса"""
+    return dict(Counter(tokenize(text)))
+
+
+def bm25_rank(docs: List[Tuple[int, str]], terms: List[str]) -> List[int]:
+    """
+    Ранжирование небольшого набора сообщений по BM25
+
+    Статистика (IDF, средняя длина) считается по самому набору. Слово
+    сообщения совпадает с термом запроса, если начинается с него, как
+    в префиксном запросе FTS5.
+
+    Args:
+        docs: (id, текст) найденных сообщений от новых к старым
+        terms: Термы запроса (tokenize)
+
+    Returns:
+        id по убыванию релевантности (при равенстве - более новые раньше)
+    """
+    if not docs:
+        return []
+    words = [WORD_RE.findall((text or "").lower().replace("ё", "е")) for _, text in docs]
+    tfs = [{term: sum(1 for word in doc if word.startswith(term)) for term in terms} for doc in words]
+    avg_length = sum(len(doc) for doc in words) / len(words) or 1
+    df = {term: sum(1 for tf in tfs if tf[term]) for term in terms}
+    idf = {term: math.log(1 + (len(docs) - n + 0.5) / (n + 0.5)) for term, n in df.items()}
+    scores = []
+    for position, ((doc_id, _), doc, tf) in enumerate(zip(docs, words, tfs)):
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(doc) / avg_length)
+        score = sum(idf[term] * tf[term] * (BM25_K1 + 1) / (tf[term] + norm) for term in terms if tf[term])
+        scores.append((-score, position, doc_id))
+    return [doc_id for _, _, doc_id in sorted(scores)]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def format_snippet(snippet: Dict) -> str:
+    """Строка фрагмента: дата, автор и (обрезанный) текст сообщения"""
+    text = " ".join(snippet['message'].split())
+    if len(text) > SNIPPET_CHARS:
+        text = text[:SNIPPET_CHARS].rsplit(" ", 1)[0] + "…"
+    day = snippet['timestamp'][:10] if snippet.get('timestamp') else ""
+    try:
+        day = datetime.strptime(day, "%Y-%m-%d").strftime("%d.%m.%Y")
+    except ValueError:
+        pass
+    return MEMORY_LINE.render(date=day, name=snippet.get('first_name') or 'Пользователь', text=text)
+
+
+def render_memory(snippets: List[Dict], token_budget: int) -> str:
+    """
+    Блок найденных сообщений для промпта
+
+    Фрагменты берутся в порядке релевантности, пока укладываются в
+    token_budget, и выводятся в хронологическом порядке.
+
+    Returns:
+        Блок или пустая строка, если ничего не поместилось
+    """
+    chosen = []
+    used = estimate_tokens(MEMORY_HEADER)
+    for snippet in snippets:
+        line = format_snippet(snippet)
+        cost = estimate_tokens(line)
+        if used + cost > token_budget:
+            continue
+        chosen.append((snippet['id'], line))
+        used += cost
+    if not chosen:
+        return ""
+    return "\n".join([MEMORY_HEADER] + [line for _, line in sorted(chosen)])
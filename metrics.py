@@ -0,0 +1,326 @@
+"""
+Метрики задержек и профилирование бота
+
+Гистограммы и счетчики хранятся в памяти процесса и отдаются
+в текстовом формате Prometheus через локальный HTTP-эндпоинт.
+Когда метрики выключены, декораторы сводятся к одной проверке флага.
+"""
+
+import asyncio
+import functools
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from config import METRICS_ENABLED, PROFILER_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key)
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Реестр счетчиков, гистограмм и датчиков"""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauge_callbacks: Dict[str, Callable[[], float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Увеличение счетчика"""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """Добавление наблюдения в гистограмму"""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """Установка значения датчика"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def register_gauge(self, name: str, callback: Callable[[], float]):
+        """Датчик, значение которого вычисляется в момент сбора метрик"""
+        self._gauge_callbacks[name] = callback
+
+    def histogram_totals(self, name: str) -> Tuple[int, float]:
+        """Суммарное число наблюдений и сумма по всем меткам гистограммы"""
+        with self._lock:
+            series = self._histograms.get(name, {})
+            return (sum(h.count for h in series.values()),
+                    sum(h.sum for h in series.values()))
+
+    def counter_total(self, name: str, **labels) -> float:
+        """Сумма счетчика по всем сериям с указанными значениями меток"""
+        wanted = set(_label_key(labels))
+        with self._lock:
+            series = self._counters.get(name, {})
+            return sum(value for key, value in series.items() if wanted <= set(key))
+
+    def reset(self):
+        """Сброс всех накопленных значений"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._gauges.clear()
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Замер длительности блока кода"""
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, name: str, label: str) -> Callable:
+        """
+        Декоратор замера длительности функции или корутины
+
+        Args:
+            name: Имя гистограммы
+            label: Имя метки, в которую записывается имя функции
+        """
+        def decorator(func):
+            labels = {label: func.__name__}
+
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await func(*args, **kwargs)
+                    started = time.perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        self.observe(name, time.perf_counter() - started, **labels)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - started, **labels)
+            return wrapper
+
+        return decorator
+
+    def render(self) -> str:
+        """Экспорт всех метрик в текстовом формате Prometheus"""
+        lines = []
+
+        for name, callback in self._gauge_callbacks.items():
+            try:
+                self.set_gauge(name, callback())
+            except Exception as e:
+                logger.error(f"Ошибка вычисления датчика {name}: {e}")
+
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+
+            for name, series in sorted(self._gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+class ErrorCountingHandler(logging.Handler):
+    """Считает ошибки, записанные в лог, по имени логгера"""
+
+    def __init__(self, registry: 'Metrics'):
+        super().__init__(level=logging.ERROR)
+        self.registry = registry
+
+    def emit(self, record: logging.LogRecord):
+        self.registry.inc('errors_total', component=record.name)
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профилировщик
+
+    Фоновый поток периодически снимает стек выбранного потока и копит
+    свернутые стеки (формат flamegraph.pl / speedscope).
+    """
+
+    def __init__(self, interval: float = PROFILER_INTERVAL, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples: Counter = Counter()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._target_thread_id: Optional[int] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, thread_id: Optional[int] = None):
+        """Запуск сэмплирования (по умолчанию - текущего потока)"""
+        if self.running:
+            return
+        self._target_thread_id = thread_id or threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info("Профилировщик запущен")
+
+    def stop(self):
+        """Остановка сэмплирования"""
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        logger.info("Профилировщик остановлен")
+
+    def reset(self):
+        self.samples.clear()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def render_folded(self) -> str:
+        """Свернутые стеки: 'frame;frame;frame count' на строку"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+
+metrics = Metrics(enabled=METRICS_ENABLED)
+profiler = SamplingProfiler()
+
+
+async def start_metrics_server(host: str, port: int):
+    """
+    Запуск локального HTTP-сервера с метриками
+
+    Эндпоинты:
+        /metrics        - метрики в формате Prometheus
+        /profile        - свернутые стеки профилировщика
+        /profile/start  - включить профилировщик
+        /profile/stop   - выключить профилировщик
+
+    Returns:
+        aiohttp AppRunner (для остановки через runner.cleanup())
+    """
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    async def handle_profile(request):
+        return web.Response(text=profiler.render_folded(), content_type="text/plain", charset="utf-8")
+
+    async def handle_profile_start(request):
+        profiler.reset()
+        profiler.start(threading.main_thread().ident)
+        return web.Response(text="started\n")
+
+    async def handle_profile_stop(request):
+        profiler.stop()
+        return web.Response(text="stopped\n")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/profile", handle_profile)
+    app.router.add_get("/profile/start", handle_profile_start)
+    app.router.add_get("/profile/stop", handle_profile_stop)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,92 @@
+"""
+Пулы заранее сгенерированных мотивационных сообщений и предложений тренировок
+
+Фоновая задача в периоды простоя (нет запросов к API в процессе)
+дозаполняет каждую корзину (kind, level, context) до settings.pool_target_size.
+Команды берут готовый шаблон из пула и подставляют имя пользователя.
+"""
+
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from config import POOL_BUCKETS, FITNESS_LEVELS
+from metrics import metrics
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def personalize(template: str, user_info: Dict) -> str:
+    """Подстановка имени пользователя в шаблон из пула"""
+    return template.replace("{name}", user_info.get('first_name') or 'друг')
+
+
+class ContentPool:
+    """Пул сообщений в таблице content_pool"""
+
+    def __init__(self, db, ai_client, target_size: Optional[int] = None, batch_size: Optional[int] = None):
+        self.db = db
+        self.ai_client = ai_client
+        # None - значение из settings на момент пополнения
+        self.target_size = target_size
+        self.batch_size = batch_size
+
+    def take(self, kind: str, user_info: Dict, context: str) -> Optional[str]:
+        """
+        Готовое персонализированное сообщение из пула
+
+        Returns:
+            Текст сообщения или None, если корзина пуста
+        """
+        level = user_info.get('fitness_level') or 'beginner'
+        template = self.db.take_pool_item(kind, level, context)
+        if template is None:
+            metrics.inc('cache_misses_total', cache=f"pool_{kind}")
+            return None
+        metrics.inc('cache_hits_total', cache=f"pool_{kind}")
+        return personalize(template, user_info)
+
+    async def refill(self) -> int:
+        """
+        Дозаполнение недостающих корзин
+
+        Останавливается, как только у клиента ИИ появляются запросы
+        пользователей, чтобы не конкурировать с ними за API.
+
+        Returns:
+            Количество добавленных сообщений
+        """
+        target_size = settings.pool_target_size if self.target_size is None else self.target_size
+        batch_size = settings.pool_batch_size if self.batch_size is None else self.batch_size
+        sizes = self.db.get_pool_sizes()
+        added = 0
+
+        for kind, contexts in POOL_BUCKETS.items():
+            for level in FITNESS_LEVELS:
+                for context in contexts:
+                    missing = target_size - sizes.get((kind, level, context), 0)
+                    while missing > 0:
+                        if self.ai_client.in_flight:
+                            return added
+                        items = await self.ai_client.generate_pool_items(
+                            kind, level, context, min(batch_size, missing)
+                        )
+                        if not items:
+                            return added
+                        self.db.add_pool_items(kind, level, context, items)
+                        missing -= len(items)
+                        added += len(items)
+
+        return added
+
+    async def run_refill_loop(self, interval: Optional[float] = None):
+        """Фоновое пополнение пула"""
+        while True:
+            try:
+                added = await self.refill()
+                if added:
+                    logger.info(f"В пул сообщений добавлено {added} шаблонов")
+            except Exception as e:
+                logger.error(f"Ошибка пополнения пула сообщений: {e}")
+            await asyncio.sleep(interval or settings.pool_refill_interval)
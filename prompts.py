@@ -0,0 +1,317 @@
+"""
+Шаблоны промптов и сборка системного промпта
+
+Шаблоны разбираются один раз при импорте: отступы исходного текста
+убираются, поля подстановки запоминаются, и при вызове остается одна
+подстановка format_map. Системный промпт начинается с неизменного
+префикса (личность тренера и правила чата), одинакового побайтно во всех
+запросах, поэтому к нему применимо кеширование промптов у провайдера.
+Блок участников чата кешируется по чату и сбрасывается только при
+изменении состава чата или профиля участника.
+"""
+
+import textwrap
+from collections import OrderedDict
+from string import Formatter
+from typing import Callable, Dict, FrozenSet, List, Optional, Set
+
+from config import TRAINER_PERSONALITY
+from metrics import metrics
+from settings import settings
+
+
+class PromptTemplate:
+    """Шаблон промпта, разобранный при создании"""
+
+    __slots__ = ('name', 'text', 'fields')
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = textwrap.dedent(text).strip()
+        self.fields: FrozenSet[str] = frozenset(
+            field for _, field, _, _ in Formatter().parse(self.text) if field
+        )
+
+    def render(self, **values) -> str:
+        """
+        Подстановка значений в шаблон
+
+        Raises:
+            KeyError: Не передано значение для поля шаблона
+        """
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"{self.name}: нет значений для {', '.join(sorted(missing))}")
+        return self.text.format_map(values)
+
+
+# Неизменный префикс системного промпта
+SYSTEM_PROMPT = TRAINER_PERSONALITY.strip()
+CHAT_SYSTEM_PROMPT = SYSTEM_PROMPT + "\n\nПомни контекст разговора и используй имена пользователей!"
+
+ROSTER_HEADER = "Информация о пользователях в чате:"
+ROSTER_LINE = PromptTemplate("roster_line", "- {name}: уровень подготовки - {level}")
+
+WORKOUT_PLAN = PromptTemplate("workout_plan", """
+    Составь детальный план тренировки для {name}.
+
+    Уровень подготовки: {level}
+    Цели: {goals}{profile}
+    Тип тренировки: {workout_type}
+
+    Включи:
+    - Разминку (5-10 минут)
+    - Основную часть тренировки
+    - Заминку (5-10 минут)
+    - Рекомендации по технике
+    - Продолжительность каждого упражнения
+    - Количество подходов и повторений
+
+    Будь мотивирующим и учитывай уровень подготовки!
+""")
+
+GROUP_WORKOUT = PromptTemplate("group_workout", """
+    Составь план групповой тренировки для участников следующих уровней подготовки:
+    {users_info}
+
+    Тип тренировки: {workout_type}
+
+    Учти:
+    - Разные уровни подготовки участников
+    - Возможность адаптации упражнений
+    - Взаимную поддержку и мотивацию
+    - Веселую и дружескую атмосферу
+
+    Включи:
+    - Разминку для всех
+    - Основные упражнения с вариантами сложности
+    - Групповые элементы
+    - Заминку
+    - Рекомендации по взаимодействию
+
+    Сделай тренировку интересной для всех участников!
+""")
+
+STRUCTURED_PLAN = PromptTemplate("structured_plan", """
+    Составь план тренировки для {name}.
+
+    Уровень подготовки: {level}
+    Цели: {goals}{profile}
+
+    Ответь только JSON без пояснений и пробелов между полями в формате:
+    {format_hint}
+    Необязательные поля опускай. Советы по технике - короткие, в notes и tips.
+""")
+
+STRUCTURED_GROUP_PLAN = PromptTemplate("structured_group_plan", """
+    Составь общий план групповой тренировки.
+
+    Участников по уровням подготовки: {group_info}
+
+    Упражнения общие для всех и рассчитаны на уровень {base_level}.
+    В variants укажи варианты упражнения для уровней: {variant_levels}.
+    Добавь групповые элементы и советы по взаимодействию в tips.
+
+    Ответь только JSON без пояснений и пробелов между полями в формате:
+    {format_hint}
+    Необязательные поля опускай.
+""")
+
+MOTIVATION = PromptTemplate("motivation", """
+    Напиши мотивирующее сообщение для {name}.
+
+    Контекст: {context}
+    Уровень подготовки: {level}
+
+    Сообщение должно быть:
+    - Персонализированным для {name}
+    - Мотивирующим и вдохновляющим
+    - Соответствующим контексту
+    - Дружелюбным и поддерживающим
+
+    Используй имя пользователя и сделай сообщение личным!
+""")
+
+PROGRESS_EMPTY = PromptTemplate("progress_empty", """
+    {name} еще не начал отслеживать свой прогресс.
+    {workouts_summary}
+    Напиши мотивирующее сообщение о важности отслеживания прогресса
+    и предложи начать с простых метрик (команда /log, например: /log вес 75).
+""")
+
+PROGRESS_ANALYSIS = PromptTemplate("progress_analysis", """
+    Проанализируй прогресс {name} (тренд - изменение за неделю по линейной регрессии,
+    среднее - скользящее среднее последних замеров):
+
+    {progress_summary}
+    {workouts_summary}
+
+    Дай:
+    - Оценку прогресса
+    - Рекомендации по улучшению
+    - Мотивирующие слова
+    - Следующие шаги
+
+    Будь поддерживающим и конструктивным!
+""")
+
+POOL_MOTIVATION = PromptTemplate("pool_motivation", """
+    Напиши {count} разных коротких мотивирующих сообщений.
+
+    Контекст: {context}
+    Уровень подготовки: {level}
+
+    Сообщения должны быть мотивирующими, дружелюбными и соответствовать контексту.
+""")
+
+POOL_SUGGESTION = PromptTemplate("pool_suggestion", """
+    Предложи {count} разных вариантов тренировки на сегодня.
+
+    Контекст: {context} (after_cardio - последней была кардио, after_strength - силовая)
+    Уровень подготовки: {level}
+
+    Каждый вариант - одна-две строки с эмодзи, длительностью и главным упражнением.
+""")
+
+# {name} в шаблонах пула подставляется позже, при выдаче (pools.personalize)
+POOL_RULES = textwrap.dedent("""
+    Вместо имени человека пиши ровно {name} - имя подставится позже.
+    Раздели варианты строкой из трех дефисов: ---
+    Не добавляй нумерацию и пояснений вне вариантов.
+""").strip()
+
+# Пакетная генерация (рассылки): задание и данные получателя
+BATCH_SINGLE = PromptTemplate("batch_single", """
+    {task}
+
+    Получатель: {brief}
+""")
+
+BATCH_PACKED = PromptTemplate("batch_packed", """
+    {task}
+
+    Напиши отдельный текст для каждого получателя из списка. Начни каждый текст
+    с номера получателя в квадратных скобках, например [1], и не добавляй
+    ничего вне текстов.
+
+    Получатели:
+    {briefs}
+""")
+
+# Найденные в индексе памяти (memory.py) старые сообщения чата
+MEMORY_HEADER = "Из прошлых сообщений чата (может пригодиться для ответа):"
+MEMORY_LINE = PromptTemplate("memory_line", "- [{date}] {name}: {text}")
+
+# Факты о пользователях (facts.py)
+FACTS_LINE = PromptTemplate("facts_line", "Известно о {name}: {facts}")
+
+FACT_EXTRACTION = PromptTemplate("fact_extraction", """
+    Выпиши из сообщений фитнес-чата устойчивые факты о пользователях.
+
+    Ключи фактов: {keys}
+    Уже известные факты (номер пользователя в квадратных скобках):
+    {known}
+
+    Сообщения:
+    {messages}
+
+    Ответь только JSON без пояснений в формате:
+    {format_hint}
+    Добавляй только новые или изменившиеся факты, значение - коротко, до 100 символов.
+    Если известный факт больше не верен (например, травма прошла), укажи value: null.
+    Если новых фактов нет, верни {format_empty}.
+""")
+
+MOTIVATION_TASK = (
+    "Напиши короткое мотивирующее сообщение (2-4 предложения) с обращением по имени. "
+    "Сообщение должно быть дружелюбным и соответствовать контексту и уровню подготовки."
+)
+
+RECAP_TASK = (
+    "Напиши короткий итог недели (2-3 предложения) с обращением по имени: отметь сделанное "
+    "и изменения замеров, если они есть, и дай один совет на следующую неделю. "
+    "Не повторяй цифры списком - они уже есть в сообщении."
+)
+
+
+def render_roster(users: List[Dict]) -> str:
+    """Блок участников чата для системного промпта (пустая строка, если участников нет)"""
+    if not users:
+        return ""
+    lines = [ROSTER_HEADER]
+    lines.extend(
+        ROSTER_LINE.render(name=user.get('first_name') or 'Пользователь', level=user.get('fitness_level') or 'неизвестен')
+        for user in users
+    )
+    return "\n".join(lines)
+
+
+def system_prompt(roster: Optional[str] = None) -> str:
+    """
+    Системный промпт: неизменный префикс и (для разговора в чате) блок участников
+
+    Args:
+        roster: Блок участников (render_roster); None - промпт без контекста чата
+    """
+    if roster is None:
+        return SYSTEM_PROMPT
+    if not roster:
+        return CHAT_SYSTEM_PROMPT
+    return f"{CHAT_SYSTEM_PROMPT}\n\n{roster}"
+
+
+class RosterCache:
+    """Блоки участников по чатам; сбрасываются при изменении состава или профиля"""
+
+    def __init__(self, max_size: Optional[int] = None):
+        self.max_size = max_size  # None - settings.roster_cache_size
+        self._blocks: "OrderedDict[int, str]" = OrderedDict()
+        self._members: Dict[int, Set[int]] = {}
+        self._chats_by_user: Dict[int, Set[int]] = {}
+
+    def get(self, chat_id: int, load_users: Callable[[], List[Dict]]) -> str:
+        """
+        Блок участников чата из кеша или новый
+
+        Args:
+            chat_id: ID чата
+            load_users: Загрузка участников чата (вызывается только при промахе кеша)
+        """
+        block = self._blocks.get(chat_id)
+        if block is not None:
+            self._blocks.move_to_end(chat_id)
+            metrics.inc('cache_hits_total', cache="roster")
+            return block
+
+        metrics.inc('cache_misses_total', cache="roster")
+        users = load_users()
+        block = render_roster(users)
+        self._blocks[chat_id] = block
+        self._members[chat_id] = {user['user_id'] for user in users}
+        for user in users:
+            self._chats_by_user.setdefault(user['user_id'], set()).add(chat_id)
+
+        max_size = settings.roster_cache_size if self.max_size is None else self.max_size
+        while len(self._blocks) > max_size:
+            self.invalidate_chat(next(iter(self._blocks)))
+        return block
+
+    def note_member(self, chat_id: int, user_id: int):
+        """Учет сообщения участника: новый участник чата сбрасывает блок этого чата"""
+        members = self._members.get(chat_id)
+        if members is not None and user_id not in members:
+            self.invalidate_chat(chat_id)
+
+    def invalidate_chat(self, chat_id: int):
+        self._blocks.pop(chat_id, None)
+        for user_id in self._members.pop(chat_id, ()):
+            chats = self._chats_by_user.get(user_id)
+            if chats:
+                chats.discard(chat_id)
+                if not chats:
+                    del self._chats_by_user[user_id]
+
+    def invalidate_user(self, user_id: int):
+        """Сброс блоков всех чатов, где есть участник (изменились имя или уровень)"""
+        for chat_id in list(self._chats_by_user.get(user_id, ())):
+            self.invalidate_chat(chat_id)
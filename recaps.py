@@ -0,0 +1,185 @@
+"""
+Итоги недели для всех пользователей
+
+Пользователи читаются из базы страницами по settings.recap_page_size
+(keyset-пагинация по user_id), а статистика тренировок и изменения
+замеров за неделю собираются для всей страницы одним проходом
+(FitnessDatabase.get_weekly_recap_page). Для активных за неделю
+пользователей страницы персональная часть генерируется пакетом
+(ai_client.generate_batch), а цифры форматируются локально, поэтому при
+сбое ИИ пользователь получает итоги без комментария тренера. Готовые
+сообщения идут в очередь фиксированного размера, которую разбирает
+отправитель с лимитом settings.recap_send_rate: пока очередь полна,
+следующая страница не читается, и память не зависит от числа пользователей.
+"""
+
+import asyncio
+import html
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from ai_client import BatchRequest
+from metrics import metrics
+from prompts import RECAP_TASK
+from settings import settings
+from utils import format_workout_stats
+
+logger = logging.getLogger(__name__)
+
+RECAP_TITLE = "📅 Итоги недели"
+
+
+def is_active(user: Dict) -> bool:
+    """Были ли у пользователя за неделю тренировки или замеры"""
+    return bool(user['stats']['total_workouts'] or user['progress'])
+
+
+def format_progress_changes(progress: List[Tuple]) -> str:
+    """Изменения замеров за неделю: первое и последнее значение каждой метрики"""
+    lines = []
+    for metric_name, first_value, last_value, measurements in progress:
+        line = f"📈 {html.escape(metric_name)}: "
+        if measurements > 1:
+            line += f"{first_value:g} → {last_value:g} ({last_value - first_value:+g})"
+        else:
+            line += f"{last_value:g}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def format_recap(user: Dict) -> str:
+    """Итоги недели пользователя без комментария тренера"""
+    text = format_workout_stats(user['stats'], RECAP_TITLE)
+    if user['progress']:
+        text += "\n" + format_progress_changes(user['progress']) + "\n"
+    return text
+
+
+def recap_brief(user: Dict) -> str:
+    """Данные пользователя для промпта пакетной генерации"""
+    stats = user['stats']
+    brief = (
+        f"{user.get('first_name') or 'Пользователь'}, уровень подготовки: {user.get('fitness_level') or 'beginner'}, "
+        f"тренировок: {stats['total_workouts']}, выполнено: {stats['completed_workouts']}"
+    )
+    if stats.get('minutes'):
+        brief += f", минут: {stats['minutes']}"
+    if user['progress']:
+        changes = ", ".join(
+            f"{name} {first:g}→{last:g}" if count > 1 else f"{name} {last:g}"
+            for name, first, last, count in user['progress']
+        )
+        brief += f", замеры: {changes}"
+    return brief
+
+
+def seconds_until(weekday: int, hour: int, now: Optional[datetime] = None) -> float:
+    """Секунд до ближайшего наступления дня недели weekday (0 - понедельник) в hour:00"""
+    now = now or datetime.now()
+    target = now.replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(days=(weekday - now.weekday()) % 7)
+    if target <= now:
+        target += timedelta(days=7)
+    return (target - now).total_seconds()
+
+
+class WeeklyRecap:
+    """Рассылка итогов недели всем пользователям с постоянным расходом памяти"""
+
+    def __init__(self, db, ai_client, page_size: Optional[int] = None, queue_size: Optional[int] = None):
+        self.db = db
+        self.ai_client = ai_client
+        self.page_size = page_size  # None - settings.recap_page_size
+        self.queue_size = queue_size  # None - settings.recap_queue_size
+
+    async def _compose(self, users: List[Dict]) -> List[str]:
+        """Тексты итогов для страницы пользователей: цифры локально, комментарий - пакетом от ИИ"""
+        results = await self.ai_client.generate_batch(RECAP_TASK, [
+            BatchRequest(key=user['user_id'], brief=recap_brief(user), usage_key=(user['user_id'], user['user_id']))
+            for user in users
+        ])
+        texts = []
+        for user, result in zip(users, results):
+            text = format_recap(user)
+            if result.text:
+                text += f"\n💬 {html.escape(result.text)}"
+            texts.append(text)
+        return texts
+
+    async def _send_loop(self, bot, queue: asyncio.Queue, counts: Dict[str, int]):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            user_id, text = item
+            try:
+                await bot.send_message(chat_id=user_id, text=text, parse_mode='HTML')
+                counts['sent'] += 1
+                metrics.inc('weekly_recaps_total', status="sent")
+            except Exception as e:
+                # Пользователь не писал боту в личку или заблокировал его
+                counts['failed'] += 1
+                metrics.inc('weekly_recaps_total', status="failed")
+                logger.warning(f"Не удалось отправить итоги недели пользователю {user_id}: {e}")
+            await asyncio.sleep(1 / settings.recap_send_rate)
+
+    async def run(self, bot, week_date: str = 'now') -> Dict[str, int]:
+        """
+        Итоги недели для всех пользователей
+
+        Args:
+            bot: Объект с методом send_message (telegram.Bot)
+            week_date: Любая дата недели в формате SQLite ('now' - текущая неделя)
+
+        Returns:
+            Число отправленных, неотправленных и пропущенных (без активности) итогов
+        """
+        counts = {'sent': 0, 'failed': 0, 'skipped': 0}
+        queue = asyncio.Queue(maxsize=self.queue_size or settings.recap_queue_size)
+        sender = asyncio.create_task(self._send_loop(bot, queue, counts))
+        after_user_id = 0
+        try:
+            while True:
+                page_size = self.page_size or settings.recap_page_size
+                page = self.db.get_weekly_recap_page(after_user_id, page_size, week_date)
+                if page is None:
+                    # Страница не прочиталась: остальные пользователи итоги не получат
+                    logger.error(f"Итоги недели прерваны: не удалось прочитать пользователей после {after_user_id}")
+                    metrics.inc('weekly_recaps_total', status="aborted")
+                    break
+                if not page:
+                    break
+                after_user_id = page[-1]['user_id']
+
+                active = [user for user in page if is_active(user)]
+                counts['skipped'] += len(page) - len(active)
+                metrics.inc('weekly_recaps_total', len(page) - len(active), status="skipped")
+                if active:
+                    for user, text in zip(active, await self._compose(active)):
+                        # Ждет, пока отправитель освободит место в очереди
+                        await queue.put((user['user_id'], text))
+                if len(page) < page_size:
+                    break
+            await queue.put(None)
+            await sender
+        finally:
+            sender.cancel()
+
+        logger.info(
+            f"Итоги недели: отправлено {counts['sent']}, не доставлено {counts['failed']}, "
+            f"без активности {counts['skipped']}"
+        )
+        return counts
+
+    async def run_schedule(self, bot):
+        """
+        Рассылка по расписанию: каждую неделю в settings.weekly_recap_day, settings.weekly_recap_hour
+
+        Новые день и час из settings применяются со следующего ожидания.
+        """
+        while True:
+            await asyncio.sleep(seconds_until(settings.weekly_recap_day, settings.weekly_recap_hour))
+            try:
+                await self.run(bot)
+            except Exception as e:
+                logger.error(f"Ошибка рассылки итогов недели: {e}")
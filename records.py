@@ -0,0 +1,99 @@
+"""
+Компактные типы записей для строк базы данных
+"""
+
+import json
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+
+class Record(Mapping):
+    """
+    Базовая запись с __slots__ и доступом в стиле словаря
+
+    Поддерживает record['key'], record.get('key', default), keys()/items()
+    и сравнение с обычными словарями, поэтому обработчики и форматтеры
+    из utils.py работают с записями без изменений.
+    """
+
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._fields:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._fields)
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._fields)
+        return f"{type(self).__name__}({values})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Преобразование записи в обычный словарь"""
+        return {name: getattr(self, name) for name in self._fields}
+
+
+class UserRecord(Record):
+    """Профиль пользователя (get_user_info)"""
+
+    __slots__ = ('user_id', 'username', 'first_name', 'last_name', 'fitness_level', 'goals')
+    _fields = __slots__
+
+
+class ChatMemberRecord(Record):
+    """Участник чата (get_chat_users)"""
+
+    __slots__ = ('user_id', 'first_name', 'username', 'fitness_level')
+    _fields = __slots__
+
+
+class MessageRecord(Record):
+    """Сообщение из истории чата (get_chat_history)"""
+
+    __slots__ = ('user_id', 'message', 'timestamp', 'first_name', 'username')
+    _fields = __slots__
+
+
+class ProgressRecord(Record):
+    """Замер прогресса пользователя (get_user_progress)"""
+
+    __slots__ = ('id', 'metric_name', 'metric_value', 'date', 'notes')
+    _fields = __slots__
+
+
+class WorkoutRecord(Record):
+    """
+    Тренировка пользователя (get_user_workouts)
+
+    workout_data хранится в виде JSON-строки и декодируется только
+    при первом обращении к полю 'data'.
+    """
+
+    __slots__ = ('type', '_raw_data', 'completed', 'scheduled_date', 'completed_date', '_data')
+    _fields = ('type', 'data', 'completed', 'scheduled_date', 'completed_date')
+
+    def __init__(self, workout_type: str, raw_data: Optional[str], completed: Any,
+                 scheduled_date: Optional[str], completed_date: Optional[str]):
+        self.type = workout_type
+        self._raw_data = raw_data
+        self.completed = bool(completed)
+        self.scheduled_date = scheduled_date
+        self.completed_date = completed_date
+        self._data = None
+
+    @property
+    def data(self) -> Dict:
+        """Данные тренировки (ленивое декодирование JSON)"""
+        if self._data is None:
+            self._data = json.loads(self._raw_data) if self._raw_data else {}
+        return self._data
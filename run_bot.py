@@ -3,7 +3,14 @@
 Скрипт для запуска спортивного тренера
 """
 
+import time
+
+# Отсчет времени запуска - до остальных импортов
+STARTED = time.perf_counter()
+
+import importlib.util
 import os
+import subprocess
 import sys
 from dotenv import load_dotenv
 
@@ -43,38 +50,58 @@ def check_environment():
     
     return True
 
+# Модуль для проверки -> пакет для установки
+DEPENDENCIES = {
+    'telegram': 'python-telegram-bot',
+    'aiohttp': 'aiohttp',
+    'pydantic': 'pydantic',
+    'numpy': 'numpy',
+    'matplotlib': 'matplotlib',
+}
+
 def check_dependencies():
-    """Проверка зависимостей"""
+    """Проверка зависимостей (без импорта: find_spec только ищет пакет)"""
     print("\n📦 Проверка зависимостей...")
     
-    try:
-        import telegram
-        print("✅ python-telegram-bot установлен")
-    except ImportError:
-        print("❌ python-telegram-bot не установлен")
-        print("Установите: pip install -r requirements.txt")
-        return False
+    missing = [package for module, package in DEPENDENCIES.items() if importlib.util.find_spec(module) is None]
     
-    try:
-        import openai
-        print("✅ openai установлен")
-    except ImportError:
-        print("❌ openai не установлен")
-        print("Установите: pip install -r requirements.txt")
-        return False
+    for module, package in DEPENDENCIES.items():
+        if package not in missing:
+            print(f"✅ {package} установлен")
     
-    try:
-        import aiohttp
-        print("✅ aiohttp установлен")
-    except ImportError:
-        print("❌ aiohttp не установлен")
+    if missing:
+        for package in missing:
+            print(f"❌ {package} не установлен")
         print("Установите: pip install -r requirements.txt")
         return False
     
     return True
 
+def profile_imports(module: str = "bot", top: int = 15):
+    """Самые медленные импорты модуля (по выводу python -X importtime)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|").split("|"))
+        timings.append((int(cumulative_us), int(self_us), name))
+    
+    print(f"⏱ Импорт {module}: {max(timings)[0] / 1000:.0f} мс" if timings else f"❌ Не удалось импортировать {module}")
+    print(f"\n{'всего, мс':>10} {'свое, мс':>9}  модуль")
+    for cumulative_us, self_us, name in sorted(timings, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>10.1f} {self_us / 1000:>9.1f}  {name}")
+
 def main():
     """Основная функция"""
+    if "--profile-imports" in sys.argv:
+        profile_imports()
+        return
+    
     print("🏋️‍♂️ Спортивный Тренер - Запуск")
     print("=" * 40)
     
@@ -92,9 +119,14 @@ def main():
     
     try:
         # Импортируем и запускаем бота
+        import_started = time.perf_counter()
         from bot import FitnessTrainerBot
+        init_started = time.perf_counter()
         
         bot = FitnessTrainerBot()
+        print(f"⏱ Запуск: импорт {(init_started - import_started) * 1000:.0f} мс, "
+              f"инициализация {(time.perf_counter() - init_started) * 1000:.0f} мс, "
+              f"всего {(time.perf_counter() - STARTED) * 1000:.0f} мс")
         bot.run()
         
     except KeyboardInterrupt:
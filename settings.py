@@ -0,0 +1,146 @@
+"""
+Настройки производительности с горячей перезагрузкой
+
+Значения по умолчанию берутся из config.py; файл SETTINGS_FILE (JSON)
+переопределяет любые из них. По сигналу SIGHUP файл перечитывается,
+проверяется и применяется к общему объекту settings без перезапуска
+бота: модули читают настройки в момент использования, поэтому уже
+начатые обработчики не прерываются, а новые видят новые значения.
+Если файл не прошел проверку, остаются прежние настройки.
+"""
+
+import json
+import logging
+import os
+from dataclasses import dataclass, field, fields, asdict
+from typing import Annotated, Dict, List, Optional, Tuple
+
+from annotated_types import Ge, Le
+
+from config import (
+    SETTINGS_FILE, OPENROUTER_MODEL, PROMPT_CACHE, MAX_HISTORY_MESSAGES, AI_PLAN_TIMEOUT,
+    MEMORY_TOP_K, MEMORY_TOKEN_BUDGET, FACT_EXTRACTION_INTERVAL, FACT_EXTRACTION_BATCH,
+    FACT_EXTRACTION_MAX_ATTEMPTS,
+    POOL_TARGET_SIZE, POOL_BATCH_SIZE, POOL_REFILL_INTERVAL,
+    CHART_WORKERS, CHART_CACHE_SIZE, GROUP_PLAN_CACHE_TTL, GROUP_ROSTER_NAMES, ROSTER_CACHE_SIZE,
+    LANE_FAST_CONCURRENCY, LANE_SLOW_CONCURRENCY, LANE_SLOW_PER_CHAT, BACKGROUND_JOB_DEADLINE,
+    MESSAGE_DEBOUNCE,
+    USER_DAILY_TOKEN_QUOTA, CHAT_DAILY_TOKEN_QUOTA, USER_RATE_LIMIT, CHAT_RATE_LIMIT,
+    BATCH_CONCURRENCY, BATCH_PACK_SIZE, BATCH_RATE_LIMIT,
+    WEEKLY_RECAP_DAY, WEEKLY_RECAP_HOUR, RECAP_PAGE_SIZE, RECAP_QUEUE_SIZE, RECAP_SEND_RATE,
+    USAGE_FLUSH_INTERVAL, USAGE_FLUSH_THRESHOLD, REMINDER_HOURS
+)
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RateLimit = Tuple[Annotated[int, Ge(0)], Annotated[float, Ge(0)]]  # (запросов, окно в секундах)
+
+
+@dataclass
+class Settings:
+    # ИИ
+    openrouter_model: str = OPENROUTER_MODEL
+    prompt_cache: bool = PROMPT_CACHE
+    max_history_messages: Annotated[int, Ge(1), Le(200)] = MAX_HISTORY_MESSAGES
+    memory_top_k: Annotated[int, Ge(0), Le(50)] = MEMORY_TOP_K
+    memory_token_budget: Annotated[int, Ge(0), Le(4000)] = MEMORY_TOKEN_BUDGET
+    fact_extraction_interval: Annotated[float, Ge(10)] = FACT_EXTRACTION_INTERVAL
+    fact_extraction_batch: Annotated[int, Ge(1), Le(200)] = FACT_EXTRACTION_BATCH
+    fact_extraction_max_attempts: Annotated[int, Ge(1), Le(100)] = FACT_EXTRACTION_MAX_ATTEMPTS
+    ai_plan_timeout: Annotated[float, Ge(0), Le(600)] = AI_PLAN_TIMEOUT
+    # Пулы и кеши
+    pool_target_size: Annotated[int, Ge(0), Le(1000)] = POOL_TARGET_SIZE
+    pool_batch_size: Annotated[int, Ge(1), Le(50)] = POOL_BATCH_SIZE
+    pool_refill_interval: Annotated[float, Ge(1)] = POOL_REFILL_INTERVAL
+    chart_cache_size: Annotated[int, Ge(0)] = CHART_CACHE_SIZE
+    chart_workers: Annotated[int, Ge(1), Le(32)] = CHART_WORKERS  # применяется при следующем создании пула
+    group_plan_cache_ttl: Annotated[int, Ge(0)] = GROUP_PLAN_CACHE_TTL
+    group_roster_names: Annotated[int, Ge(0), Le(50)] = GROUP_ROSTER_NAMES
+    roster_cache_size: Annotated[int, Ge(0)] = ROSTER_CACHE_SIZE
+    # Параллельность обработки обновлений (lanes.py)
+    lane_fast_concurrency: Annotated[int, Ge(1), Le(1024)] = LANE_FAST_CONCURRENCY
+    lane_slow_concurrency: Annotated[int, Ge(1), Le(1024)] = LANE_SLOW_CONCURRENCY
+    lane_slow_per_chat: Annotated[int, Ge(1), Le(64)] = LANE_SLOW_PER_CHAT
+    background_job_deadline: Annotated[float, Ge(0), Le(3600)] = BACKGROUND_JOB_DEADLINE
+    message_debounce: Annotated[float, Ge(0), Le(30)] = MESSAGE_DEBOUNCE
+    # Квоты и учет токенов
+    user_daily_token_quota: Annotated[int, Ge(0)] = USER_DAILY_TOKEN_QUOTA
+    chat_daily_token_quota: Annotated[int, Ge(0)] = CHAT_DAILY_TOKEN_QUOTA
+    user_rate_limit: RateLimit = USER_RATE_LIMIT
+    chat_rate_limit: RateLimit = CHAT_RATE_LIMIT
+    usage_flush_interval: Annotated[float, Ge(1)] = USAGE_FLUSH_INTERVAL
+    usage_flush_threshold: Annotated[int, Ge(1)] = USAGE_FLUSH_THRESHOLD
+    # Пакетная генерация для рассылок
+    batch_concurrency: Annotated[int, Ge(1), Le(64)] = BATCH_CONCURRENCY
+    batch_pack_size: Annotated[int, Ge(1), Le(20)] = BATCH_PACK_SIZE
+    batch_rate_limit: RateLimit = BATCH_RATE_LIMIT
+    # Итоги недели (recaps.py)
+    weekly_recap_day: Annotated[int, Ge(0), Le(6)] = WEEKLY_RECAP_DAY
+    weekly_recap_hour: Annotated[int, Ge(0), Le(23)] = WEEKLY_RECAP_HOUR
+    recap_page_size: Annotated[int, Ge(1), Le(5000)] = RECAP_PAGE_SIZE
+    recap_queue_size: Annotated[int, Ge(1), Le(10000)] = RECAP_QUEUE_SIZE
+    recap_send_rate: Annotated[float, Ge(0.1), Le(30)] = RECAP_SEND_RATE
+    # Тренировки
+    reminder_hours: List[Annotated[int, Ge(0), Le(23)]] = field(default_factory=lambda: list(REMINDER_HOURS))
+
+
+settings = Settings()
+
+
+def parse_settings(data: Dict) -> Settings:
+    """
+    Проверка настроек из файла поверх значений по умолчанию
+
+    Raises:
+        ValueError: Неизвестный ключ или значение неверного типа / вне допустимого диапазона
+    """
+    # pydantic нужен только при загрузке файла, поэтому импортируется здесь
+    from pydantic import TypeAdapter
+
+    unknown = set(data) - {f.name for f in fields(Settings)}
+    if unknown:
+        raise ValueError(f"неизвестные настройки: {', '.join(sorted(unknown))}")
+    return TypeAdapter(Settings).validate_python({**asdict(Settings()), **data})
+
+
+def apply_settings(new: Settings) -> Dict:
+    """
+    Применение настроек к общему объекту settings
+
+    Returns:
+        Изменившиеся настройки: имя -> (старое значение, новое значение)
+    """
+    changed = {}
+    for f in fields(Settings):
+        old_value, new_value = getattr(settings, f.name), getattr(new, f.name)
+        if old_value != new_value:
+            changed[f.name] = (old_value, new_value)
+            setattr(settings, f.name, new_value)
+    return changed
+
+
+def reload_settings(path: str = SETTINGS_FILE) -> Optional[Dict]:
+    """
+    Перечитывание файла настроек
+
+    Returns:
+        Изменившиеся настройки или None, если файл не найден или не прошел проверку
+    """
+    if not os.path.exists(path):
+        logger.warning(f"Файл настроек {path} не найден, используются текущие настройки")
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            new = parse_settings(json.load(f))
+    except Exception as e:
+        metrics.inc('settings_reloads_total', status="error")
+        logger.error(f"Ошибка загрузки настроек из {path}, оставлены прежние: {e}")
+        return None
+
+    changed = apply_settings(new)
+    metrics.inc('settings_reloads_total', status="ok")
+    for name, (old_value, new_value) in changed.items():
+        logger.info(f"Настройка {name}: {old_value} -> {new_value}")
+    logger.info(f"Настройки загружены из {path}, изменено: {len(changed)}")
+    return changed
@@ -5,6 +5,7 @@
 
 import asyncio
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
@@ -47,6 +48,7 @@ async def test_database():
             print("❌ Ошибка получения истории")
         
         # Очистка тестовой базы
+        db.close()
         os.remove("test_fitness.db")
         print("✅ Тестовая база удалена")
         
@@ -63,12 +65,17 @@ async def test_ai_client():
     try:
         from ai_client import OpenRouterClient
         
+        fake_api = None
         api_key = os.getenv('OPENROUTER_API_KEY')
         if not api_key or api_key == "your_openrouter_api_key_here":
-            print("⚠️ API ключ не настроен, пропускаем тест")
-            return True
-        
-        client = OpenRouterClient(api_key=api_key)
+            # Без ключа проверяем клиент против локального фейкового OpenRouter
+            from benchmark import FakeOpenRouter, LatencyModel
+            
+            fake_api = FakeOpenRouter(LatencyModel("const:0"))
+            client = OpenRouterClient(api_key="test", base_url=await fake_api.start())
+            print("⚠️ API ключ не настроен, используем фейковый OpenRouter")
+        else:
+            client = OpenRouterClient(api_key=api_key)
         print("✅ AI клиент инициализирован")
         
         # Тест форматирования сообщений
@@ -83,6 +90,14 @@ async def test_ai_client():
         else:
             print("❌ Ошибка форматирования сообщений")
         
+        if fake_api:
+            response = await client.get_response(formatted)
+            await fake_api.stop()
+            if not response:
+                print("❌ Ошибка получения ответа от фейкового API")
+                return False
+            print("✅ Ответ от фейкового API получен")
+        
         return True
         
     except Exception as e:
@@ -114,6 +129,498 @@ async def test_config():
         print(f"❌ Ошибка тестирования конфигурации: {e}")
         return False
 
+async def test_records():
+    """Тестирование записей из базы (records.py)"""
+    print("\n🧪 Тестирование записей...")
+    
+    try:
+        from records import UserRecord, WorkoutRecord
+        
+        user = UserRecord(1, "test_user", "Тест", None, "beginner", "general_fitness")
+        assert user['first_name'] == "Тест" and user.first_name == "Тест"
+        assert user.get('last_name', "нет") is None
+        assert user.get('missing', "нет") == "нет"
+        assert 'goals' in user and 'missing' not in user
+        assert len(user) == 6 and list(user)[0] == 'user_id'
+        assert dict(user) == user.to_dict() == {
+            'user_id': 1, 'username': "test_user", 'first_name': "Тест",
+            'last_name': None, 'fitness_level': "beginner", 'goals': "general_fitness"
+        }
+        assert user == user.to_dict()
+        try:
+            user['missing']
+            assert False, "нет KeyError для неизвестного поля"
+        except KeyError:
+            pass
+        print("✅ Запись ведет себя как словарь")
+        
+        # Служебные слоты не видны, JSON декодируется при обращении к data
+        workout = WorkoutRecord("individual", '{"plan": "Присед"}', 1, None, None)
+        assert list(workout) == ['type', 'data', 'completed', 'scheduled_date', 'completed_date']
+        assert workout['completed'] is True and workout._data is None
+        assert workout['data'] == {'plan': "Присед"} and workout._data is not None
+        assert WorkoutRecord("group", None, 0, None, None)['data'] == {}
+        print("✅ Данные тренировки декодируются лениво")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования записей: {e!r}")
+        return False
+
+async def test_quotas():
+    """Тестирование квот и лимитов частоты (usage.py)"""
+    print("\n🧪 Тестирование квот...")
+    
+    try:
+        from database import FitnessDatabase
+        from usage import QuotaManager, SlidingWindowLimiter, UsageTracker
+        
+        # Окно скользит: старые запросы перестают учитываться через window секунд
+        limiter = SlidingWindowLimiter(2, 10)
+        limiter.hit(1, 0.0)
+        limiter.hit(1, 1.0)
+        assert limiter.retry_after(1, 2.0) == 8.0
+        assert limiter.retry_after(2, 2.0) == 0.0
+        assert limiter.retry_after(1, 10.0) == 0.0
+        limiter.hit(1, 10.0)
+        assert limiter.retry_after(1, 10.5) == 0.5
+        disabled = SlidingWindowLimiter(0, 10)
+        disabled.hit(1, 0.0)
+        assert disabled.retry_after(1, 0.0) == 0.0
+        print("✅ Скользящее окно считает запросы верно")
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            db = FitnessDatabase(os.path.join(tmp, "quotas.db"))
+            tracker = UsageTracker(db, flush_threshold=1000)
+            
+            quotas = QuotaManager(tracker, user_daily_tokens=0, chat_daily_tokens=0,
+                                  user_rate=(2, 60), chat_rate=(0, 0))
+            assert quotas.acquire(1, 10) is None
+            assert quotas.acquire(1, 10) is None
+            assert quotas.acquire(1, 10).startswith("⏳")
+            assert quotas.acquire(2, 10) is None
+            print("✅ Лимит частоты на пользователя работает")
+            
+            quotas = QuotaManager(tracker, user_daily_tokens=100, chat_daily_tokens=150,
+                                  user_rate=(0, 0), chat_rate=(0, 0))
+            tracker.record(1, 10, {'prompt_tokens': 80, 'completion_tokens': 30})
+            assert "Дневной лимит запросов к тренеру" in quotas.acquire(1, 10)
+            assert quotas.acquire(2, 10) is None
+            tracker.record(2, 10, {'prompt_tokens': 50, 'completion_tokens': None})
+            assert "для этого чата" in quotas.acquire(2, 10)
+            assert quotas.acquire(2, 20) is None
+            print("✅ Дневные квоты пользователя и чата работают")
+            
+            # После сброса в базу расход виден и новому счетчику
+            tracker.flush()
+            assert UsageTracker(db).tokens_today('user', 1) == 110
+            assert UsageTracker(db).tokens_today('chat', 10) == 160
+            print("✅ Расход токенов сохраняется в базе")
+            db.close()
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования квот: {e!r}")
+        return False
+
+async def test_log_command():
+    """Тестирование /log и сводки прогресса (analytics.py)"""
+    print("\n🧪 Тестирование /log...")
+    
+    try:
+        from analytics import summarize_progress
+        from ai_client import OpenRouterClient
+        from benchmark import FakeChat, FakeContext, FakeUpdate, FakeUser
+        from bot import FitnessTrainerBot
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            bot = FitnessTrainerBot(os.path.join(tmp, "log.db"), OpenRouterClient(api_key="test"))
+            user, chat = FakeUser(1), FakeChat(1, "private")
+            
+            async def log(*args):
+                update, context = FakeUpdate("log", user, chat), FakeContext()
+                context.args = list(args)
+                await bot.log_command(update, context)
+                return update.sent[-1]
+            
+            for args in (["вес", "nan"], ["вес", "inf"], ["вес", "-Infinity"], ["вес", "abc"], ["вес"]):
+                assert (await log(*args)).startswith("📝 Формат"), args
+            assert not bot.db.get_user_progress(1)
+            print("✅ Нечисловые, бесконечные и пропущенные значения отклоняются")
+            
+            assert (await log("Вес", "75,5", "после", "отпуска")).startswith("✅")
+            rows = bot.db.get_user_progress(1)
+            assert [(r['metric_name'], r['metric_value'], r['notes']) for r in rows] == [("вес", 75.5, "после отпуска")]
+            print("✅ Замер сохранен")
+            bot.db.close()
+        
+        # Уже сохраненные NULL и nan не портят сводку
+        rows = [
+            {'metric_name': "вес", 'metric_value': value, 'date': f"2026-01-0{day}"}
+            for day, value in enumerate([80.0, None, float('nan'), 79.0], 1)
+        ] + [{'metric_name': "пульс", 'metric_value': float('inf'), 'date': "2026-01-01"}]
+        summaries = summarize_progress(rows)
+        assert [s['metric'] for s in summaries] == ["вес"]
+        assert summaries[0]['count'] == 2 and summaries[0]['change'] == -1.0
+        print("✅ Сводка прогресса пропускает пустые и бесконечные значения")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования /log: {e!r}")
+        return False
+
+async def test_workout_completion():
+    """Тестирование отметки тренировок и серий"""
+    print("\n🧪 Тестирование выполнения тренировок...")
+    
+    try:
+        from database import FitnessDatabase
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            db = FitnessDatabase(os.path.join(tmp, "completion.db"))
+            for user_id in (1, 2, 3):
+                db.add_user(user_id, f"user{user_id}", f"Участник{user_id}")
+            
+            group_id = db.save_group_workout([1, 2], {'plan': "Круговая"}, chat_id=100)
+            assert group_id
+            assert db.complete_workout(1, group_id=group_id)
+            assert not db.complete_workout(1, group_id=group_id)
+            assert not db.complete_workout(3, group_id=group_id)
+            assert db.get_workout_stats('chat', 100)['completed_workouts'] == 1
+            assert db.complete_workout(2, group_id=group_id)
+            assert db.get_workout_stats('chat', 100)['completion_rate'] == 100
+            print("✅ Групповая тренировка отмечается каждым участником отдельно")
+            
+            workout_id = db.save_workout(1, "individual", {'plan': "Присед"})
+            assert not db.complete_workout(2, workout_id)
+            streak = db.get_user_streak(1)
+            assert (streak['current_streak'], streak['best_streak'], streak['total_completed']) == (1, 1, 1)
+            assert streak['total_assigned'] == 2 and streak['adherence'] == 50
+            print("✅ Чужую тренировку отметить нельзя")
+            
+            # Вчерашняя тренировка продолжает серию, пропуск дня ее обнуляет
+            conn = db._connect()
+            conn.execute("UPDATE user_streaks SET current_streak = 3, best_streak = 3, "
+                         "last_completed_day = date('now', '-1 day') WHERE user_id = 1")
+            conn.commit()
+            assert db.complete_workout(1, workout_id)
+            streak = db.get_user_streak(1)
+            assert (streak['current_streak'], streak['best_streak'], streak['adherence']) == (4, 4, 100)
+            
+            conn.execute("UPDATE user_streaks SET last_completed_day = date('now', '-3 days') WHERE user_id = 1")
+            conn.commit()
+            assert db.get_user_streak(1)['current_streak'] == 0
+            assert db.complete_workout(1, db.save_workout(1, "individual", {'plan': "Бег"}))
+            streak = db.get_user_streak(1)
+            assert (streak['current_streak'], streak['best_streak']) == (1, 4)
+            print("✅ Серии считаются по дням выполнения")
+            db.close()
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования выполнения тренировок: {e!r}")
+        return False
+
+async def test_structured_plans():
+    """Тестирование разбора JSON-планов и запасных вариантов"""
+    print("\n🧪 Тестирование JSON-планов...")
+    
+    try:
+        import json
+        from bot import FitnessTrainerBot, LOCAL_PLAN_NOTE
+        from config import STRUCTURED_PLANS, LOCAL_PLAN_FALLBACK
+        from workout_plans import parse_plan
+        
+        plan_json = json.dumps({
+            "title": "Сила ног", "level": "beginner", "duration_min": 30,
+            "blocks": [{"title": "Основная часть", "exercises": [{"name": "Присед", "sets": 3, "reps": "12"}]}]
+        }, ensure_ascii=False)
+        plan = parse_plan(f"Вот план:\n```json\n{plan_json}\n```\nУдачи!")
+        assert plan and plan.title == "Сила ног" and plan.blocks[0].exercises[0].sets == 3
+        for response in (None, "", "Сегодня просто отдохни", '{"title": "Без блоков", "duration_min": 30, "blocks": []}',
+                         '{"title": "Обрыв", "duration_min": 30, "blocks": [{'):
+            assert parse_plan(response) is None, response
+        print("✅ План извлекается из ответа, негодный ответ отклоняется")
+        
+        class FakePlanClient:
+            """ИИ с заданными ответами на JSON-план и на обычный текстовый план"""
+            
+            def __init__(self, structured, text):
+                self.structured, self.text = structured, text
+                self.usage_tracker = None
+            
+            async def generate_structured_workout_plan(self, user_info, usage_key=None, facts=None):
+                return parse_plan(self.structured)
+            
+            async def generate_workout_plan(self, user_info, usage_key=None, facts=None):
+                return self.text
+        
+        if STRUCTURED_PLANS and LOCAL_PLAN_FALLBACK:
+            with tempfile.TemporaryDirectory() as tmp:
+                bot = FitnessTrainerBot(os.path.join(tmp, "plans.db"), FakePlanClient(plan_json, None))
+                user_info = {'user_id': 1, 'first_name': "Тест", 'fitness_level': "beginner", 'goals': "strength"}
+                
+                text, data = await bot._generate_workout(user_info, (1, 1))
+                assert "Сила ног" in text and data['title'] == "Сила ног"
+                
+                bot.ai_client = FakePlanClient("не JSON", "Текстовый план")
+                assert await bot._generate_workout(user_info, (1, 1)) == ("Текстовый план", None)
+                
+                bot.ai_client = FakePlanClient(None, None)
+                text, data = await bot._generate_workout(user_info, (1, 1))
+                assert text.endswith(LOCAL_PLAN_NOTE) and data['blocks']
+                print("✅ Без JSON-плана используется текстовый, без ответа ИИ - локальный план")
+                bot.db.close()
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования JSON-планов: {e!r}")
+        return False
+
+async def test_packed_responses():
+    """Тестирование разбора упакованных ответов пакетной генерации"""
+    print("\n🧪 Тестирование упакованных ответов...")
+    
+    try:
+        from ai_client import split_packed_response
+        
+        response = "[1] Первый текст\nв две строки\n\n[2]   Второй\n[3] Третий"
+        assert split_packed_response(response, 3) == {0: "Первый текст\nв две строки", 1: "Второй", 2: "Третий"}
+        # Пропущенные, пустые, лишние и повторные номера не попадают в результат
+        response = "Вот тексты:\n[1] Раз\n[3]\n[4] Лишний\n[1] Повтор\n[0] Ноль"
+        assert split_packed_response(response, 3) == {0: "Раз"}
+        # Номер в квадратных скобках внутри строки - не начало элемента
+        assert split_packed_response("[1] Подход [2] раза", 2) == {0: "Подход [2] раза"}
+        assert split_packed_response(None, 2) == {} and split_packed_response("Без номеров", 2) == {}
+        print("✅ Тексты разбираются по номерам")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования упакованных ответов: {e!r}")
+        return False
+
+async def test_weekly_recap_pages():
+    """Тестирование постраничного чтения итогов недели"""
+    print("\n🧪 Тестирование страниц итогов недели...")
+    
+    try:
+        from datetime import date
+        from database import FitnessDatabase
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            db = FitnessDatabase(os.path.join(tmp, "recaps.db"))
+            for user_id in (5, 1, 4, 2, 3):
+                db.add_user(user_id, f"user{user_id}", f"Участник{user_id}")
+            workout_id = db.save_workout(3, "individual", {'plan': "Присед"})
+            db.complete_workout(3, workout_id)
+            db.save_workout(3, "individual", {'plan': "Бег"})
+            today = date.today().isoformat()
+            db.save_progress(3, "вес", 80.0, today)
+            db.save_progress(3, "вес", 79.5, today)
+            
+            pages, after_user_id = [], 0
+            while True:
+                page = db.get_weekly_recap_page(after_user_id, 2)
+                assert page is not None
+                if not page:
+                    break
+                pages.append([user['user_id'] for user in page])
+                after_user_id = page[-1]['user_id']
+            assert pages == [[1, 2], [3, 4], [5]]
+            print("✅ Страницы идут по user_id без пропусков и повторов")
+            
+            user = db.get_weekly_recap_page(2, 1)[0]
+            assert user['user_id'] == 3
+            assert (user['stats']['total_workouts'], user['stats']['completed_workouts']) == (2, 1)
+            assert user['stats']['completion_rate'] == 50
+            assert user['progress'] == [("вес", 80.0, 79.5, 2)]
+            assert db.get_weekly_recap_page(3, 1)[0]['stats']['total_workouts'] == 0
+            print("✅ Статистика и замеры за неделю собраны")
+            
+            # Ошибка чтения - None, а не пустая страница (конец списка)
+            db._connect().execute("DROP TABLE workout_stats")
+            assert db.get_weekly_recap_page(0, 2) is None
+            print("✅ Ошибка чтения отличается от конца списка")
+            db.close()
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования страниц итогов недели: {e!r}")
+        return False
+
+async def test_memory_search():
+    """Тестирование поиска по памяти чата (BM25)"""
+    print("\n🧪 Тестирование памяти чата...")
+    
+    try:
+        from database import FitnessDatabase
+        from memory import tokenize
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            db = FitnessDatabase(os.path.join(tmp, "memory.db"))
+            db.add_user(1, "user1", "Анна")
+            messages = [
+                "Вчера бегала по парку, погода отличная",
+                "У меня болит колено после приседаний",
+                "Колено, колено, опять колено",
+                "Купила гантели, колено уже не беспокоит, а вот спина после долгого дня за компьютером иногда ноет",
+                "Сегодня отдыхаю",
+            ]
+            for text in messages:
+                db.save_message(100, 1, text)
+            db.save_message(100, 0, "Береги колено!")  # ответ бота в память не попадает
+            db.save_message(200, 1, "Колено в другом чате")
+            assert db.update_memory_index(100) == len(messages)
+            assert db.update_memory_index(100) == 0
+            
+            def search(query, **kwargs):
+                return [r['message'] for r in db.search_memory(100, tokenize(query), **kwargs)]
+            
+            # Частота терма и длина сообщения: короткое сообщение с повторами выше длинного
+            assert search("колено") == [messages[2], messages[1], messages[3]]
+            # Совпадение по двум термам выше совпадения по одному, частое слово весит меньше редкого
+            assert search("колено после приседаний")[0] == messages[1]
+            assert search("гантели колено")[0] == messages[3]
+            assert search("колено", limit=1) == [messages[2]]
+            assert search("плавание") == [] and search("") == []
+            print("✅ Сообщения ранжируются по BM25")
+            
+            # Последние сообщения уже в окне истории и не ищутся повторно
+            assert search("колено", skip_recent=3) == [messages[1]]
+            assert db.search_memory(300, tokenize("колено")) == []
+            print("✅ Окно истории и другие чаты исключены")
+            db.close()
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования памяти чата: {e!r}")
+        return False
+
+async def test_fact_extraction():
+    """Тестирование курсора извлечения фактов"""
+    print("\n🧪 Тестирование извлечения фактов...")
+    
+    try:
+        from database import FitnessDatabase
+        from facts import FactExtractor
+        from settings import settings
+        
+        class FakeFactsClient:
+            """ИИ, который отвечает заданными ответами по очереди"""
+            
+            def __init__(self, *responses):
+                self.responses = list(responses)
+                self.calls = 0
+            
+            async def get_response(self, messages, **kwargs):
+                self.calls += 1
+                return self.responses.pop(0) if self.responses else None
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            db = FitnessDatabase(os.path.join(tmp, "facts.db"))
+            db.add_user(1, "user1", "Анна")
+            db.save_message(100, 1, "Привет")  # короткая реплика - к модели не уходит
+            db.save_message(100, 1, "У меня болит колено, дома есть гантели")
+            
+            def pending():
+                return len(db.get_messages_after_cursor(10))
+            
+            # Без ответа ИИ порция повторяется сколько угодно раз
+            extractor = FactExtractor(db, FakeFactsClient(), batch_size=10)
+            for _ in range(settings.fact_extraction_max_attempts + 1):
+                assert await extractor.extract_pending() == 0
+            assert pending() == 2
+            print("✅ Без ответа ИИ курсор стоит на месте")
+            
+            # Неразбираемый ответ повторяется до исчерпания попыток, потом порция пропускается
+            attempts = settings.fact_extraction_max_attempts
+            extractor = FactExtractor(db, FakeFactsClient(*["не JSON"] * attempts), batch_size=10)
+            for _ in range(attempts - 1):
+                await extractor.extract_pending()
+                assert pending() == 2
+            assert await extractor.extract_pending() == 0
+            assert pending() == 0 and db.get_user_facts(1) == {}
+            assert extractor.ai_client.calls == attempts
+            print("✅ Порция с неразбираемым ответом пропускается после всех попыток")
+            
+            db.save_message(100, 1, "Тренируюсь по вечерам, колено уже не болит")
+            db.save_message(100, 1, "Ок")
+            extractor = FactExtractor(db, FakeFactsClient(
+                '{"facts": [{"user": 1, "key": "availability", "value": "вечером"}, {"user": 2, "key": "weight", "value": "80"}]}'
+            ), batch_size=10)
+            assert await extractor.extract_pending() == 1
+            assert pending() == 0 and db.get_user_facts(1) == {'availability': "вечером"}
+            assert await extractor.extract_pending() == 0 and extractor.ai_client.calls == 1
+            print("✅ Факты сохраняются, курсор сдвигается вместе с ними")
+            db.close()
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования извлечения фактов: {e!r}")
+        return False
+
+async def test_message_search():
+    """Тестирование полнотекстового поиска по истории (FTS5)"""
+    print("\n🧪 Тестирование поиска по истории...")
+    
+    try:
+        from database import FitnessDatabase, SNIPPET_OPEN, SNIPPET_CLOSE
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            db = FitnessDatabase(os.path.join(tmp, "search.db"))
+            db.add_user(1, "user1", "Анна")
+            chat_id = -1234
+            messages = [
+                "Колени болят после бега по асфальту, и вообще после длинной пробежки всё тело ноет",
+                "Приседания с гантелями без боли",
+                "Колено, колено, снова колено",
+                "Размял коленом дверь",
+            ]
+            ids = {}
+            for text in messages:
+                db.save_message(chat_id, 1, text)
+            for row in db._connect().execute("SELECT id, message_text FROM message_history"):
+                ids[row[1]] = row[0]
+            db.save_message(1234, 1, "Колено в чате с тем же номером без минуса")
+            
+            def search(query, **kwargs):
+                return [r['id'] for r in db.search_messages(chat_id, query, **kwargs)]
+            
+            # Поиск по основе слова, короткое сообщение с повторами выше длинного
+            assert search("колено") == [ids[messages[2]], ids[messages[3]], ids[messages[0]]]
+            assert search("колено", limit=1) == [ids[messages[2]]]
+            # Все слова запроса обязательны
+            assert search("колени бег") == [ids[messages[0]]]
+            assert search("колено гантели") == [] and search("плавание") == []
+            print("✅ Сообщения находятся по основе слова и ранжируются по BM25")
+            
+            # Синтаксис FTS5 из запроса не интерпретируется
+            assert search('колено" OR "гантели') == search("колено OR гантели") == []
+            assert search("колено*") == search("колено") and search("") == []
+            result = db.search_messages(chat_id, "гантели")[0]
+            assert result['first_name'] == "Анна"
+            assert f"{SNIPPET_OPEN}гантелями{SNIPPET_CLOSE}" in result['snippet']
+            print("✅ Ввод пользователя экранируется, совпадения выделяются")
+            
+            # Чаты -1234 и 1234 не смешиваются
+            assert len(db.search_messages(1234, "колено")) == 1
+            db.close()
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования поиска по истории: {e!r}")
+        return False
+
 async def main():
     """Основная функция тестирования"""
     print("🚀 Запуск тестирования компонентов бота...\n")
@@ -121,7 +628,17 @@ async def main():
     tests = [
         test_config(),
         test_database(),
-        test_ai_client()
+        test_ai_client(),
+        test_records(),
+        test_quotas(),
+        test_log_command(),
+        test_workout_completion(),
+        test_structured_plans(),
+        test_packed_responses(),
+        test_weekly_recap_pages(),
+        test_memory_search(),
+        test_fact_extraction(),
+        test_message_search()
     ]
     
     results = await asyncio.gather(*tests)
@@ -0,0 +1,185 @@
+"""
+Учет расхода токенов и квоты пользователей и чатов
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import date
+from typing import Deque, Dict, Optional, Tuple
+
+from metrics import metrics
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+UsageKey = Tuple[int, int]  # (user_id, chat_id)
+
+
+class UsageTracker:
+    """
+    Счетчики расхода токенов в памяти со сбросом в базу пачками
+
+    Каждое обращение к API добавляет запись в счетчики за текущий день;
+    в таблицу token_usage они попадают одной транзакцией, когда
+    накопится settings.usage_flush_threshold записей или по таймеру.
+    """
+
+    def __init__(self, db, flush_threshold: Optional[int] = None):
+        self.db = db
+        self.flush_threshold = flush_threshold
+        self._pending: Dict[Tuple[int, int, str], list] = {}
+        self._pending_records = 0
+        # Дневные суммы токенов: ('user'|'chat', id) -> tokens
+        self._daily_totals: Dict[Tuple[str, int], int] = {}
+        self._day = date.today().isoformat()
+
+    def _roll_day(self):
+        today = date.today().isoformat()
+        if today != self._day:
+            self.flush()
+            self._day = today
+            self._daily_totals.clear()
+
+    def record(self, user_id: int, chat_id: int, usage: Optional[Dict]):
+        """Учет блока usage из ответа OpenRouter"""
+        if not usage:
+            return
+        self._roll_day()
+
+        prompt_tokens = usage.get('prompt_tokens', 0) or 0
+        completion_tokens = usage.get('completion_tokens', 0) or 0
+        cost = usage.get('cost', 0.0) or 0.0
+        total = prompt_tokens + completion_tokens
+
+        counters = self._pending.setdefault((user_id, chat_id, self._day), [0, 0, 0, 0.0])
+        counters[0] += 1
+        counters[1] += prompt_tokens
+        counters[2] += completion_tokens
+        counters[3] += cost
+        self._pending_records += 1
+
+        for key in (('user', user_id), ('chat', chat_id)):
+            if key in self._daily_totals:
+                self._daily_totals[key] += total
+
+        if self._pending_records >= (self.flush_threshold or settings.usage_flush_threshold):
+            self.flush()
+
+    def tokens_today(self, scope: str, scope_id: int) -> int:
+        """Расход токенов за сегодня (база + еще не сброшенные счетчики)"""
+        self._roll_day()
+        key = (scope, scope_id)
+        if key not in self._daily_totals:
+            stored = self.db.get_token_usage(self._day, **{f"{scope}_id": scope_id})
+            pending = sum(
+                c[1] + c[2] for (user_id, chat_id, _), c in self._pending.items()
+                if (user_id if scope == 'user' else chat_id) == scope_id
+            )
+            self._daily_totals[key] = stored + pending
+        return self._daily_totals[key]
+
+    def flush(self):
+        """Сброс накопленных счетчиков в базу одной транзакцией"""
+        if not self._pending:
+            return
+        rows = [
+            (user_id, chat_id, day, c[0], c[1], c[2], c[3])
+            for (user_id, chat_id, day), c in self._pending.items()
+        ]
+        if self.db.add_token_usage(rows):
+            self._pending.clear()
+            self._pending_records = 0
+
+    async def run_periodic_flush(self, interval: Optional[float] = None):
+        """Фоновый сброс счетчиков по таймеру"""
+        while True:
+            await asyncio.sleep(interval or settings.usage_flush_interval)
+            self.flush()
+
+
+class SlidingWindowLimiter:
+    """Ограничение числа запросов в скользящем окне"""
+
+    def __init__(self, max_requests: int, window: float):
+        self.max_requests = max_requests
+        self.window = window
+        self._events: Dict[int, Deque[float]] = {}
+
+    def retry_after(self, key: int, now: float) -> float:
+        """Сколько секунд ждать до следующего разрешенного запроса (0 - можно сейчас)"""
+        if self.max_requests <= 0:
+            return 0.0
+        events = self._events.get(key)
+        if not events:
+            return 0.0
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        if not events:
+            del self._events[key]
+            return 0.0
+        if len(events) < self.max_requests:
+            return 0.0
+        return events[0] + self.window - now
+
+    def hit(self, key: int, now: float):
+        if self.max_requests > 0:
+            self._events.setdefault(key, deque()).append(now)
+
+
+class QuotaManager:
+    """
+    Проверка квот перед обращением к API
+
+    Дневные лимиты токенов на пользователя и чат плюс ограничение частоты
+    запросов в скользящем окне. Нулевой лимит отключает проверку.
+    Не заданные явно лимиты читаются из settings при каждой проверке.
+    """
+
+    def __init__(self, tracker: UsageTracker,
+                 user_daily_tokens: Optional[int] = None,
+                 chat_daily_tokens: Optional[int] = None,
+                 user_rate: Optional[Tuple[int, float]] = None,
+                 chat_rate: Optional[Tuple[int, float]] = None):
+        self.tracker = tracker
+        self.user_daily_tokens = user_daily_tokens
+        self.chat_daily_tokens = chat_daily_tokens
+        self.user_rate = user_rate
+        self.chat_rate = chat_rate
+        self.user_limiter = SlidingWindowLimiter(*(user_rate or settings.user_rate_limit))
+        self.chat_limiter = SlidingWindowLimiter(*(chat_rate or settings.chat_rate_limit))
+
+    def _sync_limits(self):
+        """Применение лимитов частоты из settings (после перезагрузки настроек)"""
+        self.user_limiter.max_requests, self.user_limiter.window = self.user_rate or settings.user_rate_limit
+        self.chat_limiter.max_requests, self.chat_limiter.window = self.chat_rate or settings.chat_rate_limit
+
+    def acquire(self, user_id: int, chat_id: int) -> Optional[str]:
+        """
+        Проверка и резервирование одного запроса к API
+
+        Returns:
+            None, если запрос разрешен, иначе текст причины отказа
+        """
+        user_daily_tokens = settings.user_daily_token_quota if self.user_daily_tokens is None else self.user_daily_tokens
+        chat_daily_tokens = settings.chat_daily_token_quota if self.chat_daily_tokens is None else self.chat_daily_tokens
+        self._sync_limits()
+
+        if user_daily_tokens and self.tracker.tokens_today('user', user_id) >= user_daily_tokens:
+            metrics.inc('quota_denials_total', reason="user_daily")
+            return "🚫 Дневной лимит запросов к тренеру исчерпан. Возвращайся завтра!"
+
+        if chat_daily_tokens and self.tracker.tokens_today('chat', chat_id) >= chat_daily_tokens:
+            metrics.inc('quota_denials_total', reason="chat_daily")
+            return "🚫 Дневной лимит запросов для этого чата исчерпан. Возвращайтесь завтра!"
+
+        now = time.monotonic()
+        wait = max(self.user_limiter.retry_after(user_id, now), self.chat_limiter.retry_after(chat_id, now))
+        if wait > 0:
+            metrics.inc('quota_denials_total', reason="rate")
+            return f"⏳ Слишком много запросов. Попробуй через {int(wait) + 1} сек."
+
+        self.user_limiter.hit(user_id, now)
+        self.chat_limiter.hit(chat_id, now)
+        return None
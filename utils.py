@@ -2,10 +2,13 @@
 Дополнительные утилиты для спортивного тренера
 """
 
+import html
 import json
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
+from config import GOAL_NAMES
+
 def format_workout_schedule(workouts: List[Dict]) -> str:
     """
     Форматирование расписания тренировок
@@ -65,6 +68,32 @@ def calculate_weekly_stats(workouts: List[Dict]) -> Dict:
         'workout_types': workout_types
     }
 
+def format_workout_stats(stats: Dict, title: str) -> str:
+    """
+    Форматирование статистики тренировок
+    
+    Args:
+        stats: Статистика в формате calculate_weekly_stats
+        title: Заголовок блока
+        
+    Returns:
+        Отформатированная статистика
+    """
+    text = f"<b>{title}</b>\n"
+    
+    if not stats.get('total_workouts'):
+        return text + "Тренировок пока нет\n"
+    
+    text += f"💪 Тренировок: {stats['total_workouts']}\n"
+    text += f"✅ Выполнено: {stats['completed_workouts']} ({stats['completion_rate']}%)\n"
+    if stats.get('minutes'):
+        text += f"⏱ Минут тренировок: {stats['minutes']}\n"
+    
+    for workout_type, count in sorted(stats['workout_types'].items(), key=lambda x: -x[1]):
+        text += f"  • {workout_type}: {count}\n"
+    
+    return text
+
 def format_progress_summary(progress_data: List[Dict]) -> str:
     """
     Форматирование сводки прогресса
@@ -162,8 +191,8 @@ def format_user_profile(user_info: Dict) -> str:
     profile += f"📊 <b>Уровень подготовки:</b> {emoji} {level}\n"
     
     # Цели
-    goals = user_info.get('goals', 'Не указаны')
-    profile += f"🎯 <b>Цели:</b> {goals}\n"
+    goals = user_info.get('goals') or 'Не указаны'
+    profile += f"🎯 <b>Цели:</b> {GOAL_NAMES.get(goals, html.escape(goals))}\n"
     
     # Дата регистрации
     created_at = user_info.get('created_at', 'Неизвестно')
@@ -214,15 +243,50 @@ def suggest_next_workout(user_info: Dict, last_workout: Optional[Dict] = None) -
     import random
     suggestion = random.choice(suggestions.get(level, suggestions['beginner']))
     
-    if last_workout:
-        last_type = last_workout.get('type', '')
-        if 'cardio' in last_type.lower() or 'бег' in last_type.lower():
-            suggestion = "💪 Силовая тренировка (чередуем с кардио)"
-        elif 'силовая' in last_type.lower() or 'strength' in last_type.lower():
-            suggestion = "🏃‍♂️ Кардио тренировка (чередуем с силовой)"
+    context = workout_context(last_workout)
+    if context == 'after_cardio':
+        suggestion = "💪 Силовая тренировка (чередуем с кардио)"
+    elif context == 'after_strength':
+        suggestion = "🏃‍♂️ Кардио тренировка (чередуем с силовой)"
     
     return f"💡 <b>Предложение на сегодня:</b>\n{suggestion}"
 
+# Признаки кардио и силовой тренировки в названиях плана, блоков и упражнений
+CARDIO_MARKERS = ('кардио', 'cardio', 'бег', 'прыж', 'берпи', 'скакалк', 'вело', 'гребн',
+                  'скалолаз', 'выносливост', 'жиросжиг', 'интервал')
+STRENGTH_MARKERS = ('силов', 'strength', 'жим', 'тяга', 'штанг', 'гантел', 'подтягиван', 'выпад')
+
+def workout_context(last_workout: Optional[Dict] = None) -> str:
+    """
+    Контекст следующей тренировки по содержанию последней
+    
+    Тип тренировки в базе - только individual или group, поэтому контекст
+    определяется по структуре плана (workout_data.plan): какие признаки
+    встречаются чаще в названиях плана, блоков и упражнений.
+    
+    Args:
+        last_workout: Последняя тренировка (get_user_workouts)
+        
+    Returns:
+        'after_cardio', 'after_strength' или 'general'
+    """
+    if not last_workout:
+        return 'general'
+    plan = (last_workout.get('data') or {}).get('plan') or {}
+    names = [last_workout.get('type') or '', plan.get('title') or '']
+    for block in plan.get('blocks') or []:
+        names.append(block.get('title') or '')
+        names.extend(exercise.get('name') or '' for exercise in block.get('exercises') or [])
+    text = ' '.join(names).lower()
+    
+    cardio = sum(text.count(marker) for marker in CARDIO_MARKERS)
+    strength = sum(text.count(marker) for marker in STRENGTH_MARKERS)
+    if cardio > strength:
+        return 'after_cardio'
+    if strength > cardio:
+        return 'after_strength'
+    return 'general'
+
 def format_group_workout_summary(users: List[Dict], workout_type: str = "group") -> str:
     """
     Форматирование сводки групповой тренировки
@@ -0,0 +1,264 @@
+"""
+Локальный генератор планов тренировок
+
+Детерминированный генератор по правилам из каталога упражнений,
+проиндексированного по уровню, инвентарю, цели и группе мышц.
+Работает за миллисекунды без обращения к ИИ: используется, когда
+OpenRouter недоступен или отвечает слишком долго. Планы строятся
+по схеме workout_plans.WorkoutPlan и рендерятся так же, как планы от ИИ.
+"""
+
+import math
+import random
+import zlib
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from config import FITNESS_LEVELS, GOALS, GOAL_NAMES
+from workout_plans import Block, Exercise, WorkoutPlan, LEVEL_INTENSITY
+
+ALL_GOALS = GOALS
+STRENGTH_GOALS = ('general_fitness', 'muscle_gain')
+CARDIO_GOALS = ('general_fitness', 'weight_loss', 'endurance')
+
+# Инвентарь включает все, что доступно с меньшим набором
+EQUIPMENT = {
+    'none': ('none',),
+    'dumbbells': ('none', 'dumbbells'),
+    'gym': ('none', 'dumbbells', 'gym'),
+}
+
+BEGINNER, INTERMEDIATE, ADVANCED = ('beginner',), ('intermediate',), ('advanced',)
+ANY_LEVEL = ('beginner', 'intermediate', 'advanced')
+
+
+class CatalogExercise(NamedTuple):
+    name: str
+    muscle: str
+    equipment: str
+    levels: Tuple[str, ...]
+    goals: Tuple[str, ...] = ALL_GOALS
+    timed: bool = False  # выполняется на время, а не на повторения
+
+
+CATALOG: List[CatalogExercise] = [
+    # Ноги
+    CatalogExercise("Приседания у опоры", 'legs', 'none', BEGINNER),
+    CatalogExercise("Приседания", 'legs', 'none', BEGINNER + INTERMEDIATE),
+    CatalogExercise("Выпады назад", 'legs', 'none', INTERMEDIATE + ADVANCED),
+    CatalogExercise("Ягодичный мостик", 'legs', 'none', ANY_LEVEL),
+    CatalogExercise("Приседания с выпрыгиванием", 'legs', 'none', ADVANCED, CARDIO_GOALS + ('muscle_gain',)),
+    CatalogExercise("Болгарские сплит-приседания", 'legs', 'none', ADVANCED),
+    CatalogExercise("Гоблет-приседания", 'legs', 'dumbbells', INTERMEDIATE + ADVANCED),
+    CatalogExercise("Румынская тяга с гантелями", 'legs', 'dumbbells', INTERMEDIATE + ADVANCED),
+    CatalogExercise("Жим ногами", 'legs', 'gym', BEGINNER + INTERMEDIATE, STRENGTH_GOALS),
+    CatalogExercise("Приседания со штангой", 'legs', 'gym', ADVANCED, STRENGTH_GOALS),
+    # Грудь
+    CatalogExercise("Отжимания от стены", 'chest', 'none', BEGINNER),
+    CatalogExercise("Отжимания с колен", 'chest', 'none', BEGINNER),
+    CatalogExercise("Отжимания", 'chest', 'none', INTERMEDIATE + ADVANCED),
+    CatalogExercise("Отжимания с хлопком", 'chest', 'none', ADVANCED),
+    CatalogExercise("Жим гантелей лежа", 'chest', 'dumbbells', ANY_LEVEL, STRENGTH_GOALS),
+    CatalogExercise("Жим штанги лежа", 'chest', 'gym', INTERMEDIATE + ADVANCED, STRENGTH_GOALS),
+    # Спина
+    CatalogExercise("Супермен", 'back', 'none', ANY_LEVEL),
+    CatalogExercise("Тяга полотенца к поясу у двери", 'back', 'none', BEGINNER + INTERMEDIATE),
+    CatalogExercise("Подтягивания", 'back', 'none', ADVANCED),
+    CatalogExercise("Тяга гантели в наклоне", 'back', 'dumbbells', ANY_LEVEL),
+    CatalogExercise("Тяга верхнего блока", 'back', 'gym', BEGINNER + INTERMEDIATE),
+    CatalogExercise("Становая тяга", 'back', 'gym', ADVANCED, STRENGTH_GOALS),
+    # Плечи
+    CatalogExercise("Круговые движения руками", 'shoulders', 'none', BEGINNER, timed=True),
+    CatalogExercise("Отжимания пайк", 'shoulders', 'none', INTERMEDIATE + ADVANCED),
+    CatalogExercise("Жим гантелей стоя", 'shoulders', 'dumbbells', ANY_LEVEL),
+    CatalogExercise("Махи гантелями в стороны", 'shoulders', 'dumbbells', INTERMEDIATE + ADVANCED),
+    # Кор
+    CatalogExercise("Планка на коленях", 'core', 'none', BEGINNER, timed=True),
+    CatalogExercise("Планка", 'core', 'none', INTERMEDIATE + ADVANCED, timed=True),
+    CatalogExercise("Мертвый жук", 'core', 'none', ANY_LEVEL),
+    CatalogExercise("Боковая планка", 'core', 'none', INTERMEDIATE + ADVANCED, timed=True),
+    CatalogExercise("Скручивания", 'core', 'none', BEGINNER + INTERMEDIATE),
+    CatalogExercise("Подъем ног в висе", 'core', 'none', ADVANCED),
+    # Кардио
+    CatalogExercise("Ходьба на месте с высоким подниманием колен", 'cardio', 'none', BEGINNER, CARDIO_GOALS, True),
+    CatalogExercise("Степ-апы на ступеньку", 'cardio', 'none', BEGINNER + INTERMEDIATE, CARDIO_GOALS, True),
+    CatalogExercise("Прыжки «звездочка»", 'cardio', 'none', INTERMEDIATE + ADVANCED, CARDIO_GOALS, True),
+    CatalogExercise("Скалолаз", 'cardio', 'none', INTERMEDIATE + ADVANCED, ALL_GOALS, True),
+    CatalogExercise("Берпи", 'cardio', 'none', ADVANCED, ALL_GOALS, True),
+    CatalogExercise("Трастеры с гантелями", 'cardio', 'dumbbells', INTERMEDIATE + ADVANCED, ALL_GOALS, True),
+    CatalogExercise("Гребной тренажер", 'cardio', 'gym', ANY_LEVEL, CARDIO_GOALS, True),
+]
+
+# (уровень, инвентарь, цель) -> группа мышц -> упражнения
+CatalogIndex = Dict[Tuple[str, str, str], Dict[str, List[CatalogExercise]]]
+
+
+def build_index(catalog: List[CatalogExercise]) -> CatalogIndex:
+    """Индекс каталога по уровню, инвентарю и цели с группировкой по мышцам"""
+    index: CatalogIndex = {}
+    for level in FITNESS_LEVELS:
+        for equipment, available in EQUIPMENT.items():
+            for goal in GOALS:
+                by_muscle: Dict[str, List[CatalogExercise]] = {}
+                for exercise in catalog:
+                    if level in exercise.levels and exercise.equipment in available and goal in exercise.goals:
+                        by_muscle.setdefault(exercise.muscle, []).append(exercise)
+                index[(level, equipment, goal)] = by_muscle
+    return index
+
+
+CATALOG_INDEX = build_index(CATALOG)
+
+# Группы мышц основной части в зависимости от прошлой тренировки (utils.workout_context)
+FOCUS = {
+    'general': ['legs', 'chest', 'back', 'core', 'cardio'],
+    'after_cardio': ['legs', 'chest', 'back', 'shoulders', 'core'],
+    'after_strength': ['cardio', 'legs', 'cardio', 'core', 'cardio'],
+}
+
+# Схема нагрузки по цели: подходы, повторения, работа на время, отдых, круги
+GOAL_SCHEMES = {
+    'general_fitness': {'title': "Общая физическая подготовка", 'sets': 3, 'reps': (10, 12), 'work_sec': 40, 'rest_sec': 60, 'rounds': 1},
+    'weight_loss': {'title': "Жиросжигающая круговая тренировка", 'sets': None, 'reps': (12, 15), 'work_sec': 40, 'rest_sec': 20, 'rounds': 3},
+    'muscle_gain': {'title': "Силовая тренировка", 'sets': 4, 'reps': (8, 10), 'work_sec': 45, 'rest_sec': 90, 'rounds': 1},
+    'endurance': {'title': "Тренировка на выносливость", 'sets': None, 'reps': (15, 20), 'work_sec': 60, 'rest_sec': 30, 'rounds': 3},
+}
+
+GOAL_TIPS = {
+    'general_fitness': ["Держи технику важнее скорости", "Пей воду между подходами"],
+    'weight_loss': ["Переходи между упражнениями без пауз, отдыхай после круга", "Следи за дыханием"],
+    'muscle_gain': ["Последние 2 повторения должны даваться тяжело", "Опускай вес медленно, на 2-3 счета"],
+    'endurance': ["Держи ровный темп весь круг", "Дыши ритмично, не задерживай дыхание"],
+}
+
+WARMUP = [
+    Exercise(name="Суставная разминка", duration_sec=180),
+    Exercise(name="Ходьба на месте с махами руками", duration_sec=120),
+]
+
+COOLDOWN = [
+    Exercise(name="Растяжка ног", duration_sec=120),
+    Exercise(name="Растяжка спины и плеч", duration_sec=120),
+]
+
+SECONDS_PER_REP = 3
+
+
+def _daily_seed(*parts) -> int:
+    """Стабильное зерно: один и тот же план для тех же входных данных в течение дня"""
+    return zlib.crc32(":".join(str(p) for p in parts + (date.today().isoformat(),)).encode())
+
+
+def _prescribe(exercise: CatalogExercise, scheme: Dict, level: str) -> Exercise:
+    """Подходы, повторения и отдых для упражнения каталога"""
+    factor = LEVEL_INTENSITY.get(level, 1.0)
+    sets = scheme['sets']
+    if sets and level == 'beginner':
+        sets -= 1
+    if exercise.timed:
+        return Exercise(name=exercise.name, sets=sets, duration_sec=round(scheme['work_sec'] * factor),
+                        rest_sec=scheme['rest_sec'])
+    low, high = (max(1, round(r * factor)) for r in scheme['reps'])
+    return Exercise(name=exercise.name, sets=sets, reps=f"{low}-{high}", rest_sec=scheme['rest_sec'])
+
+
+def _estimate_minutes(exercises: List[Exercise], rounds: int) -> int:
+    seconds = sum(e.duration_sec or 0 for e in WARMUP + COOLDOWN)
+    for exercise in exercises:
+        reps = int(exercise.reps.split('-')[-1]) if exercise.reps else 0
+        work = exercise.duration_sec or reps * SECONDS_PER_REP
+        seconds += (work + (exercise.rest_sec or 0)) * (exercise.sets or 1) * rounds
+    return max(5, math.ceil(seconds / 60 / 5) * 5)
+
+
+def _pick(rng: random.Random, level: str, equipment: str, goal: str, muscles: List[str]) -> List[CatalogExercise]:
+    """Упражнения по группам мышц без повторов (группы без упражнений пропускаются)"""
+    by_muscle = CATALOG_INDEX.get((level, equipment, goal)) or CATALOG_INDEX[(level, 'none', 'general_fitness')]
+    picked: List[CatalogExercise] = []
+    for muscle in muscles:
+        options = [e for e in by_muscle.get(muscle, []) if e not in picked]
+        if options:
+            picked.append(rng.choice(options))
+    return picked
+
+
+def generate_local_plan(user_info: Dict, context: str = 'general', equipment: str = 'none',
+                        seed: Optional[int] = None) -> WorkoutPlan:
+    """
+    План индивидуальной тренировки по каталогу упражнений
+
+    Args:
+        user_info: Информация о пользователе (уровень и цели)
+        context: Контекст по прошлой тренировке (utils.workout_context)
+        equipment: Доступный инвентарь ('none', 'dumbbells', 'gym')
+        seed: Зерно выбора упражнений (по умолчанию - пользователь и текущий день)
+
+    Returns:
+        План тренировки
+    """
+    level = user_info.get('fitness_level') or 'beginner'
+    goal = user_info.get('goals') if user_info.get('goals') in GOAL_SCHEMES else 'general_fitness'
+    if seed is None:
+        seed = _daily_seed(user_info.get('user_id'), level, goal, context, equipment)
+    rng = random.Random(seed)
+
+    scheme = GOAL_SCHEMES[goal]
+    exercises = [_prescribe(e, scheme, level) for e in _pick(rng, level, equipment, goal, FOCUS.get(context, FOCUS['general']))]
+
+    return WorkoutPlan(
+        title=scheme['title'],
+        level=level,
+        goal=GOAL_NAMES[goal],
+        duration_min=_estimate_minutes(exercises, scheme['rounds']),
+        warmup=list(WARMUP),
+        blocks=[Block(title="Основная часть", rounds=scheme['rounds'], exercises=exercises)],
+        cooldown=list(COOLDOWN),
+        tips=list(GOAL_TIPS[goal]),
+    )
+
+
+def _variant_text(exercise: Exercise) -> str:
+    if exercise.duration_sec:
+        return f"{exercise.name}, {exercise.duration_sec} с"
+    return f"{exercise.name}, {exercise.reps}"
+
+
+def generate_local_group_plan(users: List[Dict], context: str = 'general', equipment: str = 'none',
+                              seed: Optional[int] = None) -> WorkoutPlan:
+    """
+    План групповой тренировки по каталогу упражнений
+
+    Основа плана рассчитана на самый низкий уровень в группе, для остальных
+    уровней у каждого упражнения есть вариант из той же группы мышц.
+    """
+    levels = sorted({u.get('fitness_level') or 'beginner' for u in users},
+                    key=lambda level: LEVEL_INTENSITY.get(level, 1.0))
+    base_level = levels[0]
+    if seed is None:
+        seed = _daily_seed(*sorted(u.get('user_id') or 0 for u in users), context, equipment)
+    rng = random.Random(seed)
+
+    scheme = GOAL_SCHEMES['general_fitness']
+    muscles = FOCUS.get(context, FOCUS['general'])
+    base = _pick(rng, base_level, equipment, 'general_fitness', muscles)
+
+    exercises = []
+    for catalog_exercise in base:
+        exercise = _prescribe(catalog_exercise, scheme, base_level)
+        variants = {}
+        for level in levels[1:]:
+            options = CATALOG_INDEX[(level, equipment, 'general_fitness')].get(catalog_exercise.muscle, [])
+            if options:
+                variants[level] = _variant_text(_prescribe(rng.choice(options), scheme, level))
+        exercises.append(exercise.model_copy(update={'variants': variants}))
+
+    return WorkoutPlan(
+        title="Групповая тренировка",
+        level=base_level,
+        goal=GOAL_NAMES['general_fitness'],
+        duration_min=_estimate_minutes(exercises, scheme['rounds']),
+        warmup=list(WARMUP),
+        blocks=[Block(title="Основная часть", rounds=scheme['rounds'], exercises=exercises)],
+        cooldown=list(COOLDOWN),
+        tips=["Разбейтесь на пары и считайте повторения друг за друга", "Отдыхайте все вместе после каждого упражнения"],
+    )
@@ -0,0 +1,172 @@
+"""
+Структурированные планы тренировок
+
+Модель отвечает компактным JSON-планом вместо прозы; план проверяется
+pydantic-схемой и рендерится в Telegram HTML локально. Структура плана
+сохраняется в workout_data, поэтому ее можно использовать в статистике
+и пересчитывать под другой уровень подготовки без обращения к ИИ.
+"""
+
+import html
+import json
+import logging
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field, ValidationError
+
+from config import LEVEL_NAMES, LEVEL_INTENSITY
+
+logger = logging.getLogger(__name__)
+
+
+class Exercise(BaseModel):
+    name: str
+    sets: Optional[int] = Field(default=None, ge=1, le=20)
+    reps: Optional[str] = None  # "12", "10-12", "макс."
+    duration_sec: Optional[int] = Field(default=None, ge=1, le=7200)
+    rest_sec: Optional[int] = Field(default=None, ge=0, le=600)
+    notes: Optional[str] = None
+    # Варианты упражнения по уровням (для групповых тренировок)
+    variants: Dict[str, str] = Field(default_factory=dict)
+
+
+class Block(BaseModel):
+    title: str
+    rounds: int = Field(default=1, ge=1, le=20)
+    exercises: List[Exercise] = Field(min_length=1)
+
+
+class WorkoutPlan(BaseModel):
+    title: str
+    level: str = 'beginner'
+    goal: Optional[str] = None
+    duration_min: int = Field(ge=5, le=240)
+    warmup: List[Exercise] = Field(default_factory=list)
+    blocks: List[Block] = Field(min_length=1)
+    cooldown: List[Exercise] = Field(default_factory=list)
+    tips: List[str] = Field(default_factory=list)
+
+
+# Схема ответа для промпта (короче, чем полная JSON Schema)
+PLAN_FORMAT_HINT = (
+    '{"title":str,"level":str,"goal":str,"duration_min":int,'
+    '"warmup":[Ex],"blocks":[{"title":str,"rounds":int,"exercises":[Ex]}],'
+    '"cooldown":[Ex],"tips":[str]}, где Ex = {"name":str,"sets":int,"reps":str,'
+    '"duration_sec":int,"rest_sec":int,"notes":str}'
+)
+
+GROUP_FORMAT_HINT = PLAN_FORMAT_HINT + ', и у Ex есть "variants":{"beginner":str,"intermediate":str,"advanced":str}'
+
+
+def parse_plan(response: str) -> Optional[WorkoutPlan]:
+    """
+    Разбор и проверка JSON-плана из ответа модели
+
+    Returns:
+        План или None, если ответ не прошел проверку
+    """
+    if not response:
+        return None
+    start, end = response.find('{'), response.rfind('}')
+    if start == -1 or end <= start:
+        logger.warning("В ответе модели нет JSON-плана")
+        return None
+    try:
+        return WorkoutPlan.model_validate_json(response[start:end + 1])
+    except ValidationError as e:
+        logger.warning(f"JSON-план не прошел проверку: {e.error_count()} ошибок")
+        return None
+
+
+def _format_exercise(exercise: Exercise) -> str:
+    details = []
+    if exercise.sets and exercise.reps:
+        details.append(f"{exercise.sets}×{html.escape(exercise.reps)}")
+    elif exercise.sets:
+        details.append(f"{exercise.sets} подх.")
+    elif exercise.reps:
+        details.append(html.escape(exercise.reps))
+    if exercise.duration_sec:
+        minutes, seconds = divmod(exercise.duration_sec, 60)
+        details.append(f"{minutes} мин" + (f" {seconds} с" if seconds else "") if minutes else f"{seconds} с")
+    if exercise.rest_sec:
+        details.append(f"отдых {exercise.rest_sec} с")
+
+    line = f"• {html.escape(exercise.name)}"
+    if details:
+        line += " — " + ", ".join(details)
+    if exercise.notes:
+        line += f"\n  <i>{html.escape(exercise.notes)}</i>"
+    for level, variant in exercise.variants.items():
+        line += f"\n  ↳ {LEVEL_NAMES.get(level, html.escape(level))}: {html.escape(variant)}"
+    return line
+
+
+def render_plan_html(plan: WorkoutPlan) -> str:
+    """Рендер плана в Telegram HTML"""
+    lines = [f"🏋️ <b>{html.escape(plan.title)}</b>"]
+    lines.append(f"⏱ {plan.duration_min} мин • {LEVEL_NAMES.get(plan.level, html.escape(plan.level))}")
+    if plan.goal:
+        lines.append(f"🎯 {html.escape(plan.goal)}")
+
+    if plan.warmup:
+        lines.append("\n🔥 <b>Разминка</b>")
+        lines.extend(_format_exercise(e) for e in plan.warmup)
+
+    for block in plan.blocks:
+        title = f"\n💪 <b>{html.escape(block.title)}</b>"
+        if block.rounds > 1:
+            title += f" (×{block.rounds})"
+        lines.append(title)
+        lines.extend(_format_exercise(e) for e in block.exercises)
+
+    if plan.cooldown:
+        lines.append("\n🧘 <b>Заминка</b>")
+        lines.extend(_format_exercise(e) for e in plan.cooldown)
+
+    if plan.tips:
+        lines.append("\n💡 <b>Советы</b>")
+        lines.extend(f"• {html.escape(tip)}" for tip in plan.tips)
+
+    return "\n".join(lines)
+
+
+def _scale_reps(reps: Optional[str], factor: float) -> Optional[str]:
+    if reps is None:
+        return None
+    parts = reps.split('-')
+    if all(part.strip().isdigit() for part in parts):
+        return '-'.join(str(max(1, round(int(part) * factor))) for part in parts)
+    return reps
+
+
+def adapt_plan_level(plan: WorkoutPlan, level: str) -> WorkoutPlan:
+    """
+    Пересчет плана под другой уровень подготовки без обращения к ИИ
+
+    Повторения и длительности упражнений основной части масштабируются
+    по LEVEL_INTENSITY, отдых - в обратную сторону. Разминка, заминка
+    и число подходов не меняются.
+    """
+    factor = LEVEL_INTENSITY.get(level, 1.0) / LEVEL_INTENSITY.get(plan.level, 1.0)
+    if factor == 1.0:
+        return plan.model_copy(update={'level': level})
+
+    def scale(exercise: Exercise) -> Exercise:
+        return exercise.model_copy(update={
+            'reps': _scale_reps(exercise.reps, factor),
+            'duration_sec': max(1, round(exercise.duration_sec * factor)) if exercise.duration_sec else None,
+            'rest_sec': round(exercise.rest_sec / factor) if exercise.rest_sec else exercise.rest_sec,
+        })
+
+    return plan.model_copy(update={
+        'level': level,
+        'blocks': [block.model_copy(update={'exercises': [scale(e) for e in block.exercises]}) for block in plan.blocks],
+    })
+
+
+def plan_to_data(plan: WorkoutPlan) -> Dict:
+    """Компактное представление плана для workout_data"""
+    data = json.loads(plan.model_dump_json(exclude_none=True, exclude_defaults=True))
+    data['level'] = plan.level
+    return data